@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Async (ASGI) web server exposing the same routes as web_server.py
+
+Needs the optional packages starlette and uvicorn:
+    pip install starlette uvicorn
+"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from io import BytesIO, StringIO
+from time import perf_counter
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.responses import (
+    FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse,
+)
+from starlette.routing import Route
+
+import persona_metrics
+from fake_data_generator import UnknownLocaleError, get_generator, string_to_seed
+from persona_binary import CONTENT_TYPE, CONTENT_TYPES, encode_persona, read_msgpack, wants_msgpack
+from persona_export import EXPORTERS, is_binary_format, write_csv
+from web_server import (
+    BATCH_FORMATS, FORM_FIELDS, MAX_BATCH_COUNT, batch_format, bulk_ids, bulk_personas,
+    find_free_port, form_fill_data, generator, generators, page_query, persona_pool, request_seed,
+    wants_page,
+)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+# Personas generated per executor task when streaming a batch
+BATCH_SHARD_SIZE = 500
+
+# Worker processes for CPU-bound generation (0 runs it on threads instead)
+WORKERS = int(os.environ.get('FAKE_DATA_WORKERS', os.cpu_count() or 1))
+
+_executor = None
+# Executor tasks not finished yet, cancelled when the server stops
+_pending = set()
+
+
+def _generate(locale, data_dir, seed, fields):
+    """Executor task: one persona, seeded from a string like /api/generate"""
+    worker = get_generator(locale, data_dir)
+    if seed:
+        return worker.create_seeded_persona(seed, fields=fields)
+    return worker.generate_persona(fields=fields)
+
+
+def _export_shard(locale, data_dir, seed, start, size, fields, export_format):
+    """Executor task: a slice of a batch, already serialised to text or bytes"""
+    worker = get_generator(locale, data_dir)
+    personas = worker.generate_personas(size, seed=seed, start=start, fields=fields)
+    buffer = BytesIO() if is_binary_format(export_format) else StringIO()
+    if export_format == 'csv':
+        write_csv(personas, buffer, header=start == 0)
+    else:
+        EXPORTERS[export_format][0](personas, buffer)
+    return buffer.getvalue()
+
+
+async def run_cpu(func, *args):
+    """Run CPU-bound generation off the event loop"""
+    if _executor is None:
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+    future = _executor.submit(func, *args)
+    _pending.add(future)
+    future.add_done_callback(_pending.discard)
+    return await asyncio.wrap_future(future)
+
+
+def persona_response(request, persona):
+    """Respond with a persona as JSON, or as MessagePack if the Accept header prefers it"""
+    if wants_msgpack(request.headers.get('accept')):
+        return Response(encode_persona(persona), media_type=CONTENT_TYPE)
+    return JSONResponse(persona)
+
+
+def error(message, status_code):
+    return JSONResponse({'error': message}, status_code=status_code)
+
+
+async def read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def request_locale(request, data=None):
+    """Return the request's `locale` query or body parameter, or the default"""
+    return request.query_params.get('locale') or (data or {}).get('locale') or generator.locale
+
+
+async def request_generator(request, data=None):
+    """Return the generator for the request's locale, built off the event loop"""
+    locale = request_locale(request, data)
+    if locale == generator.locale:
+        return generator
+    return await run_in_threadpool(generators.get, locale)
+
+
+async def unknown_locale(request, exc):
+    return error(str(exc), 400)
+
+
+async def index(request):
+    """Main web interface"""
+    return FileResponse(os.path.join(TEMPLATES_DIR, 'index.html'))
+
+
+async def extension_popup(request):
+    """Browser extension popup interface"""
+    return FileResponse(os.path.join(TEMPLATES_DIR, 'extension.html'))
+
+
+async def api_generate(request):
+    """API endpoint to generate new persona"""
+    data = await read_json(request)
+    try:
+        persona = await run_cpu(_generate, request_locale(request, data), generator.data_dir,
+                                request_seed(data), data.get('fields'))
+    except ValueError as e:
+        return error(str(e), 400)
+
+    if data.get('save', False):
+        persona['saved_id'] = await run_in_threadpool(generator.save_persona, persona)
+
+    return persona_response(request, persona)
+
+
+async def api_generate_batch(request):
+    """API endpoint to stream many personas as NDJSON, CSV or MessagePack"""
+    data = await read_json(request)
+    count = data.get('count', 1)
+    fields = data.get('fields')
+    locale = request_locale(request, data)
+
+    output_format = data.get('format')
+    if output_format is None:
+        output_format = batch_format(request.headers.get('accept'))
+    if output_format not in BATCH_FORMATS:
+        return error(f"format must be one of {', '.join(BATCH_FORMATS)}", 400)
+    if not isinstance(count, int) or not 1 <= count <= MAX_BATCH_COUNT:
+        return error(f'count must be between 1 and {MAX_BATCH_COUNT}', 400)
+
+    try:
+        seed = request_seed(data)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    export_format, mimetype = BATCH_FORMATS[output_format]
+    master_seed = string_to_seed(seed) if seed else None
+
+    def shard(start, size):
+        return run_cpu(_export_shard, locale, generator.data_dir, master_seed,
+                       start, size, fields, export_format)
+
+    try:
+        # A one-persona first shard validates the request and gets bytes out fast
+        first = await shard(0, 1)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    async def chunks():
+        yield first
+        starts = range(1, count, BATCH_SHARD_SIZE)
+        pending = None
+        for start in starts:
+            # Keep the next shard generating while the current one is sent
+            task = asyncio.ensure_future(shard(start, min(BATCH_SHARD_SIZE, count - start)))
+            if pending is not None:
+                yield await pending
+            pending = task
+        if pending is not None:
+            yield await pending
+
+    return StreamingResponse(chunks(), media_type=mimetype)
+
+
+async def api_list_personas(request):
+    """API endpoint to list all personas, or search them one page at a time"""
+    params = request.query_params
+    locale_generator = await request_generator(request)
+    if not wants_page(params):
+        try:
+            offset = int(params.get('offset', 0))
+            limit = int(params['limit']) if 'limit' in params else None
+        except ValueError:
+            return error('offset and limit must be integers', 400)
+        personas = await run_in_threadpool(locale_generator.list_personas, offset=offset,
+                                           limit=limit)
+        return JSONResponse(personas)
+    try:
+        result = await run_in_threadpool(locale_generator.search_personas, **page_query(params))
+    except ValueError as e:
+        return error(str(e), 400)
+    return JSONResponse(result)
+
+
+async def api_save_personas(request):
+    """API endpoint to save many personas in one write, sent as JSON or MessagePack"""
+    try:
+        content_type = request.headers.get('content-type', '').partition(';')[0].strip()
+        if content_type in CONTENT_TYPES:
+            data = list(read_msgpack(BytesIO(await request.body())))
+        else:
+            data = await request.json()
+        personas = bulk_personas(data)
+    except ValueError as e:
+        return error(str(e), 400)
+    locale_generator = await request_generator(request, data if isinstance(data, dict) else None)
+    ids = await run_in_threadpool(locale_generator.save_personas, personas)
+    return JSONResponse({'saved': len(ids), 'ids': ids})
+
+
+async def api_delete_personas(request):
+    """API endpoint to delete many personas in one write"""
+    data = await read_json(request)
+    try:
+        ids = bulk_ids(data)
+    except ValueError as e:
+        return error(str(e), 400)
+    locale_generator = await request_generator(request, data)
+    deleted = await run_in_threadpool(locale_generator.delete_personas, ids)
+    return JSONResponse({'deleted': deleted})
+
+
+async def api_get_persona(request):
+    """API endpoint to get specific persona"""
+    locale_generator = await request_generator(request)
+    persona = await run_in_threadpool(locale_generator.load_persona, request.path_params['persona_id'])
+    if persona:
+        return persona_response(request, persona)
+    return error('Persona not found', 404)
+
+
+async def api_delete_persona(request):
+    """API endpoint to delete persona"""
+    locale_generator = await request_generator(request)
+    success = await run_in_threadpool(locale_generator.delete_persona, request.path_params['persona_id'])
+    if success:
+        return JSONResponse({'success': True})
+    return error('Persona not found', 404)
+
+
+async def api_regenerate_persona(request):
+    """API endpoint to regenerate persona, or only the given fields"""
+    data = await read_json(request)
+    locale_generator = await request_generator(request, data)
+    try:
+        persona = await run_in_threadpool(
+            locale_generator.regenerate_persona, request.path_params['persona_id'],
+            fields=data.get('fields'))
+    except ValueError as e:
+        return error(str(e), 400)
+    if persona:
+        return persona_response(request, persona)
+    return error('Persona not found', 404)
+
+
+async def api_pool_stats(request):
+    """API endpoint for the fill-form warm pool settings and hit/miss counts"""
+    if persona_pool is None:
+        return JSONResponse({'enabled': False})
+    return JSONResponse({'enabled': True, **persona_pool.stats()})
+
+
+async def api_locales(request):
+    """API endpoint listing the locales with a generator currently loaded"""
+    return JSONResponse({'default': generator.locale, 'loaded': generators.locales(),
+                         'max_locales': generators.max_locales})
+
+
+async def api_fill_form(request):
+    """API endpoint for browser extension to get form fill data"""
+    data = await read_json(request)
+    persona_id = data.get('persona_id')
+    locale = request_locale(request, data)
+
+    if persona_id:
+        locale_generator = await request_generator(request, data)
+        persona = await run_in_threadpool(locale_generator.load_persona, persona_id, True)
+    else:
+        pooled = persona_pool is not None and locale == persona_pool.generator.locale
+        persona = persona_pool.pop() if pooled else None
+        if persona is None:
+            try:
+                persona = await run_cpu(_generate, locale, generator.data_dir, None, FORM_FIELDS)
+            except ValueError as e:
+                return error(str(e), 400)
+
+    if not persona:
+        return error('Persona not found', 404)
+
+    return JSONResponse(form_fill_data(persona))
+
+
+async def metrics(request):
+    """Prometheus metrics; empty unless FAKE_DATA_METRICS=1"""
+    return PlainTextResponse(persona_metrics.render_prometheus(),
+                             headers={'Content-Type': persona_metrics.CONTENT_TYPE})
+
+
+class RequestTimer:
+    """ASGI middleware recording `http_request_seconds` by route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not persona_metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get('route')
+            persona_metrics.observe('http_request_seconds', perf_counter() - start,
+                                    route=route.path if route else 'unmatched',
+                                    method=scope['method'], status=status[0])
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Start the generation process pool with the server and stop it after"""
+    global _executor
+    # Spawned, not forked: forking copies uvicorn's and the thread pool's threads
+    # and locks mid-flight into every worker
+    _executor = (ProcessPoolExecutor(max_workers=WORKERS,
+                                     mp_context=multiprocessing.get_context('spawn'))
+                 if WORKERS > 0 else None)
+    try:
+        yield
+    finally:
+        if _executor is not None:
+            # Drop queued tasks by hand: shutdown(cancel_futures=True) needs 3.9
+            for future in list(_pending):
+                future.cancel()
+            _executor.shutdown()
+            _executor = None
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/api/generate', api_generate, methods=['POST']),
+        Route('/api/generate/batch', api_generate_batch, methods=['POST']),
+        Route('/api/personas', api_list_personas, methods=['GET']),
+        Route('/api/personas', api_delete_personas, methods=['DELETE']),
+        Route('/api/personas/bulk', api_save_personas, methods=['POST']),
+        Route('/api/personas/{persona_id}', api_get_persona, methods=['GET']),
+        Route('/api/personas/{persona_id}', api_delete_persona, methods=['DELETE']),
+        Route('/api/personas/{persona_id}/regenerate', api_regenerate_persona, methods=['POST']),
+        Route('/api/fill-form', api_fill_form, methods=['POST']),
+        Route('/api/pool', api_pool_stats, methods=['GET']),
+        Route('/api/locales', api_locales, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/extension', extension_popup),
+    ],
+    exception_handlers={UnknownLocaleError: unknown_locale},
+    middleware=[Middleware(RequestTimer)],
+    lifespan=lifespan,
+)
+
+
+def serve(host='localhost', port=None):
+    """Run the ASGI app with uvicorn on a free port"""
+    import uvicorn
+
+    port = port or find_free_port()
+    if not port:
+        print("❌ Could not find a free port between 5000-5100")
+        return
+    print(f"🌐 Starting async web server on http://{host}:{port}")
+    print("Press Ctrl+C to stop")
+    uvicorn.run(app, host=host, port=port, log_level='warning')
+
+
+if __name__ == '__main__':
+    serve()
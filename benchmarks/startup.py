@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark for the CLI and the core module
+
+Runs each scenario in a fresh interpreter and reports the median and fastest
+wall time. It also checks that optional heavy modules stay unimported until a
+feature needs them, and can fail when a budget is exceeded:
+
+    python benchmarks/startup.py --runs 20 --max-ms 400
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules only the exporters and display code should pull in
+HEAVY_MODULES = ['qrcode', 'PIL', 'yaml', 'tabulate', 'numpy', 'pyarrow', 'msgpack',
+                 'concurrent.futures.process']
+
+SCENARIOS = {
+    'import fake_data_generator': ['-c', 'import fake_data_generator'],
+    'import cli': ['-c', 'import cli'],
+    'cli.py --help': [os.path.join(ROOT, 'cli.py'), '--help'],
+    'cli.py generate --format json': [os.path.join(ROOT, 'cli.py'), 'generate', '--format', 'json'],
+}
+
+# Prints the heavy modules loaded after a JSON generate run
+LOADED_CHECK = f"""
+import json, sys
+import cli
+try:
+    cli.cli(['generate', '--format', 'json'], standalone_mode=False)
+finally:
+    print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]), file=sys.stderr)
+"""
+
+
+def run(args, cwd, env):
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=cwd, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return (time.perf_counter() - start) * 1000
+
+
+def heavy_modules_loaded(cwd, env):
+    result = subprocess.run([sys.executable, '-c', LOADED_CHECK], cwd=cwd, env=env, check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return json.loads(result.stderr.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='Fresh interpreters per scenario')
+    parser.add_argument('--max-ms', type=float,
+                        help='Fail if the median JSON generate run is slower than this')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    results = {}
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, command in SCENARIOS.items():
+            run(command, cwd, env)  # warm the bytecode and OS file caches
+            times = [run(command, cwd, env) for _ in range(args.runs)]
+            results[name] = {'median_ms': round(statistics.median(times), 1),
+                             'min_ms': round(min(times), 1)}
+        loaded = heavy_modules_loaded(cwd, env)
+
+    if args.json:
+        print(json.dumps({'scenarios': results, 'heavy_modules_loaded': loaded}, indent=2))
+    else:
+        width = max(len(name) for name in results)
+        for name, timing in results.items():
+            print(f"{name:<{width}}  median {timing['median_ms']:7.1f} ms  "
+                  f"min {timing['min_ms']:7.1f} ms")
+        print(f"heavy modules loaded by generate --format json: {', '.join(loaded) or 'none'}")
+
+    failed = bool(loaded)
+    median = results['cli.py generate --format json']['median_ms']
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"generate --format json took {median} ms, budget is {args.max_ms} ms", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for generation, storage, export and the HTTP API
+
+Writes machine readable JSON so runs can be compared between commits:
+
+    python benchmarks/suite.py -o before.json
+    python benchmarks/suite.py -o after.json --compare before.json
+    python benchmarks/suite.py --sections storage --sizes 1000,1000000 --backends sqlite
+    python benchmarks/suite.py --sections concurrency --writers 8
+
+Every measurement runs in a scratch data directory, and personas come from
+fixed seeds, so repeated runs on one machine measure the same work.
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_data_generator import FakeDataGenerator  # noqa: E402
+from persona_export import EXPORTERS  # noqa: E402
+from persona_index import encode_cursor  # noqa: E402
+from persona_pack import write_pack  # noqa: E402
+from persona_records import PersonaRecord  # noqa: E402
+from persona_storage import SQLitePersonaStore, STORAGE_BACKENDS  # noqa: E402
+
+SECTIONS = ['generation', 'memory', 'storage', 'concurrency', 'export', 'http']
+# Backends needing an optional package, left out of the default run without it
+BACKEND_REQUIREMENTS = {'msgpack': 'msgpack', 'mmap': 'msgpack'}
+# 1M is opt-in (--sizes 1000,1000000): the JSON backend parses the whole
+# gigabyte-sized document on every uncached call, which would make a default
+# run very slow and memory hungry
+DEFAULT_SIZES = [1000, 10000, 100000]
+TEMPLATE_COUNT = 1000
+
+
+def summarize(times, items=1):
+    """Per-call statistics for a list of durations in seconds"""
+    total = sum(times)
+    ordered = sorted(times)
+    return {
+        'reps': len(times),
+        'median_ms': round(statistics.median(times) * 1000, 4),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        'ops_per_sec': round(len(times) * items / total, 1) if total else None,
+    }
+
+
+def measure(fn, budget, items=1, min_reps=3, max_reps=100000):
+    """Call `fn` until `budget` seconds have passed (at least `min_reps` times).
+
+    `items` is how many operations one call performs, for throughput.
+    """
+    fn()  # warm caches and lazy imports
+    times = []
+    deadline = time.perf_counter() + budget
+    while len(times) < max_reps and (len(times) < min_reps or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return summarize(times, items)
+
+
+def template_personas(count=TEMPLATE_COUNT):
+    """Seeded personas used as the content of every synthetic store"""
+    generator = FakeDataGenerator(data_dir=tempfile.mkdtemp(), cache_size=0)
+    return list(generator.generate_personas(count, seed=1))
+
+
+def synthetic_personas(templates, size):
+    """Yield `size` personas with unique, reproducible IDs"""
+    rng = random.Random(size)
+    for i in range(size):
+        persona = dict(templates[i % len(templates)])
+        persona['id'] = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        yield persona
+
+
+def populate(backend, data_dir, personas):
+    """Write personas straight into a backend's file, skipping per-save costs.
+
+    Returns the IDs written.
+    """
+    ids = []
+    if backend == 'json':
+        with open(os.path.join(data_dir, 'personas.json'), 'w') as f:
+            f.write('{')
+            for i, persona in enumerate(personas):
+                f.write((',\n' if i else '\n') + json.dumps(persona['id']) + ': ' + json.dumps(persona))
+                ids.append(persona['id'])
+            f.write('\n}')
+    elif backend in ('jsonl', 'msgpack'):
+        journal = STORAGE_BACKENDS[backend]
+        with open(os.path.join(data_dir, journal.filename), 'wb') as f:
+            for persona in personas:
+                f.write(journal._encode(persona))
+                ids.append(persona['id'])
+    elif backend == 'mmap':
+        def tracked():
+            for persona in personas:
+                ids.append(persona['id'])
+                yield persona
+        write_pack(os.path.join(data_dir, STORAGE_BACKENDS[backend].filename), tracked())
+    elif backend == 'sqlite':
+        store = SQLitePersonaStore(data_dir)
+        with store._connect() as db:
+            def rows():
+                for persona in personas:
+                    ids.append(persona['id'])
+                    yield store._row(persona)
+            db.executemany(store._UPSERT, rows())
+    else:
+        raise ValueError(f"No populate step for backend {backend!r}")
+    return ids
+
+
+def bench_generation(args, results):
+    generator = FakeDataGenerator(data_dir=tempfile.mkdtemp(), cache_size=0)
+    seeds = iter(range(10 ** 9))
+    results['generation.generate_persona'] = measure(generator.generate_persona, args.budget)
+    results['generation.generate_persona_fields'] = measure(
+        lambda: generator.generate_persona(fields=['name', 'email']), args.budget)
+    results['generation.seeded'] = measure(
+        lambda: generator.create_seeded_persona(f"seed-{next(seeds)}"), args.budget)
+    results['generation.generate_personas_1000'] = measure(
+        lambda: sum(1 for _ in generator.generate_personas(1000, seed=7)), args.budget, items=1000)
+    # Same work per record as generate_persona, so the two rates compare directly
+    results['generation.generate_personas_1000_unseeded'] = measure(
+        lambda: sum(1 for _ in generator.generate_personas(1000)), args.budget, items=1000)
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return
+    results['generation.generate_columns_100000'] = measure(
+        lambda: generator.generate_columns(100000, seed=7), args.budget, items=100000)
+
+
+def deep_size(objects):
+    """Bytes held by objects and everything they reference, counting shared objects once"""
+    seen = set()
+    total = 0
+    stack = list(objects)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(obj, PersonaRecord):
+            stack.extend(getattr(obj, slot) for slot in PersonaRecord.__slots__)
+    return total
+
+
+def bench_memory(args, results):
+    """Bytes per persona held as dicts and as PersonaRecords, and conversion cost"""
+    generator = FakeDataGenerator(data_dir=tempfile.mkdtemp(), cache_size=0)
+    personas = list(generator.generate_personas(args.export_count, seed=3))
+    # Dicts parsed from storage share no strings, unlike freshly generated ones
+    loaded = [json.loads(json.dumps(persona)) for persona in personas]
+    records = [PersonaRecord.from_dict(persona) for persona in personas]
+    for name, items in (('generated_dicts', personas), ('loaded_dicts', loaded),
+                        ('records', records)):
+        results[f'memory.{name}'] = {
+            'reps': len(items),
+            'bytes_per_persona': round(deep_size(items) / len(items), 1),
+        }
+    results['memory.from_dict'] = measure(
+        lambda: [PersonaRecord.from_dict(persona) for persona in loaded], args.budget,
+        items=len(loaded), min_reps=1)
+    results['memory.to_dict'] = measure(
+        lambda: [record.to_dict() for record in records], args.budget,
+        items=len(records), min_reps=1)
+
+
+def bench_storage(args, results):
+    templates = template_personas()
+    extra = iter(synthetic_personas(templates, 10 ** 7))
+    for backend in args.backends:
+        for size in args.sizes:
+            prefix = f"storage.{backend}.{size}"
+            with tempfile.TemporaryDirectory() as data_dir:
+                ids = populate(backend, data_dir, synthetic_personas(templates, size))
+                generator = FakeDataGenerator(data_dir=data_dir, storage=backend, cache_size=0)
+                cached = FakeDataGenerator(data_dir=data_dir, storage=backend)
+                rng = random.Random(0)
+                hot_id = ids[0]
+
+                results[prefix + '.load'] = measure(
+                    lambda: generator.load_persona(rng.choice(ids)), args.budget)
+                results[prefix + '.load_cached'] = measure(
+                    lambda: cached.load_persona(hot_id), args.budget)
+                results[prefix + '.list_page'] = measure(
+                    lambda: generator.list_personas(offset=size // 2, limit=50), args.budget)
+                # The same page reached through a cursor instead of an offset
+                middle = generator.list_personas(offset=size // 2, limit=1)[0]
+                cursor = encode_cursor((middle['created_at'], middle['id']))
+                results[prefix + '.list_cursor_page'] = measure(
+                    lambda: generator.list_personas(limit=50, cursor=cursor), args.budget)
+                results[prefix + '.count'] = measure(generator.count_personas, args.budget)
+                # The first call builds the file backends' in-memory index
+                results[prefix + '.search_email'] = measure(
+                    lambda: generator.search_personas(email=rng.choice(templates)['email'], limit=50),
+                    args.budget)
+                results[prefix + '.search_name_prefix'] = measure(
+                    lambda: generator.search_personas(name=rng.choice(templates)['name'][:2], limit=50),
+                    args.budget)
+                results[prefix + '.search_city_recent'] = measure(
+                    lambda: generator.search_personas(city=rng.choice(templates)['address']['city'],
+                                                      created_after='2000-01-01', limit=50),
+                    args.budget)
+                if size <= 100000:
+                    results[prefix + '.list_all'] = measure(
+                        generator.list_personas, args.budget, min_reps=1)
+                results[prefix + '.save'] = measure(
+                    lambda: generator.save_persona(next(extra)), args.budget, min_reps=1)
+                saved_batches = []
+                results[prefix + '.save_many_1000'] = measure(
+                    lambda: saved_batches.append(
+                        generator.save_personas(itertools.islice(extra, 1000))),
+                    args.budget, items=1000, min_reps=2)
+                # Each call deletes a batch saved above, so none is a no-op
+                results[prefix + '.delete_many_1000'] = measure(
+                    lambda: generator.delete_personas(saved_batches.pop()),
+                    args.budget, items=1000, min_reps=1, max_reps=len(saved_batches) - 1)
+                print(f"  {prefix} done", file=sys.stderr)
+
+
+def concurrent_writer(backend, data_dir, personas):
+    store = STORAGE_BACKENDS[backend](data_dir)
+    for persona in personas:
+        store.save(persona)
+
+
+def bench_concurrency(args, results):
+    """Several processes saving into one store at once; no save may be lost"""
+    templates = template_personas(100)
+    per_writer = args.concurrent_saves
+    for backend in args.backends:
+        with tempfile.TemporaryDirectory() as data_dir:
+            STORAGE_BACKENDS[backend](data_dir)  # create the store before writers race
+            personas = list(synthetic_personas(templates, args.writers * per_writer))
+            batches = [personas[i::args.writers] for i in range(args.writers)]
+            with concurrent.futures.ProcessPoolExecutor(args.writers) as pool:
+                start = time.perf_counter()
+                for future in [pool.submit(concurrent_writer, backend, data_dir, batch)
+                               for batch in batches]:
+                    future.result()
+                elapsed = time.perf_counter() - start
+            saved = STORAGE_BACKENDS[backend](data_dir).count()
+            results[f'concurrency.{backend}.save_{args.writers}_writers'] = {
+                'reps': len(personas),
+                'seconds': round(elapsed, 4),
+                'ops_per_sec': round(len(personas) / elapsed, 1),
+                'lost': len(personas) - saved,
+            }
+            if saved != len(personas):
+                print(f"  concurrency.{backend}: {len(personas) - saved} of {len(personas)} "
+                      f"saves lost", file=sys.stderr)
+
+
+def bench_export(args, results):
+    with tempfile.TemporaryDirectory() as data_dir:
+        generator = FakeDataGenerator(data_dir=data_dir, cache_size=0)
+        persona_id = generator.save_persona(generator.create_seeded_persona('export'))
+        for export_format in ('json', 'yaml', 'csv', 'qr'):
+            results[f'export.persona.{export_format}'] = measure(
+                lambda: generator.export_persona(persona_id, export_format), args.budget)
+
+        personas = list(generator.generate_personas(args.export_count, seed=3))
+        for export_format, (_, binary) in EXPORTERS.items():
+            def run():
+                out = io.BytesIO() if binary else io.StringIO()
+                generator.export_personas(out, export_format, personas=personas)
+            try:
+                results[f'export.stream.{export_format}'] = measure(
+                    run, args.budget, items=len(personas), min_reps=1)
+            except ImportError as e:
+                print(f"  skipping export.stream.{export_format}: {e}", file=sys.stderr)
+
+
+def bench_http(args, results):
+    with tempfile.TemporaryDirectory() as data_dir:
+        cwd = os.getcwd()
+        os.chdir(data_dir)  # the web server keeps its data in ./fake_data
+        try:
+            import web_server
+            client = web_server.app.test_client()
+            generator = web_server.generator
+            ids = [generator.save_persona(p) for p in generator.generate_personas(100, seed=5)]
+
+            def ok(response):
+                assert response.status_code == 200, response.status_code
+                response.close()
+
+            results['http.generate'] = measure(
+                lambda: ok(client.post('/api/generate', json={})), args.budget)
+            results['http.generate_seeded_fields'] = measure(
+                lambda: ok(client.post('/api/generate', json={'seed': 'x', 'fields': ['name']})),
+                args.budget)
+            results['http.fill_form'] = measure(
+                lambda: ok(client.post('/api/fill-form', json={})), args.budget)
+            results['http.get_persona'] = measure(
+                lambda: ok(client.get(f'/api/personas/{ids[0]}')), args.budget)
+            results['http.list_personas'] = measure(
+                lambda: ok(client.get('/api/personas?limit=50')), args.budget)
+            results['http.generate_batch_1000'] = measure(
+                lambda: client.post('/api/generate/batch', json={'count': 1000, 'seed': 'b'}).get_data(),
+                args.budget, items=1000)
+        finally:
+            os.chdir(cwd)
+
+
+def metadata():
+    """Where and on what the benchmark ran"""
+    import faker
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'faker': faker.VERSION,
+    }
+
+
+def headline(result):
+    """The metric compared between runs: throughput when known, else memory or median latency"""
+    if result.get('ops_per_sec'):
+        return result['ops_per_sec'], True
+    if 'bytes_per_persona' in result:
+        return result['bytes_per_persona'], False
+    return result['median_ms'], False
+
+
+def compare(baseline, results):
+    """Print how each result moved against a baseline run"""
+    print(f"{'benchmark':<45} {'baseline':>12} {'current':>12} {'change':>8}", file=sys.stderr)
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, higher_is_better = headline(baseline[name])
+        after, _ = headline(result)
+        change = (after / before - 1) * 100 if before else 0.0
+        better = change > 0 if higher_is_better else change < 0
+        unit = 'ops/s' if higher_is_better else 'B' if 'bytes_per_persona' in result else 'ms'
+        print(f"{name:<45} {before:>12.1f} {after:>12.1f} {change:>+7.1f}% "
+              f"{unit}{'' if abs(change) < 5 else (' better' if better else ' worse')}",
+              file=sys.stderr)
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def installed_backends():
+    """Storage backends whose optional dependencies can be imported"""
+    backends = []
+    for backend in STORAGE_BACKENDS:
+        requirement = BACKEND_REQUIREMENTS.get(backend)
+        if requirement:
+            try:
+                __import__(requirement)
+            except ImportError:
+                print(f"  skipping the {backend} backend: needs {requirement}", file=sys.stderr)
+                continue
+        backends.append(backend)
+    return backends
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sections', default=','.join(SECTIONS),
+                        help=f"Comma separated sections to run ({', '.join(SECTIONS)})")
+    parser.add_argument('--sizes', type=int_list, default=DEFAULT_SIZES,
+                        help='Comma separated store sizes (default: 1000,10000,100000; '
+                             'add 1000000 for million-persona stores)')
+    parser.add_argument('--backends',
+                        help='Comma separated storage backends (default: every backend '
+                             'whose dependencies are installed)')
+    parser.add_argument('--budget', type=float, default=1.0,
+                        help='Seconds spent on each measurement')
+    parser.add_argument('--writers', type=int, default=4,
+                        help='Processes saving at once in the concurrency section')
+    parser.add_argument('--concurrent-saves', type=int, default=250,
+                        help='Saves per writer process in the concurrency section')
+    parser.add_argument('--export-count', type=int, default=10000,
+                        help='Personas per streaming export run')
+    parser.add_argument('--quick', action='store_true',
+                        help='Small stores and short budgets, for a smoke run')
+    parser.add_argument('-o', '--output', help='Write results to this JSON file (default: stdout)')
+    parser.add_argument('--compare', help='Baseline results JSON to compare against')
+    args = parser.parse_args()
+
+    args.backends = args.backends.split(',') if args.backends else installed_backends()
+    if args.quick:
+        args.sizes, args.budget, args.export_count = [1000], 0.2, 1000
+        args.concurrent_saves = 50
+    sections = args.sections.split(',')
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for section in sections:
+        print(f"Running {section} benchmarks...", file=sys.stderr)
+        globals()[f'bench_{section}'](args, results)
+
+    report = {'meta': metadata(), 'config': {'sizes': args.sizes, 'budget': args.budget,
+                                             'export_count': args.export_count},
+              'results': results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f)['results'], results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
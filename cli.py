@@ -4,32 +4,77 @@ CLI interface for the Fake Data Generator
 """
 
 import click
+import io
 import json
-from tabulate import tabulate
-from fake_data_generator import FakeDataGenerator
+import sys
+import persona_metrics
+from fake_data_generator import UnknownLocaleError, get_generator, string_to_seed
+from persona_index import PAGE_SIZE
+from persona_storage import STORAGE_BACKENDS
+from persona_binary import is_msgpack, read_msgpack
+from persona_export import EXPORTERS, flatten_dict, is_binary_format
+from persona_fields import expand_fields
+
+# Personas written per storage call by `generate --count N --save`
+SAVE_BATCH_SIZE = 1000
 
 @click.group()
 @click.option('--locale', default='en_US', help='Locale for data generation (e.g., en_US, en_GB, de_DE)')
+@click.option('--storage', default='json', type=click.Choice(sorted(STORAGE_BACKENDS)),
+              help='Storage backend for saved personas')
+@click.option('--profile', is_flag=True,
+              help='Print where time went (fields, storage, cache, export) to stderr')
 @click.pass_context
-def cli(ctx, locale):
+def cli(ctx, locale, storage, profile):
     """Offline Fake Data Generator CLI"""
     ctx.ensure_object(dict)
-    ctx.obj['generator'] = FakeDataGenerator(locale=locale)
+    if profile:
+        # Before the generator exists, so its store and builders are instrumented
+        persona_metrics.enable()
+        ctx.call_on_close(print_profile)
+    ctx.obj['locale'] = locale
+    ctx.obj['storage'] = storage
+    try:
+        ctx.obj['generator'] = get_generator(locale, storage=storage)
+    except UnknownLocaleError as e:
+        raise click.BadParameter(str(e), param_hint='--locale')
+
+def validate_fields(ctx, param, value):
+    """Check a comma separated --fields value against the persona fields"""
+    if value is None:
+        return None
+    try:
+        expand_fields(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    return value
+
+fields_option = click.option(
+    '--fields', callback=validate_fields,
+    help='Comma separated fields to generate (e.g. name,email,address.city)')
 
 @cli.command()
 @click.option('--save', is_flag=True, help='Save the generated persona')
 @click.option('--seed', help='Seed for reproducible generation')
+@fields_option
+@click.option('--count', default=1, type=click.IntRange(min=1), help='Number of personas to generate')
+@click.option('--workers', default=1, type=click.IntRange(min=1),
+              help='Worker processes to spread bulk generation over')
 @click.option('--format', 'output_format', default='table', 
               type=click.Choice(['table', 'json', 'yaml']), 
               help='Output format')
-def generate(save, seed, output_format):
+def generate(save, seed, fields, count, workers, output_format):
     """Generate a new fake persona"""
     generator = click.get_current_context().obj['generator']
     
+    if count > 1:
+        generate_many(generator, count, seed, fields, workers, save, output_format)
+        return
+    
     if seed:
-        persona = generator.create_seeded_persona(seed)
+        persona = generator.create_seeded_persona(seed, fields=fields)
     else:
-        persona = generator.generate_persona()
+        persona = generator.generate_persona(fields=fields)
     
     if save:
         persona_id = generator.save_persona(persona)
@@ -38,31 +83,112 @@ def generate(save, seed, output_format):
     if output_format == 'json':
         click.echo(json.dumps(persona, indent=2, default=str))
     elif output_format == 'yaml':
-        click.echo(generator.export_persona(persona.get('id', 'temp'), 'yaml'))
+        import yaml
+        click.echo(yaml.dump(persona, default_flow_style=False), nl=False)
+    elif fields:
+        display_fields_table(persona)
     else:
         # Table format
         display_persona_table(persona)
 
+def generate_many(generator, count, seed, fields, workers, save, output_format):
+    """Stream several personas, one JSON line or YAML document per persona"""
+    master_seed = string_to_seed(seed) if seed else None
+    personas = generator.generate_personas_parallel(
+        count, seed=master_seed, workers=workers, fields=fields)
+    rows = []
+    pending = []
+    saved = 0
+    
+    for persona in personas:
+        if save:
+            pending.append(persona)
+            if len(pending) >= SAVE_BATCH_SIZE:
+                saved += len(generator.save_personas(pending))
+                pending = []
+        if output_format == 'json':
+            click.echo(json.dumps(persona, default=str))
+        elif output_format == 'yaml':
+            import yaml
+            click.echo(yaml.dump(persona, default_flow_style=False, explicit_start=True), nl=False)
+        else:
+            rows.append([persona['id'][:8] + '...', persona.get('name'), persona.get('email')])
+    
+    if pending:
+        saved += len(generator.save_personas(pending))
+    if rows:
+        click.echo(grid_table(rows, headers=['ID', 'Name', 'Email']))
+    if save:
+        click.echo(f"Saved {saved} personas", err=True)
+
 @cli.command()
-def list():
-    """List all saved personas"""
+@click.option('--limit', default=PAGE_SIZE, type=click.IntRange(min=1),
+              help='Maximum personas to show')
+@click.option('--cursor', default='', help='Continue from the cursor printed by a previous list')
+@click.option('--format', 'output_format', default='table', type=click.Choice(['table', 'json']),
+              help='Output format')
+def list(limit, cursor, output_format):
+    """List saved personas, oldest first, one page at a time"""
     generator = click.get_current_context().obj['generator']
-    personas = generator.list_personas()
+    try:
+        page = generator.list_personas(limit=limit, cursor=cursor, total=True)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--cursor')
     
-    if not personas:
+    if output_format == 'json':
+        click.echo(json.dumps(page, indent=2))
+        return
+    if not page['personas']:
         click.echo("No saved personas found.")
         return
     
     headers = ['ID', 'Name', 'Email', 'Created']
-    table_data = [[p['id'][:8] + '...', p['name'], p['email'], p['created_at'][:10]] 
-                  for p in personas]
+    table_data = [[p['id'][:8] + '...', p['name'], p['email'], (p['created_at'] or '')[:10]]
+                  for p in page['personas']]
     
-    click.echo(tabulate(table_data, headers=headers, tablefmt='grid'))
+    click.echo(grid_table(table_data, headers=headers))
+    click.echo(f"Showing {len(page['personas'])} of {page['total']} personas", err=True)
+    if page['next_cursor']:
+        click.echo(f"More results: --cursor {page['next_cursor']}", err=True)
+
+@cli.command()
+@click.option('--email', help='Exact email address (ignoring case)')
+@click.option('--city', help='Exact address city (ignoring case)')
+@click.option('--name', help='Name prefix (ignoring case)')
+@click.option('--created-after', help='Created on or after this ISO date or timestamp')
+@click.option('--created-before', help='Created before this ISO date or timestamp')
+@click.option('--limit', default=PAGE_SIZE, type=click.IntRange(min=1), help='Maximum results to show')
+@click.option('--cursor', help='Continue from the cursor printed by a previous search')
+@click.option('--format', 'output_format', default='table', type=click.Choice(['table', 'json']),
+              help='Output format')
+def search(email, city, name, created_after, created_before, limit, cursor, output_format):
+    """Search saved personas by email, city, name prefix or creation date"""
+    generator = click.get_current_context().obj['generator']
+    filters = {'email': email, 'city': city, 'name': name,
+               'created_after': created_after, 'created_before': created_before}
+    try:
+        result = generator.search_personas(
+            limit=limit, cursor=cursor, **{k: v for k, v in filters.items() if v is not None})
+    except ValueError as e:
+        # A malformed cursor or date; the message names which
+        raise click.BadParameter(str(e))
+    
+    if output_format == 'json':
+        click.echo(json.dumps(result, indent=2))
+        return
+    if not result['personas']:
+        click.echo("No matching personas found.")
+        return
+    rows = [[p['id'][:8] + '...', p['name'], p['email'], (p['created_at'] or '')[:10]]
+            for p in result['personas']]
+    click.echo(grid_table(rows, headers=['ID', 'Name', 'Email', 'Created']))
+    if result['next_cursor']:
+        click.echo(f"More results: --cursor {result['next_cursor']}", err=True)
 
 @cli.command()
 @click.argument('persona_id')
 @click.option('--format', 'output_format', default='table', 
-              type=click.Choice(['table', 'json', 'yaml', 'csv', 'qr']), 
+              type=click.Choice(['table', 'json', 'yaml', 'csv', 'qr', 'msgpack']), 
               help='Output format')
 def show(persona_id, output_format):
     """Show a specific persona"""
@@ -73,38 +199,110 @@ def show(persona_id, output_format):
         click.echo(f"Persona with ID {persona_id} not found.")
         return
     
-    if output_format in ['json', 'yaml', 'csv', 'qr']:
+    if output_format == 'msgpack':
+        sys.stdout.buffer.write(generator.export_persona(persona_id, output_format))
+    elif output_format in ['json', 'yaml', 'csv', 'qr']:
         output = generator.export_persona(persona_id, output_format)
         click.echo(output)
     else:
-        display_persona_table(persona)
+        display_persona_table(generator.complete_persona(persona))
+
+@cli.command()
+@click.option('--format', 'output_format', default='csv',
+              type=click.Choice(sorted(EXPORTERS)), help='Export format')
+@click.option('--output', '-o', default='-', help='Output file (default: stdout)')
+@click.option('--generate', 'generate_count', type=click.IntRange(min=1),
+              help='Export this many freshly generated personas instead of saved ones')
+@click.option('--seed', help='Seed for freshly generated personas')
+@fields_option
+@click.option('--workers', default=1, type=click.IntRange(min=1),
+              help='Worker processes for freshly generated personas')
+def export(output_format, output, generate_count, seed, fields, workers):
+    """Export many personas as CSV, JSON Lines, YAML, Parquet, Arrow or MessagePack"""
+    generator = click.get_current_context().obj['generator']
+    
+    personas = None
+    if generate_count:
+        master_seed = string_to_seed(seed) if seed else None
+        personas = generator.generate_personas_parallel(
+            generate_count, seed=master_seed, workers=workers, fields=fields)
+    
+    mode = 'wb' if is_binary_format(output_format) else 'w'
+    with click.open_file(output, mode) as out:
+        count = generator.export_personas(out, output_format, personas=personas)
+    
+    if output != '-':
+        click.echo(f"Exported {count} personas to {output}")
 
 @cli.command()
 @click.argument('persona_id')
-def regenerate(persona_id):
-    """Regenerate a persona using the same seed"""
+@fields_option
+def regenerate(persona_id, fields):
+    """Regenerate a persona (or only some of its fields) using the same seed"""
     generator = click.get_current_context().obj['generator']
-    persona = generator.regenerate_persona(persona_id)
+    persona = generator.regenerate_persona(persona_id, fields=fields)
     
     if not persona:
         click.echo(f"Persona with ID {persona_id} not found.")
         return
     
+    persona = generator.complete_persona(persona)
     click.echo(f"Regenerated persona: {persona['name']}")
     display_persona_table(persona)
 
 @cli.command()
-@click.argument('persona_id')
-@click.confirmation_option(prompt='Are you sure you want to delete this persona?')
-def delete(persona_id):
-    """Delete a persona"""
+@click.argument('persona_ids', nargs=-1)
+@click.option('--all', 'delete_all', is_flag=True, help='Delete every saved persona')
+@click.confirmation_option(prompt='Are you sure you want to delete the selected personas?')
+def delete(persona_ids, delete_all):
+    """Delete one or more personas (or --all) in a single write"""
     generator = click.get_current_context().obj['generator']
-    success = generator.delete_persona(persona_id)
+    if delete_all:
+        persona_ids = [p['id'] for p in generator.list_personas()]
+    elif not persona_ids:
+        raise click.UsageError("Give one or more persona IDs, or --all")
     
-    if success:
-        click.echo(f"Persona {persona_id} deleted successfully.")
-    else:
-        click.echo(f"Persona with ID {persona_id} not found.")
+    if len(persona_ids) == 1:
+        persona_id = persona_ids[0]
+        if generator.delete_persona(persona_id):
+            click.echo(f"Persona {persona_id} deleted successfully.")
+        else:
+            click.echo(f"Persona with ID {persona_id} not found.")
+        return
+    
+    deleted = generator.delete_personas(persona_ids)
+    click.echo(f"Deleted {deleted} of {len(persona_ids)} personas.")
+
+def read_personas(data):
+    """Parse personas from MessagePack, JSON Lines, a JSON list or a `personas.json` style object"""
+    if is_msgpack(data):
+        return [*read_msgpack(io.BytesIO(data))]
+    text = data.decode('utf-8-sig')
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict):
+        return [data] if 'id' in data else [*data.values()]
+    if data is None or isinstance(data, (str, int, float)):
+        raise ValueError("expected personas, found a single JSON value")
+    return data
+
+@cli.command('import')
+@click.argument('input', type=click.File('rb'), default='-')
+def import_personas(input):
+    """Save personas from a JSON Lines, JSON or MessagePack file (e.g. `export`) in one write"""
+    generator = click.get_current_context().obj['generator']
+    try:
+        personas = read_personas(input.read())
+    except ValueError as e:
+        raise click.ClickException(f"Cannot read personas from {input.name}: {e}")
+    for number, persona in enumerate(personas, 1):
+        if not (isinstance(persona, dict) and 'id' in persona and 'created_at' in persona):
+            raise click.ClickException(f"Persona {number} in {input.name} has no 'id' or 'created_at'")
+    
+    ids = generator.save_personas(personas)
+    click.echo(f"Imported {len(ids)} personas")
 
 @cli.command()
 @click.argument('seed_string')
@@ -121,6 +319,101 @@ def seed(seed_string, save):
     click.echo(f"Generated from seed: '{seed_string}'")
     display_persona_table(persona)
 
+def request_generators(ctx):
+    """Return a `generator_for(locale)` callable for batch and daemon requests"""
+    default_locale, storage = ctx.obj['locale'], ctx.obj['storage']
+    return lambda locale: get_generator(locale or default_locale, storage=storage)
+
+@cli.command()
+@click.argument('input', type=click.File('r'), default='-')
+@click.option('--seeds', is_flag=True, help='Treat every line as a seed string')
+@fields_option
+@click.pass_context
+def batch(ctx, input, seeds, fields):
+    """Run many commands from a file or stdin, printing one JSON result per line.
+
+    Lines are commands such as `seed abc --fields name,email`, `generate --save`
+    or `show <id>`, or JSON requests like {"command": "seed", "seed": "abc"}.
+    With --seeds every line is a seed string instead.
+    """
+    from persona_daemon import run_batch
+    
+    lines = input
+    if seeds:
+        lines = (json.dumps({'command': 'seed', 'seed': line.rstrip('\n'), 'fields': fields})
+                 for line in input if line.strip())
+    run_batch(lines, sys.stdout.buffer, request_generators(ctx))
+
+@cli.command()
+@click.option('--socket', 'socket_path', help='Unix socket path (default: $FAKE_DATA_SOCKET '
+              'or fake_data/daemon.sock)')
+@click.pass_context
+def daemon(ctx, socket_path):
+    """Serve batch commands on a Unix socket, keeping generators warm"""
+    import signal
+    from persona_daemon import PersonaDaemon
+    
+    try:
+        server = PersonaDaemon(request_generators(ctx), socket_path)
+    except OSError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Persona daemon listening on {server.path} (Ctrl+C to stop)", err=True)
+    # Stop cleanly, removing the socket, when killed as well as on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def print_profile():
+    """Print the recorded metrics as tables on stderr"""
+    data = persona_metrics.snapshot()
+    histograms, counters = data['histograms'], data['counters']
+    
+    def timing_rows(metric, label_names):
+        rows = []
+        for (name, labels), h in histograms.items():
+            if name != metric or not h['count']:
+                continue
+            values = dict(labels)
+            rows.append([*(values.get(label) for label in label_names), h['count'],
+                         f"{h['sum'] * 1000:.2f}", f"{h['sum'] / h['count'] * 1e6:.1f}"])
+        return sorted(rows, key=lambda row: -float(row[-2]))
+    
+    sections = [
+        ('Persona builds', 'persona_build_seconds', []),
+        ('Fields', 'persona_field_seconds', ['field']),
+        ('Storage', 'storage_operation_seconds', ['backend', 'operation']),
+        ('Export', 'persona_export_seconds', ['format']),
+    ]
+    for title, metric, label_names in sections:
+        rows = timing_rows(metric, label_names)
+        if rows:
+            click.echo(f"\n{title}", err=True)
+            click.echo(grid_table(rows, headers=[*label_names, 'calls', 'total ms', 'mean µs']),
+                       err=True)
+    
+    io_rows = []
+    for (name, labels), value in sorted(counters.items()):
+        if name in ('storage_read_bytes_total', 'storage_written_bytes_total'):
+            io_rows.append([dict(labels).get('backend'), name.split('_')[1], value])
+    if io_rows:
+        click.echo("\nStorage I/O", err=True)
+        click.echo(grid_table(io_rows, headers=['backend', 'direction', 'bytes']), err=True)
+    
+    hits = counters.get(('persona_cache_requests_total', (('result', 'hit'),)), 0)
+    misses = counters.get(('persona_cache_requests_total', (('result', 'miss'),)), 0)
+    if hits or misses:
+        click.echo(f"\nCache: {hits} hits, {misses} misses "
+                   f"({hits / (hits + misses):.0%} hit rate)", err=True)
+
+def grid_table(rows, headers):
+    """Render rows as a grid table (tabulate is imported on first use)"""
+    from tabulate import tabulate
+    return tabulate(rows, headers=headers, tablefmt='grid')
+
 def display_persona_table(persona):
     """Display persona in a nice table format"""
     data = [
@@ -136,7 +429,12 @@ def display_persona_table(persona):
         ['Blood Group', persona['blood_group']],
     ]
     
-    click.echo(tabulate(data, headers=['Field', 'Value'], tablefmt='grid'))
+    click.echo(grid_table(data, headers=['Field', 'Value']))
+
+def display_fields_table(persona):
+    """Display every field of a (possibly partial) persona"""
+    data = [[key, value] for key, value in flatten_dict(persona).items()]
+    click.echo(grid_table(data, headers=['Field', 'Value']))
 
 if __name__ == '__main__':
     cli() 
\ No newline at end of file
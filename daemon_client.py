@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Thin client for the persona daemon (`python cli.py daemon`)
+
+Only the standard library is imported, so each call costs an interpreter
+start and one round trip over the daemon's Unix socket instead of loading
+Faker again:
+
+    python daemon_client.py seed my-test-data
+    python daemon_client.py < commands.txt
+"""
+
+import json
+import os
+import shlex
+import socket
+import sys
+
+DEFAULT_SOCKET = os.path.join('fake_data', 'daemon.sock')
+
+
+def socket_path(path=None):
+    """Socket to use: `path`, then FAKE_DATA_SOCKET, then fake_data/daemon.sock"""
+    return path or os.environ.get('FAKE_DATA_SOCKET') or DEFAULT_SOCKET
+
+
+class DaemonClient:
+    """Connection to a running persona daemon"""
+
+    def __init__(self, path=None):
+        self.path = socket_path(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(self.path)
+        except OSError:
+            self.sock.close()
+            raise
+        self._reader = self.sock.makefile('rb')
+
+    def send_line(self, line):
+        """Send one batch line (a command or JSON request) and return the raw response line"""
+        self.sock.sendall(line.rstrip('\n').encode() + b'\n')
+        response = self._reader.readline()
+        if not response:
+            raise ConnectionError("Persona daemon closed the connection")
+        return response.decode().rstrip('\n')
+
+    def request(self, command, **params):
+        """Send a request and return the decoded JSON result"""
+        return json.loads(self.send_line(json.dumps({'command': command, **params})))
+
+    def close(self):
+        self._reader.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv):
+    try:
+        client = DaemonClient()
+    except OSError as e:
+        print(f"Cannot reach the persona daemon at {socket_path()}: {e}", file=sys.stderr)
+        print("Start it with: python cli.py daemon", file=sys.stderr)
+        return 1
+
+    with client:
+        if argv:
+            lines = [' '.join(shlex.quote(arg) for arg in argv)]
+        else:
+            lines = (line for line in sys.stdin if line.strip())
+        for line in lines:
+            print(client.send_line(line))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
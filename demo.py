@@ -64,12 +64,13 @@ def demo_persistence():
     # Save some personas
     print("Saving personas...")
     
+    new_personas = [generator.generate_persona() for _ in range(3)]
+    generator.save_personas(new_personas)  # one storage write for all three
+    
     personas = []
-    for i in range(3):
-        persona = generator.generate_persona()
-        persona_id = generator.save_persona(persona)
-        personas.append((persona_id, persona['name'], persona['email']))
-        print(f"  Saved: {persona['name']} (ID: {persona_id[:8]}...)")
+    for persona in new_personas:
+        personas.append((persona['id'], persona['name'], persona['email']))
+        print(f"  Saved: {persona['name']} (ID: {persona['id'][:8]}...)")
     
     # List all personas
     print(f"\nAll saved personas:")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Compact binary (MessagePack) serialisation of personas
+
+Every encoded persona is a MessagePack array whose first element is the
+schema version, so data written by older versions keeps loading:
+
+    [version, [values...]]            # persona in the version's field order
+    [version, [values...], {extras}]  # same, plus keys the schema lacks
+    [version, {persona}]              # any other persona, as a plain map
+
+The field order of a version never changes once released; new fields go
+into a new version. Nested groups such as address are nested arrays.
+"""
+
+# Newest schema, used for everything written
+SCHEMA_VERSION = 1
+
+# version -> field order; (key, subkeys) entries are nested groups
+SCHEMAS = {
+    1: (
+        'id', 'created_at', 'seed', 'name', 'first_name', 'last_name', 'username', 'sex',
+        'birthdate', 'age', 'email', 'phone', 'mobile',
+        ('address', ('street', 'city', 'state', 'state_abbr', 'zipcode', 'country',
+                     'country_code', 'full_address')),
+        'job', 'company', 'job_title', 'ssn', 'website',
+        ('social_media', ('twitter', 'linkedin', 'facebook')),
+        ('credit_card', ('number', 'provider', 'security_code', 'expire')),
+        'blood_group', 'height', 'weight', 'license_plate', 'mother_maiden_name',
+        'favorite_color',
+    ),
+}
+
+CONTENT_TYPE = 'application/msgpack'
+
+# Accept header values asking for MessagePack
+CONTENT_TYPES = (CONTENT_TYPE, 'application/x-msgpack', 'application/vnd.msgpack')
+
+
+def _require_msgpack():
+    """Import msgpack, which is only needed for the binary format"""
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError("MessagePack support needs msgpack: pip install msgpack") from None
+    return msgpack
+
+
+class _Layout:
+    """Keys of one schema version, prepared for encoding and decoding"""
+
+    def __init__(self, fields):
+        self.keys = tuple(f if isinstance(f, str) else f[0] for f in fields)
+        self.groups = tuple((f[0], f[1]) for f in fields if not isinstance(f, str))
+        self.subkeys = dict(self.groups)
+
+
+_LAYOUTS = {version: _Layout(fields) for version, fields in SCHEMAS.items()}
+
+
+def persona_object(persona):
+    """Return the MessagePack-ready object for a persona (see the module docstring)"""
+    layout = _LAYOUTS[SCHEMA_VERSION]
+    keys = layout.keys
+    present = tuple(persona)
+    if present[:len(keys)] != keys:
+        return [SCHEMA_VERSION, persona]
+    values = []
+    for key in keys:
+        value = persona[key]
+        subkeys = layout.subkeys.get(key)
+        if subkeys is not None:
+            if type(value) is not dict or tuple(value) != subkeys:
+                return [SCHEMA_VERSION, persona]
+            value = list(value.values())
+        values.append(value)
+    if len(present) == len(keys):
+        return [SCHEMA_VERSION, values]
+    return [SCHEMA_VERSION, values, {key: persona[key] for key in present[len(keys):]}]
+
+
+def object_persona(obj):
+    """Turn an object from `persona_object` (of any schema version) back into a persona"""
+    try:
+        version, body, *extras = obj
+        layout = _LAYOUTS[version]
+    except (TypeError, ValueError, KeyError):
+        raise ValueError(f"Not an encoded persona, or an unsupported schema version: "
+                         f"{str(obj)[:80]}") from None
+    if type(body) is dict:
+        return body
+    if len(body) != len(layout.keys):
+        raise ValueError(f"Encoded persona has {len(body)} fields, "
+                         f"schema version {version} has {len(layout.keys)}")
+    persona = dict(zip(layout.keys, body))
+    for key, subkeys in layout.groups:
+        persona[key] = dict(zip(subkeys, persona[key]))
+    if extras:
+        persona.update(extras[0])
+    return persona
+
+
+def encode_persona(persona):
+    """Serialise one persona to MessagePack bytes"""
+    msgpack = _require_msgpack()
+    return msgpack.packb(persona_object(persona), use_bin_type=True, default=str)
+
+
+def decode_persona(data):
+    """Parse bytes from `encode_persona`, raising ValueError if they are not a persona"""
+    msgpack = _require_msgpack()
+    return object_persona(msgpack.unpackb(data, raw=False, strict_map_key=False))
+
+
+def write_msgpack(personas, out):
+    """Write personas to a binary stream as consecutive MessagePack objects"""
+    msgpack = _require_msgpack()
+    packer = msgpack.Packer(use_bin_type=True, default=str)
+    count = 0
+    for persona in personas:
+        out.write(packer.pack(persona_object(persona)))
+        count += 1
+    return count
+
+
+def read_msgpack(f):
+    """Yield the personas of a binary stream written by `write_msgpack`"""
+    msgpack = _require_msgpack()
+    for obj in msgpack.Unpacker(f, raw=False, strict_map_key=False):
+        yield object_persona(obj)
+
+
+def is_msgpack(data):
+    """Whether bytes look like encoded personas rather than JSON text"""
+    # Encoded personas start with a 2 or 3 element MessagePack array
+    return data[:1] in (b'\x92', b'\x93')
+
+
+_NEGOTIATED = CONTENT_TYPES + ('application/json',)
+
+
+def wants_msgpack(accept):
+    """Whether an Accept header prefers MessagePack to JSON"""
+    best = None
+    best_quality = 0.0
+    for part in (accept or '').split(','):
+        media_type, _, params = part.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        media_type = media_type.strip().lower()
+        if media_type in _NEGOTIATED and quality > best_quality:
+            best, best_quality = media_type, quality
+    return best in CONTENT_TYPES
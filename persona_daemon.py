@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Batch request handling and a Unix socket daemon that keeps generators warm
+"""
+
+import json
+import os
+import shlex
+import socket
+import socketserver
+
+from daemon_client import socket_path
+
+# Command -> name of its positional argument
+COMMANDS = {
+    'generate': None,
+    'seed': 'seed',
+    'show': 'id',
+    'list': None,
+    'delete': 'id',
+    'regenerate': 'id',
+    'ping': None,
+}
+
+FLAGS = {'save'}
+
+
+def parse_command(line):
+    """Turn a batch line into a request dict.
+
+    A line is either a JSON object such as `{"command": "seed", "seed": "abc"}`
+    or a command line such as `seed abc --fields name,email --save`.
+    """
+    line = line.strip()
+    if line.startswith('{'):
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("A JSON request must be an object")
+        return request
+
+    tokens = shlex.split(line)
+    if not tokens:
+        raise ValueError("Empty command")
+    command, args = tokens[0], tokens[1:]
+    if command not in COMMANDS:
+        raise ValueError(f"Unknown command: {command!r}. Choose from {', '.join(COMMANDS)}")
+
+    request = {'command': command}
+    positional = []
+    while args:
+        token = args.pop(0)
+        if not token.startswith('--'):
+            positional.append(token)
+            continue
+        key = token[2:].replace('-', '_')
+        if key in FLAGS:
+            request[key] = True
+        elif args:
+            request[key] = args.pop(0)
+        else:
+            raise ValueError(f"Option {token} needs a value")
+
+    argument = COMMANDS[command]
+    if len(positional) > (1 if argument else 0):
+        raise ValueError(f"Too many arguments for {command}")
+    if argument and not positional:
+        raise ValueError(f"{command} needs a {argument}")
+    if positional:
+        request[argument] = positional[0]
+    return request
+
+
+def _int(request, key):
+    value = request.get(key)
+    return int(value) if value is not None else None
+
+
+def handle_request(request, generator_for):
+    """Run one request and return its JSON-serialisable result.
+
+    `generator_for(locale)` returns the generator to use, `locale` being
+    None unless the request names one. Results match the REST API: personas
+    for generate, seed, show and regenerate, `{'success': ...}` for delete,
+    and `{'error': ...}` for anything that fails.
+    """
+    command = request.get('command')
+    if command not in COMMANDS:
+        return {'error': f"Unknown command: {command!r}"}
+    if command == 'ping':
+        return {'ok': True}
+
+    try:
+        generator = generator_for(request.get('locale'))
+        fields = request.get('fields')
+
+        if command in ('generate', 'seed'):
+            seed = request.get('seed')
+            if command == 'seed' and not seed:
+                return {'error': 'seed needs a seed string'}
+            if seed:
+                persona = generator.create_seeded_persona(str(seed), fields=fields)
+            else:
+                persona = generator.generate_persona(fields=fields)
+            if request.get('save'):
+                persona['saved_id'] = generator.save_persona(persona)
+            return persona
+
+        if command == 'list':
+            return generator.list_personas(offset=_int(request, 'offset') or 0,
+                                           limit=_int(request, 'limit'))
+
+        persona_id = request.get('id')
+        if command == 'delete':
+            if generator.delete_persona(persona_id):
+                return {'success': True}
+            return {'error': 'Persona not found'}
+
+        if command == 'show':
+            persona = generator.load_persona(persona_id)
+        else:
+            persona = generator.regenerate_persona(persona_id, fields=fields)
+        return persona if persona else {'error': 'Persona not found'}
+    except (ValueError, AttributeError) as e:
+        return {'error': str(e)}
+
+
+def handle_line(line, generator_for):
+    """Parse and run one batch line, returning the JSON response line"""
+    try:
+        result = handle_request(parse_command(line), generator_for)
+    except ValueError as e:
+        result = {'error': str(e)}
+    except Exception as e:
+        # One bad request must not end a batch or a daemon connection
+        result = {'error': f"{type(e).__name__}: {e}"}
+    return json.dumps(result, default=str)
+
+
+def run_batch(lines, out, generator_for):
+    """Answer every non-blank, non-comment line with one JSON line on the binary
+    stream `out`; return the count"""
+    count = 0
+    for line in lines:
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        out.write(handle_line(line, generator_for).encode() + b'\n')
+        count += 1
+    return count
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            line = line.decode()
+            if line.strip():
+                self.wfile.write(handle_line(line, self.server.generator_for).encode() + b'\n')
+
+
+# Missing on platforms without Unix domain sockets, where PersonaDaemon refuses to start
+_UnixStreamServer = getattr(socketserver, 'UnixStreamServer', object)
+
+
+class PersonaDaemon(socketserver.ThreadingMixIn, _UnixStreamServer):
+    """Unix socket server answering batch lines, one connection per thread"""
+
+    daemon_threads = True
+
+    def __init__(self, generator_for, path=None):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise OSError("The persona daemon needs Unix domain sockets")
+        self.generator_for = generator_for
+        self.path = socket_path(path)
+        _remove_stale_socket(self.path)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Only the owner may talk to the daemon
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(self.path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _remove_stale_socket(path):
+    """Remove a socket file left behind by a daemon that is no longer running"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+    else:
+        raise OSError(f"A persona daemon is already running on {path}")
+    finally:
+        probe.close()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Streaming exporters for any number of personas
+"""
+
+import csv
+import itertools
+import json
+from io import BytesIO, StringIO
+
+from persona_binary import write_msgpack
+from persona_records import as_dict
+
+# Fixed flattened schema shared by every tabular export
+PERSONA_COLUMNS = [
+    'id', 'created_at', 'seed', 'name', 'first_name', 'last_name', 'username',
+    'sex', 'birthdate', 'age', 'email', 'phone', 'mobile',
+    'address_street', 'address_city', 'address_state', 'address_state_abbr',
+    'address_zipcode', 'address_country', 'address_country_code',
+    'address_full_address', 'job', 'company', 'job_title', 'ssn', 'website',
+    'social_media_twitter', 'social_media_linkedin', 'social_media_facebook',
+    'credit_card_number', 'credit_card_provider', 'credit_card_security_code',
+    'credit_card_expire', 'blood_group', 'height', 'weight', 'license_plate',
+    'mother_maiden_name', 'favorite_color', 'seed_string',
+]
+
+INTEGER_COLUMNS = {'seed', 'age'}
+
+
+def flatten_dict(d, parent_key='', sep='_'):
+    """Flatten nested dictionary for CSV export"""
+    items = []
+    for k, v in d.items():
+        new_key = f"{parent_key}{sep}{k}" if parent_key else k
+        if isinstance(v, dict):
+            items.extend(flatten_dict(v, new_key, sep=sep).items())
+        else:
+            items.append((new_key, v))
+    return dict(items)
+
+
+def persona_row(persona, columns=PERSONA_COLUMNS):
+    """Return a persona's values in schema order, None for missing fields"""
+    flat = flatten_dict(persona)
+    return [flat.get(column) for column in columns]
+
+
+def write_csv(personas, out, columns=PERSONA_COLUMNS, header=True):
+    """Write personas as CSV with a header row and proper quoting"""
+    writer = csv.writer(out, lineterminator='\n')
+    if header:
+        writer.writerow(columns)
+    count = 0
+    for persona in personas:
+        writer.writerow(['' if v is None else v for v in persona_row(persona, columns)])
+        count += 1
+    return count
+
+
+def write_jsonl(personas, out):
+    """Write one JSON object per line"""
+    count = 0
+    for persona in personas:
+        out.write(json.dumps(persona, default=str))
+        out.write('\n')
+        count += 1
+    return count
+
+
+def write_yaml(personas, out):
+    """Write one YAML document per persona"""
+    import yaml
+    count = 0
+    for persona in personas:
+        yaml.safe_dump(persona, out, default_flow_style=False, explicit_start=True)
+        count += 1
+    return count
+
+
+def _require_pyarrow():
+    """Import pyarrow, which is only needed for the columnar formats"""
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet and Arrow export need pyarrow: pip install pyarrow") from None
+    return pyarrow
+
+
+def _arrow_batches(personas, columns, batch_size):
+    """Yield pyarrow RecordBatches of at most `batch_size` personas"""
+    pa = _require_pyarrow()
+    schema = pa.schema([(c, pa.int64() if c in INTEGER_COLUMNS else pa.string()) for c in columns])
+    personas = iter(personas)
+    while True:
+        chunk = list(itertools.islice(personas, batch_size))
+        if not chunk:
+            return
+        rows = [persona_row(p, columns) for p in chunk]
+        arrays = []
+        for i, field in enumerate(schema):
+            values = [row[i] for row in rows]
+            if field.type == pa.string():
+                values = [None if v is None else str(v) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        yield schema, pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_parquet(personas, out, columns=PERSONA_COLUMNS, batch_size=10000):
+    """Write personas to a Parquet file, one row group per batch"""
+    _require_pyarrow()
+    import pyarrow.parquet as pq
+
+    writer = None
+    count = 0
+    try:
+        for schema, batch in _arrow_batches(personas, columns, batch_size):
+            if writer is None:
+                writer = pq.ParquetWriter(out, schema)
+            writer.write_batch(batch)
+            count += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def write_arrow(personas, out, columns=PERSONA_COLUMNS, batch_size=10000):
+    """Write personas as an Arrow IPC stream"""
+    pa = _require_pyarrow()
+
+    writer = None
+    count = 0
+    try:
+        for schema, batch in _arrow_batches(personas, columns, batch_size):
+            if writer is None:
+                writer = pa.ipc.new_stream(out, schema)
+            writer.write_batch(batch)
+            count += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+# Exporter function and whether it writes bytes rather than text
+EXPORTERS = {
+    'csv': (write_csv, False),
+    'jsonl': (write_jsonl, False),
+    'yaml': (write_yaml, False),
+    'parquet': (write_parquet, True),
+    'arrow': (write_arrow, True),
+    'msgpack': (write_msgpack, True),
+}
+
+# Formats that can be sent in independent chunks
+STREAMABLE_FORMATS = {'csv', 'jsonl', 'yaml', 'msgpack'}
+
+
+def export_personas(personas, out, format='csv'):
+    """Stream personas to the file object `out` and return how many were written.
+
+    Text formats need a text stream, `parquet` and `arrow` a binary one.
+    Personas are consumed one batch at a time, so any iterable of dicts or
+    PersonaRecords works, including `FakeDataGenerator.generate_personas()`.
+    """
+    try:
+        writer, _ = EXPORTERS[format]
+    except KeyError:
+        raise ValueError(f"Unknown export format: {format!r}. "
+                         f"Choose from {', '.join(EXPORTERS)}") from None
+    return writer(map(as_dict, personas), out)
+
+
+def iter_export(personas, format='jsonl', batch_size=100):
+    """Yield an export in chunks of `batch_size` personas.
+
+    The first chunk holds a single persona (plus the CSV header) so a
+    streaming response can start right away. Chunks are text, or bytes for
+    msgpack. Parquet and Arrow cannot be streamed this way.
+    """
+    if format not in STREAMABLE_FORMATS:
+        raise ValueError(f"Cannot stream export format: {format!r}")
+    writer = EXPORTERS[format][0]
+    personas = map(as_dict, personas)
+    first = True
+    while True:
+        chunk = list(itertools.islice(personas, 1 if first else batch_size))
+        if not chunk and not first:
+            return
+        buffer = BytesIO() if is_binary_format(format) else StringIO()
+        if format == 'csv':
+            write_csv(chunk, buffer, header=first)
+        else:
+            writer(chunk, buffer)
+        first = False
+        yield buffer.getvalue()
+
+
+def is_binary_format(format):
+    """Whether an export format must be written to a binary stream"""
+    return EXPORTERS[format][1]
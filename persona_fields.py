@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Persona field registry: how each field is generated and what it depends on
+"""
+
+import datetime
+import hashlib
+import itertools
+
+SEXES = ['F', 'M']
+BLOOD_GROUPS = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+MAX_AGE = 115
+
+
+def derive_seed(seed, index):
+    """Derive a stable 32-bit seed for item `index` of a seeded run"""
+    key = f"{seed}:{index}".encode()
+    return int(hashlib.md5(key).hexdigest(), 16) % (2**32)
+
+
+def field_seed(seed, field):
+    """Seed of the sub-stream `field` draws from in a persona generated with `seed`"""
+    return derive_seed(seed, field)
+
+
+def _years_before(day, years):
+    """Return the same calendar day `years` earlier (Feb 29 becomes Feb 28)"""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+class BatchContext:
+    """Setup shared by every persona built in one batch.
+
+    Faker's `random_element` rebuilds a weighted list's cumulative weights
+    on every draw, which is most of the cost of names and addresses. Inside
+    a `with` block the Faker's providers draw through `random_element` below
+    instead, which builds each table once per batch and picks the same
+    element from the same random state, so seeded personas do not change.
+    The providers' own `random_element` is put back when the block exits.
+    """
+
+    def __init__(self, fake, element_table):
+        self.fake = fake
+        self.element_table = element_table
+        self.today = datetime.date.today()
+        self.oldest_birthdate = _years_before(self.today, MAX_AGE + 1) + datetime.timedelta(days=1)
+        self.birthdate_span = (self.today - self.oldest_birthdate).days
+        self._weights = {}
+        self._choices = fake.random.choices
+        self._replaced = []
+
+    def __enter__(self):
+        for provider in self.fake.get_providers():
+            if getattr(provider, '__use_weighting__', True):
+                self._replaced.append((provider, vars(provider).get('random_element')))
+                provider.random_element = self.random_element
+        return self
+
+    def __exit__(self, *exc_info):
+        while self._replaced:
+            provider, previous = self._replaced.pop()
+            if previous is None:
+                del provider.random_element
+            else:
+                provider.random_element = previous
+
+    def random_element(self, elements=('a', 'b', 'c')):
+        """Drop-in for Faker's `random_element` with cached cumulative weights"""
+        if not isinstance(elements, dict):
+            return self.fake.random.choice(tuple(elements))
+        table = self._weights.get(id(elements))
+        if table is None:
+            # `elements` is kept so its id is not reused while the batch lasts
+            table = self._weights[id(elements)] = (
+                elements, tuple(elements), list(itertools.accumulate(elements.values())))
+        return self._choices(table[1], cum_weights=table[2])[0]
+
+
+# Field binders are called once per batch with the BatchContext and return a
+# function computing the field from the values computed so far.
+
+def _provider(method, template=None, fallback=()):
+    """Field drawn from one Faker provider method, optionally formatted.
+
+    `fallback` names a method, or a tuple of methods tried in order, used
+    when the locale has no `method`. A field none of them covers is blank,
+    since no locale has every provider.
+    """
+    methods = (method,) + ((fallback,) if isinstance(fallback, str) else tuple(fallback))
+
+    def bind(ctx):
+        draw = next((getattr(ctx.fake, name) for name in methods if hasattr(ctx.fake, name)),
+                    None)
+        if draw is None:
+            return lambda values: ''
+        if template is None:
+            return lambda values: draw()
+        return lambda values: template.format(draw())
+    return bind
+
+
+def _choice(elements):
+    """Field picked uniformly from a fixed list"""
+    def bind(ctx):
+        random_element = ctx.fake.random_element
+        return lambda values: random_element(elements)
+    return bind
+
+
+def _bind_name(ctx):
+    name_female, name_male, name = ctx.fake.name_female, ctx.fake.name_male, ctx.fake.name
+
+    def compute(values):
+        try:
+            return name_female() if values['sex'] == 'F' else name_male()
+        except AttributeError:
+            # Locales whose gendered name formats are broken, such as es_AR
+            return name()
+    return compute
+
+
+def _bind_birthdate(ctx):
+    random_int = ctx.fake.random_int
+    oldest, span = ctx.oldest_birthdate, ctx.birthdate_span
+    return lambda values: (oldest + datetime.timedelta(days=random_int(0, span))).isoformat()
+
+
+def _bind_age(ctx):
+    today = ctx.today
+    return lambda values: (today - datetime.date.fromisoformat(values['birthdate'])).days // 365
+
+
+def _bind_range(low, high, unit):
+    def bind(ctx):
+        random_int = ctx.fake.random_int
+        return lambda values: f"{random_int(low, high)} {unit}"
+    return bind
+
+
+def _bind_maiden_name(ctx):
+    choices = ctx.fake.random.choices
+    names, cum_weights = ctx.element_table('last_names')
+    return lambda values: choices(names, cum_weights=cum_weights)[0]
+
+
+# name -> (dependencies, binder), in the order fields appear in a persona.
+# Dotted names are nested: 'address.city' is persona['address']['city'].
+PERSONA_FIELDS = {
+    # Basic info
+    'name': (('sex',), _bind_name),
+    'first_name': (('name',), lambda ctx: lambda values: values['name'].split()[0]),
+    'last_name': (('name',), lambda ctx: lambda values: values['name'].split()[-1]),
+    'username': ((), _provider('user_name')),
+    'sex': ((), _choice(SEXES)),
+    'birthdate': ((), _bind_birthdate),
+    'age': (('birthdate',), _bind_age),
+
+    # Contact info
+    'email': ((), _provider('free_email')),
+    'phone': ((), _provider('phone_number', fallback='mobile_number')),
+    'mobile': ((), _provider('phone_number', fallback='mobile_number')),
+
+    # Address
+    'address.street': ((), _provider('street_address')),
+    'address.city': ((), _provider('city')),
+    'address.state': ((), _provider('state', fallback=('administrative_unit', 'region'))),
+    'address.state_abbr': ((), _provider('state_abbr')),
+    'address.zipcode': ((), _provider('zipcode', fallback='postcode')),
+    'address.country': ((), _provider('country')),
+    'address.country_code': ((), _provider('country_code')),
+    'address.full_address': ((), _provider('address')),
+
+    # Professional info
+    'job': (('company', 'job_title'),
+            lambda ctx: lambda values: values['company'] + ' - ' + values['job_title']),
+    'company': ((), _provider('company')),
+    'job_title': ((), _provider('job')),
+    'ssn': ((), _provider('ssn')),
+
+    # Online presence
+    'website': ((), _provider('url')),
+    'social_media.twitter': ((), _provider('user_name', '@{}')),
+    'social_media.linkedin': ((), _provider('user_name', 'linkedin.com/in/{}')),
+    'social_media.facebook': ((), _provider('user_name', 'facebook.com/{}')),
+
+    # Financial
+    'credit_card.number': ((), _provider('credit_card_number')),
+    'credit_card.provider': ((), _provider('credit_card_provider')),
+    'credit_card.security_code': ((), _provider('credit_card_security_code')),
+    'credit_card.expire': ((), _provider('credit_card_expire')),
+
+    # Additional details
+    'blood_group': ((), _choice(BLOOD_GROUPS)),
+    'height': ((), _bind_range(150, 200, 'cm')),
+    'weight': ((), _bind_range(50, 120, 'kg')),
+    'license_plate': ((), _provider('license_plate')),
+    'mother_maiden_name': ((), _bind_maiden_name),
+    'favorite_color': ((), _provider('color_name')),
+}
+
+
+def expand_fields(fields):
+    """Turn a field selection into the set of registry names it covers.
+
+    Accepts registry names ('address.city'), group names ('address') or a
+    comma separated string of either. None selects every field.
+    """
+    if fields is None:
+        return set(PERSONA_FIELDS)
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+    elif not isinstance(fields, (list, tuple, set, frozenset)):
+        raise ValueError(f"Persona fields must be a string or a list, not {type(fields).__name__}")
+
+    selected = set()
+    for field in fields:
+        if not isinstance(field, str):
+            raise ValueError(f"Persona field names must be strings, not {field!r}")
+        if field in PERSONA_FIELDS:
+            selected.add(field)
+            continue
+        group = [name for name in PERSONA_FIELDS if name.startswith(field + '.')]
+        if not group:
+            raise ValueError(f"Unknown persona field: {field!r}")
+        selected.update(group)
+    return selected
+
+
+def with_dependents(selected, present):
+    """Add the fields in `present` that depend, directly or not, on a selected one"""
+    selected = set(selected)
+    changed = True
+    while changed:
+        changed = False
+        for name in present:
+            if name not in selected and any(d in selected for d in PERSONA_FIELDS[name][0]):
+                selected.add(name)
+                changed = True
+    return selected
+
+
+def resolve_plan(selected, known=()):
+    """Return selected fields plus their dependencies, dependencies first.
+
+    Dependencies listed in `known` are taken as given and not recomputed.
+    """
+    plan = []
+
+    def visit(name):
+        if name in plan:
+            return
+        for dependency in PERSONA_FIELDS[name][0]:
+            if dependency not in known or dependency in selected:
+                visit(dependency)
+        plan.append(name)
+
+    for name in PERSONA_FIELDS:
+        if name in selected:
+            visit(name)
+    return plan
+
+
+def persona_values(persona):
+    """Return the registry fields present in a persona, keyed by dotted name"""
+    values = {}
+    for name in PERSONA_FIELDS:
+        key, _, subkey = name.partition('.')
+        value = persona.get(key)
+        if subkey:
+            if isinstance(value, dict) and subkey in value:
+                values[name] = value[subkey]
+        elif key in persona:
+            values[name] = value
+    return values
+
+
+def set_persona_values(persona, values):
+    """Write dotted-name field values back into a persona"""
+    for name, value in values.items():
+        key, _, subkey = name.partition('.')
+        if subkey:
+            persona.setdefault(key, {})[subkey] = value
+        else:
+            persona[key] = value
+    return persona
+
+
+def output_layout(selected):
+    """Return `[(key, subfields)]` describing the persona shape to assemble.
+
+    `subfields` is None for a plain field, or a list of `(subkey, name)` for
+    a nested group such as address.
+    """
+    layout = []
+    groups = {}
+    for name in PERSONA_FIELDS:
+        if name not in selected:
+            continue
+        key, _, subkey = name.partition('.')
+        if not subkey:
+            layout.append((key, None))
+        elif key in groups:
+            groups[key].append((subkey, name))
+        else:
+            groups[key] = [(subkey, name)]
+            layout.append((key, groups[key]))
+    return layout
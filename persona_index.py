@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+In-memory secondary indexes for searching saved personas
+
+Used by the file backends (JSON, JSONL), which have no database to keep
+indexes for them. SQLite gets the same queries from its own indexes.
+"""
+
+import base64
+import bisect
+import heapq
+import json
+import threading
+
+# Filters every store's `search` accepts
+SEARCH_FILTERS = ('email', 'city', 'name', 'created_after', 'created_before')
+
+# Sorts after any character a name prefix can continue with
+PREFIX_END = '\U0010ffff'
+
+# Default and largest number of summaries served per page
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+
+def persona_city(persona):
+    """City of a persona's address, if it has one"""
+    address = persona.get('address')
+    return address.get('city') if isinstance(address, dict) else None
+
+
+def encode_cursor(key):
+    """Turn a `(created_at, id)` sort key into an opaque cursor string"""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Turn a cursor from `encode_cursor` back into its sort key"""
+    try:
+        created_at, persona_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    return created_at, persona_id
+
+
+def _lower(value):
+    if not isinstance(value, str):
+        return None
+    lowered = value.lower()
+    # Share the string when lowering changed nothing, as for most emails
+    return value if lowered == value else lowered
+
+
+class PersonaIndex:
+    """Summaries of saved personas with lookups by email, city, name prefix and creation time.
+
+    Email and city match exactly, ignoring case; `name` matches a prefix,
+    ignoring case. Results are ordered by `(created_at, id)`, which is also
+    what cursors point into, so pages stay stable while personas are saved
+    or deleted. Safe to use from several threads.
+    """
+
+    def __init__(self, personas=()):
+        self._lock = threading.Lock()
+        # Rows are (created_at, id, name, email, city, name, email, city), the
+        # last three lowercased. (created_at, id) is unique, so rows sort by it
+        # and bisect against `(created_at, id)` keys.
+        self._rows = {}      # id -> row
+        self._emails = {}    # lowercased email -> set of ids
+        self._cities = {}    # lowercased city -> set of ids
+        for persona in personas:
+            row = self._row(persona)
+            self._rows[row[1]] = row
+        for row in self._rows.values():
+            self._add_lookups(row)
+        self._names = sorted((row[5], row[1]) for row in self._rows.values())
+        self._created = sorted(self._rows.values())
+
+    @staticmethod
+    def _row(persona):
+        name, email, city = persona.get('name'), persona.get('email'), persona_city(persona)
+        return (persona.get('created_at') or '', persona['id'], name, email, city,
+                _lower(name) or '', _lower(email), _lower(city))
+
+    def _add_lookups(self, row):
+        for table, value in ((self._emails, row[6]), (self._cities, row[7])):
+            if value is not None:
+                table.setdefault(value, set()).add(row[1])
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, persona):
+        """Index a saved persona, replacing an older version of it"""
+        row = self._row(persona)
+        with self._lock:
+            self._remove(row[1])
+            self._rows[row[1]] = row
+            self._add_lookups(row)
+            bisect.insort(self._names, (row[5], row[1]))
+            bisect.insort(self._created, row)
+
+    def remove(self, persona_id):
+        """Drop a deleted persona from the index"""
+        with self._lock:
+            self._remove(persona_id)
+
+    def _remove(self, persona_id):
+        row = self._rows.pop(persona_id, None)
+        if row is None:
+            return
+        for table, value in ((self._emails, row[6]), (self._cities, row[7])):
+            if value is not None:
+                ids = table[value]
+                ids.discard(persona_id)
+                if not ids:
+                    del table[value]
+        for entries, key in ((self._names, (row[5], persona_id)), (self._created, row[:2])):
+            del entries[bisect.bisect_left(entries, key)]
+
+    def search(self, email=None, city=None, name=None, created_after=None, created_before=None,
+               limit=None, after=None):
+        """Return `(summaries, next_key)` for personas matching every given filter.
+
+        `created_after` is inclusive and `created_before` exclusive. `after`
+        is the `(created_at, id)` key to continue after, and `next_key` is
+        the key of the last summary returned when more matches follow.
+        """
+        with self._lock:
+            rows = self._search(_lower(email), _lower(city), _lower(name), created_after,
+                                created_before, limit, after)
+        more = limit is not None and len(rows) > limit
+        if more:
+            rows = rows[:limit]
+        summaries = [{'id': row[1], 'name': row[2], 'email': row[3], 'created_at': row[0]}
+                     for row in rows]
+        return summaries, (rows[-1][:2] if more else None)
+
+    def count(self, email=None, city=None, name=None, created_after=None, created_before=None):
+        """Return how many personas match every given filter, without building summaries"""
+        with self._lock:
+            if email is None and city is None and name is None:
+                lo, hi = self._created_range(created_after, created_before, None)
+                return max(hi - lo, 0)
+            return len(self._search(_lower(email), _lower(city), _lower(name), created_after,
+                                    created_before, None, None, ordered=False))
+
+    def _created_range(self, created_after, created_before, after):
+        created = self._created
+        lo = bisect.bisect_left(created, (created_after,)) if created_after else 0
+        if after is not None:
+            # The first row sorting after `after`, whose own row would sort after the bare key
+            created_at, persona_id = after
+            lo = max(lo, bisect.bisect_left(created, (created_at, persona_id + '\0')))
+        hi = bisect.bisect_left(created, (created_before,)) if created_before else len(created)
+        return lo, hi
+
+    def _search(self, email, city, name, created_after, created_before, limit, after,
+                ordered=True):
+        created = self._created
+        lo, hi = self._created_range(created_after, created_before, after)
+        if lo >= hi:
+            return []
+
+        # (size, ids) for each filter with an index; name ranges are only
+        # copied out if that source is used
+        sources = []
+        for table, value in ((self._emails, email), (self._cities, city)):
+            if value is not None:
+                ids = table.get(value, ())
+                sources.append((len(ids), ids))
+        if name is not None:
+            start = bisect.bisect_left(self._names, (name,))
+            end = bisect.bisect_left(self._names, (name + PREFIX_END,))
+            sources.append((end - start, range(start, end)))
+        wanted = None if limit is None else limit + 1
+
+        def matches(row):
+            return ((email is None or row[6] == email)
+                    and (city is None or row[7] == city)
+                    and (name is None or row[5].startswith(name)))
+
+        size, smallest = min(sources, key=lambda source: source[0]) if sources else (0, None)
+        # Walking the creation order finds `wanted` matches after about
+        # wanted / selectivity rows; sorting the smallest source costs its size
+        walk = smallest is None or (wanted is not None and wanted * (hi - lo) < size ** 2)
+        if walk:
+            found = []
+            for i in range(lo, hi):
+                row = created[i]
+                if smallest is None or matches(row):
+                    found.append(row)
+                    if wanted is not None and len(found) >= wanted:
+                        break
+            return found
+
+        rows, names = self._rows, self._names
+        if isinstance(smallest, range):
+            found = [rows[names[i][1]] for i in smallest]
+        else:
+            found = [rows[persona_id] for persona_id in smallest]
+        # Every candidate already passes the filter it came from
+        if len(sources) > 1 or lo > 0 or hi < len(created):
+            low, high = created[lo], created[hi - 1]
+            found = [row for row in found if low <= row <= high and matches(row)]
+        if not ordered:
+            return found
+        return sorted(found) if wanted is None else heapq.nsmallest(wanted, found)
+
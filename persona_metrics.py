@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Optional in-process metrics: counters and latency histograms
+
+Disabled unless FAKE_DATA_METRICS=1 is set or `enable()` is called. Hot
+paths check `persona_metrics.enabled` once per batch or per store, not per
+value, so the disabled cost is close to nothing. Enable metrics before
+creating generators, since stores and persona builders decide then whether
+to instrument themselves.
+"""
+
+import bisect
+import contextlib
+import os
+import threading
+import weakref
+from time import perf_counter
+
+enabled = os.environ.get('FAKE_DATA_METRICS', '').lower() in ('1', 'true', 'yes', 'on')
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+           0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# name -> (type, help)
+METRICS = {
+    'persona_build_seconds': ('histogram', 'Time spent building one persona'),
+    'persona_field_seconds': ('histogram', 'Time spent computing one persona field'),
+    'storage_operation_seconds': ('histogram', 'Duration of persona store operations'),
+    'storage_read_bytes_total': ('counter', 'Bytes read by persona stores'),
+    'storage_written_bytes_total': ('counter', 'Bytes written by persona stores'),
+    'persona_cache_requests_total': ('counter', 'Persona cache lookups by result'),
+    'persona_export_seconds': ('histogram', 'Time spent exporting personas by format'),
+    'http_request_seconds': ('histogram', 'Web API request latency by route'),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_caches = weakref.WeakSet()
+
+
+def enable():
+    """Start recording metrics"""
+    global enabled
+    enabled = True
+
+
+def disable():
+    """Stop recording metrics; recorded values are kept"""
+    global enabled
+    enabled = False
+
+
+def reset():
+    """Forget every recorded value"""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    """Add `amount` to a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def _observe(key, seconds):
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        histogram[0][bisect.bisect_left(BUCKETS, seconds)] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+
+def observe(name, seconds, **labels):
+    """Record one duration in a histogram"""
+    _observe(_key(name, labels), seconds)
+
+
+class _Timer:
+    __slots__ = ('key', 'start')
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _observe(self.key, perf_counter() - self.start)
+
+
+_NOT_TIMED = contextlib.nullcontext()
+
+
+def timer(name, **labels):
+    """Context manager timing its block into a histogram, a no-op when disabled"""
+    if not enabled:
+        return _NOT_TIMED
+    return _Timer(_key(name, labels))
+
+
+def timed(fn, name, **labels):
+    """Wrap `fn` so every call is timed into a histogram"""
+    key = _key(name, labels)
+
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _observe(key, perf_counter() - start)
+    return wrapper
+
+
+def track_cache(cache):
+    """Report a CachedPersonaStore's hit and miss counts, which it keeps anyway"""
+    _caches.add(cache)
+
+
+def _cache_counters():
+    counters = {}
+    for cache in list(_caches):
+        for result, value in (('hit', cache.hits), ('miss', cache.misses)):
+            key = _key('persona_cache_requests_total', {'result': result})
+            counters[key] = counters.get(key, 0) + value
+    return counters
+
+
+def snapshot():
+    """Return `{'counters': {...}, 'histograms': {...}}` keyed by `(name, labels)`.
+
+    Histograms are `{'buckets': [...], 'sum': seconds, 'count': n}` with
+    per-bucket (not cumulative) counts, the last bucket being +Inf.
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: {'buckets': list(h[0]), 'sum': h[1], 'count': h[2]}
+                      for key, h in _histograms.items()}
+    counters.update(_cache_counters())
+    return {'counters': counters, 'histograms': histograms}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def render_prometheus():
+    """Return every metric in the Prometheus text exposition format"""
+    data = snapshot()
+    series = {}
+    for (name, labels), value in data['counters'].items():
+        series.setdefault(name, []).append((labels, value))
+    for (name, labels), value in data['histograms'].items():
+        series.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(series):
+        kind, help_text = METRICS.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(series[name], key=lambda item: item[0]):
+            if kind != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), value['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {value["sum"]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {value["count"]}')
+    return '\n'.join(lines) + '\n'
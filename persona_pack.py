@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Read-optimised persona pack files, read through a memory map
+
+A pack is written once and never modified:
+
+    header   magic, layout version, persona count and the table offsets
+    records  every persona encoded by `persona_binary`, in insertion order
+    slots    (offset, length) of each record, 12 bytes per persona
+    ids      (id hash, record number) sorted by hash, 20 bytes per persona
+    created  (created_at prefix, record number) sorted by (created_at, id),
+             36 bytes per persona
+
+Loading a persona is a binary search of the ID table plus decoding one
+record, so the cost does not grow with the pack. Readers map the file
+read-only, so every process opening the same pack shares one copy of it
+in the OS page cache.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+
+from persona_binary import decode_persona, encode_persona
+
+MAGIC = b'PERSPACK'
+LAYOUT_VERSION = 1
+
+_HEADER = struct.Struct('<8sIQQQQ')  # magic, version, count, slots, ids, created offsets
+_SLOT = struct.Struct('<QI')
+_ID = struct.Struct('<16sI')
+_CREATED = struct.Struct('<32sI')
+_CREATED_WIDTH = 32
+
+
+class CorruptPackError(Exception):
+    """A pack file is truncated or was not written by `write_pack`"""
+
+
+def id_key(persona_id):
+    """Fixed-width key a persona ID is indexed under"""
+    return hashlib.blake2b(str(persona_id).encode(), digest_size=16).digest()
+
+
+def _created_prefix(created_at):
+    return (created_at or '').encode()[:_CREATED_WIDTH].ljust(_CREATED_WIDTH, b'\0')
+
+
+def write_pack(path, personas):
+    """Write personas to a new pack at `path` in one pass and return its size.
+
+    The tables are kept in memory while the records are streamed out, about
+    100 bytes per persona. Later personas with the same ID replace earlier
+    ones.
+    """
+    slots = []
+    latest = {}
+    with open(path, 'wb') as f:
+        f.write(bytes(_HEADER.size))
+        for persona in personas:
+            data = encode_persona(persona)
+            latest[persona['id']] = len(slots)
+            slots.append((f.tell(), len(data), persona.get('created_at') or ''))
+            f.write(data)
+
+        live = sorted(latest.values())
+        renumber = {recno: number for number, recno in enumerate(live)}
+        slots_offset = f.tell()
+        f.write(b''.join(_SLOT.pack(slots[recno][0], slots[recno][1]) for recno in live))
+
+        ids_offset = f.tell()
+        f.write(b''.join(_ID.pack(key, renumber[recno]) for key, recno in
+                         sorted((id_key(persona_id), recno) for persona_id, recno in latest.items())))
+
+        created_offset = f.tell()
+        order = sorted((slots[recno][2], persona_id, recno) for persona_id, recno in latest.items())
+        f.write(b''.join(_CREATED.pack(_created_prefix(created_at), renumber[recno])
+                         for created_at, _, recno in order))
+
+        size = f.tell()
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, LAYOUT_VERSION, len(live), slots_offset, ids_offset,
+                             created_offset))
+        f.flush()
+        os.fsync(f.fileno())
+    return size
+
+
+class PersonaPack:
+    """Read-only view of a pack file through a shared memory map"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, self.count, self._slots, self._ids, self._created = \
+                _HEADER.unpack_from(self._map)
+        except struct.error:
+            raise CorruptPackError(f"{path} is too short to be a persona pack") from None
+        if magic != MAGIC:
+            raise CorruptPackError(f"{path} is not a persona pack")
+        if version != LAYOUT_VERSION:
+            raise CorruptPackError(f"{path} has unsupported pack layout version {version}")
+        if self._created + self.count * _CREATED.size > len(self._map):
+            raise CorruptPackError(f"{path} is truncated")
+
+    def __len__(self):
+        return self.count
+
+    def slot(self, recno):
+        """Return `(offset, length)` of record `recno`"""
+        return _SLOT.unpack_from(self._map, self._slots + recno * _SLOT.size)
+
+    def record_bytes(self, recno):
+        """The encoded record, sliced straight from the map"""
+        offset, length = self.slot(recno)
+        return self._map[offset:offset + length]
+
+    def record(self, recno):
+        """Decode record `recno` into a persona dict"""
+        return decode_persona(self.record_bytes(recno))
+
+    def find(self, persona_id):
+        """Return `(recno, persona)` for an ID, or None if the pack does not hold it"""
+        key = id_key(persona_id)
+        lo, hi = 0, self.count
+        base, size, data = self._ids, _ID.size, self._map
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = base + mid * size
+            if data[start:start + 16] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        # Equal hashes are adjacent; the ID check guards against collisions
+        while lo < self.count:
+            entry_key, recno = _ID.unpack_from(data, base + lo * size)
+            if entry_key != key:
+                break
+            persona = self.record(recno)
+            if persona.get('id') == persona_id:
+                return recno, persona
+            lo += 1
+        return None
+
+    def created_recno(self, position):
+        """Record number at `position` in `(created_at, id)` order"""
+        return _CREATED.unpack_from(self._map, self._created + position * _CREATED.size)[1]
+
+    def created_position(self, key):
+        """First position in creation order whose `(created_at, id)` is after `key`"""
+        created_at, persona_id = key
+        prefix = _created_prefix(created_at)
+        lo, hi = 0, self.count
+        base, size, data = self._created, _CREATED.size, self._map
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry_prefix, recno = _CREATED.unpack_from(data, base + mid * size)
+            if entry_prefix == prefix:
+                # Same prefix: only the record has the full timestamp and ID
+                persona = self.record(recno)
+                after = (persona.get('created_at') or '', persona['id']) > (created_at, persona_id)
+            else:
+                after = entry_prefix > prefix
+            if after:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def iter_records(self, start=0):
+        """Yield `(recno, persona)` in insertion order from record `start`"""
+        for recno in range(start, self.count):
+            yield recno, self.record(recno)
+
+    def close(self):
+        self._map.close()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Warm pool of ready-made personas, refilled by a background thread
+"""
+
+import collections
+import threading
+import time
+
+
+class PersonaPool:
+    """Bounded pool of unseeded personas for latency sensitive callers.
+
+    A daemon thread keeps the pool topped up: once it drops below
+    `low_watermark` personas it is refilled to `size`. `refill_rate` caps
+    refilling at that many personas per second (None for no cap). `get()`
+    pops a persona in constant time and only generates inline when the pool
+    is empty; `pop()` returns None instead so async callers can generate
+    elsewhere. Pooled personas are held as PersonaRecords and handed out as
+    dicts.
+    """
+
+    def __init__(self, generator, size=100, low_watermark=None, refill_rate=None, fields=None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        if low_watermark is None:
+            low_watermark = size // 2
+        if not 0 <= low_watermark < size:
+            raise ValueError("low_watermark must be between 0 and size - 1")
+        self.generator = generator
+        self.size = size
+        self.low_watermark = low_watermark
+        self.refill_rate = refill_rate
+        self.fields = fields
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self._personas = collections.deque()
+        self._lock = threading.Lock()
+        self._wanted = threading.Event()
+        self._stopped = threading.Event()
+        self._wanted.set()
+        self._thread = threading.Thread(target=self._refill, name='persona-pool', daemon=True)
+        self._thread.start()
+
+    def pop(self):
+        """Take a persona from the pool, or return None (a miss) if it is empty"""
+        with self._lock:
+            if self._personas:
+                record = self._personas.popleft()
+                self.hits += 1
+            else:
+                record = None
+                self.misses += 1
+            if len(self._personas) < self.low_watermark or record is None:
+                self._wanted.set()
+        return None if record is None else record.to_dict()
+
+    def get(self):
+        """Return a persona from the pool, or a freshly generated one if it is empty"""
+        persona = self.pop()
+        if persona is None:
+            persona = self.generator.generate_persona(fields=self.fields)
+        return persona
+
+    def __len__(self):
+        return len(self._personas)
+
+    def stats(self):
+        """Pool configuration, fill level and hit/miss counters"""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'size': self.size,
+                'low_watermark': self.low_watermark,
+                'refill_rate': self.refill_rate,
+                'available': len(self._personas),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else None,
+                'generated': self.generated,
+            }
+
+    def close(self):
+        """Stop the refill thread"""
+        self._stopped.set()
+        self._wanted.set()
+        self._thread.join()
+
+    def _refill(self):
+        interval = 1 / self.refill_rate if self.refill_rate else 0
+        while True:
+            self._wanted.wait()
+            if self._stopped.is_set():
+                return
+            self._wanted.clear()
+            missing = self.size - len(self._personas)
+            if missing <= 0:
+                continue
+            # Generate in one batch so provider lookups are shared
+            for record in self.generator.generate_personas(missing, fields=self.fields,
+                                                           compact=True):
+                if self._stopped.is_set():
+                    return
+                with self._lock:
+                    if len(self._personas) >= self.size:
+                        break
+                    self._personas.append(record)
+                    self.generated += 1
+                if interval:
+                    time.sleep(interval)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Compact in-memory persona records for holding many personas at once
+
+A persona dict carries a hash table per nesting level and its own copy of
+every string. A PersonaRecord keeps the same persona in four slots: a shared
+shape (the keys and their order), categorical values as 16-bit codes into
+process-wide tables, the other strings joined into one string, and a tuple
+for anything else. `to_dict()` rebuilds the exact dict it was made from.
+"""
+
+import struct
+import threading
+
+# Fields with few distinct values, stored as codes into a shared table.
+# Dotted names are nested: 'address.state' is persona['address']['state'].
+CATEGORICAL_FIELDS = (
+    'sex', 'age', 'address.state', 'address.state_abbr', 'address.country',
+    'address.country_code', 'job_title', 'credit_card.provider', 'credit_card.expire',
+    'blood_group', 'height', 'weight', 'favorite_color',
+)
+
+# Codes are unsigned 16-bit; a full table stores further values uncoded
+MAX_CODES = 0xFFFF
+
+# Leaf kinds in a shape
+_CODE, _TEXT, _OBJECT = 0, 1, 2
+
+# Joins the text fields of a record; values containing it are kept as objects
+_SEPARATOR = '\0'
+
+
+class CategoryTable:
+    """Distinct values of one categorical field, numbered in order of first use"""
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+        self._lock = threading.Lock()
+
+    def code(self, value):
+        """Return the code for `value`, or None once the table is full"""
+        code = self._codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(value)
+                if code is None:
+                    if len(self.values) >= MAX_CODES:
+                        return None
+                    code = len(self.values)
+                    self.values.append(value)
+                    self._codes[value] = code
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+CATEGORIES = {name: CategoryTable() for name in CATEGORICAL_FIELDS}
+
+# key -> {subkey: table} for nested fields, and '' -> {key: table} for top-level ones
+_TABLES = {}
+for _name, _table in CATEGORIES.items():
+    _key, _, _subkey = _name.rpartition('.')
+    _TABLES.setdefault(_key, {})[_subkey] = _table
+_NO_TABLES = {}
+
+
+class _Shape:
+    """Key layout shared by every record built from a persona with the same structure.
+
+    `entries` is a tuple of `(key, kind)` for plain fields and
+    `(key, ((subkey, kind), ...))` for nested dicts.
+    """
+
+    __slots__ = ('entries', 'code_tables', 'codes', 'texts', 'id_index')
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.code_tables = []
+        self.texts = 0
+        objects = 0
+        self.id_index = None
+        for key, kind in entries:
+            if type(kind) is tuple:
+                tables, leaves = _TABLES.get(key, _NO_TABLES), kind
+            else:
+                tables, leaves = _TABLES.get('', _NO_TABLES), ((key, kind),)
+                if key == 'id' and kind == _OBJECT:
+                    self.id_index = objects
+            for leaf_key, leaf_kind in leaves:
+                if leaf_kind == _CODE:
+                    self.code_tables.append(tables[leaf_key])
+                elif leaf_kind == _TEXT:
+                    self.texts += 1
+                else:
+                    objects += 1
+        self.codes = struct.Struct(f'<{len(self.code_tables)}H')
+
+
+_shapes = {}
+_shapes_lock = threading.Lock()
+
+
+def _shape(entries):
+    shape = _shapes.get(entries)
+    if shape is None:
+        with _shapes_lock:
+            shape = _shapes.setdefault(entries, _Shape(entries))
+    return shape
+
+
+def _leaf(tables, key, value, codes, texts, objects):
+    """Store one value in the list matching how it is kept and return its kind"""
+    table = tables.get(key)
+    if table is not None and (type(value) is str or type(value) is int):
+        code = table.code(value)
+        if code is not None:
+            codes.append(code)
+            return _CODE
+    if type(value) is str and _SEPARATOR not in value:
+        texts.append(value)
+        return _TEXT
+    objects.append(value)
+    return _OBJECT
+
+
+class PersonaRecord:
+    """A persona packed into four slots, several times smaller than its dict.
+
+    Build one with `from_dict` and get the persona back with `to_dict`,
+    which returns a new dict on every call. Records are immutable; to change
+    a persona, convert it, edit the dict and convert it back. Codes only mean
+    something inside this process, so records pickle as their dicts.
+    """
+
+    __slots__ = ('_shape', '_codes', '_text', '_objects')
+
+    @classmethod
+    def from_dict(cls, persona):
+        codes, texts, objects, entries = [], [], [], []
+        top = _TABLES.get('', _NO_TABLES)
+        for key, value in persona.items():
+            if type(value) is dict:
+                tables = _TABLES.get(key, _NO_TABLES)
+                entries.append((key, tuple(
+                    (subkey, _leaf(tables, subkey, subvalue, codes, texts, objects))
+                    for subkey, subvalue in value.items())))
+            elif key == 'id':
+                # Kept whole so `record.id` needs no unpacking
+                objects.append(value)
+                entries.append((key, _OBJECT))
+            else:
+                entries.append((key, _leaf(top, key, value, codes, texts, objects)))
+
+        record = cls.__new__(cls)
+        record._shape = shape = _shape(tuple(entries))
+        record._codes = shape.codes.pack(*codes)
+        record._text = _SEPARATOR.join(texts)
+        record._objects = tuple(objects)
+        return record
+
+    def to_dict(self):
+        shape = self._shape
+        values = [table.values[code]
+                  for table, code in zip(shape.code_tables, shape.codes.unpack(self._codes))]
+        sources = (iter(values).__next__,
+                   iter(self._text.split(_SEPARATOR) if shape.texts else ()).__next__,
+                   iter(self._objects).__next__)
+        persona = {}
+        for key, kind in shape.entries:
+            if type(kind) is tuple:
+                persona[key] = {subkey: sources[subkind]() for subkey, subkind in kind}
+            else:
+                persona[key] = sources[kind]()
+        return persona
+
+    @property
+    def id(self):
+        """The persona's ID, read without unpacking the rest"""
+        index = self._shape.id_index
+        return None if index is None else self._objects[index]
+
+    def __getitem__(self, key):
+        return self.to_dict()[key]
+
+    def get(self, key, default=None):
+        return self.to_dict().get(key, default)
+
+    def __eq__(self, other):
+        if isinstance(other, PersonaRecord):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return PersonaRecord.from_dict, (self.to_dict(),)
+
+    def __repr__(self):
+        return f"PersonaRecord({self.to_dict()!r})"
+
+
+def as_dict(persona):
+    """Return a persona dict for either a dict or a PersonaRecord"""
+    if type(persona) is PersonaRecord:
+        return persona.to_dict()
+    return persona
+
+
+def to_records(personas):
+    """Lazily pack an iterable of persona dicts into PersonaRecords"""
+    from_dict = PersonaRecord.from_dict
+    for persona in personas:
+        yield persona if type(persona) is PersonaRecord else from_dict(persona)
@@ -0,0 +1,1435 @@
+#!/usr/bin/env python3
+"""
+Storage backends for saved personas
+"""
+
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import struct
+import threading
+from collections import OrderedDict
+
+import persona_metrics
+from persona_binary import _require_msgpack, decode_persona, encode_persona
+from persona_index import PREFIX_END, PersonaIndex, persona_city
+from persona_pack import PersonaPack, write_pack
+from persona_records import PersonaRecord
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class CorruptStoreError(Exception):
+    """A persona file exists but cannot be parsed.
+
+    Raised instead of treating the file as empty, which would wipe it on the
+    next save.
+    """
+
+
+def persona_summary(persona):
+    """Basic info shown when listing personas"""
+    return {
+        'id': persona['id'],
+        'name': persona.get('name'),
+        'email': persona.get('email'),
+        'created_at': persona['created_at']
+    }
+
+
+class PersonaStore:
+    """Interface every persona storage backend implements"""
+
+    def save(self, persona):
+        """Insert or replace a persona"""
+        raise NotImplementedError
+
+    def load(self, persona_id):
+        """Return the persona with this ID, or None"""
+        raise NotImplementedError
+
+    def load_all(self):
+        """Return every persona as a dict keyed by ID"""
+        raise NotImplementedError
+
+    def delete(self, persona_id):
+        """Delete a persona, returning whether it existed"""
+        raise NotImplementedError
+
+    def save_many(self, personas):
+        """Insert or replace many personas, in one write where the backend allows it"""
+        for persona in personas:
+            self.save(persona)
+
+    def delete_many(self, persona_ids):
+        """Delete many personas, returning how many existed"""
+        return sum(1 for persona_id in set(persona_ids) if self.delete(persona_id))
+
+    def iter_all(self):
+        """Yield every persona, one at a time where the backend allows it"""
+        return iter(self.load_all().values())
+
+    def list(self, offset=0, limit=None):
+        """Return persona summaries in insertion order"""
+        summaries = [persona_summary(p) for p in self.load_all().values()]
+        end = None if limit is None else offset + limit
+        return summaries[offset:end]
+
+    def count(self, **filters):
+        """Return the number of saved personas, or of those matching search filters"""
+        if not filters:
+            return len(self.load_all())
+        return PersonaIndex(self.iter_all()).count(**filters)
+
+    def search(self, email=None, city=None, name=None, created_after=None, created_before=None,
+               limit=None, after=None):
+        """Return `(summaries, next_key)` for personas matching every filter.
+
+        See `PersonaIndex.search`; this fallback indexes every persona per call.
+        """
+        return PersonaIndex(self.iter_all()).search(
+            email=email, city=city, name=name, created_after=created_after,
+            created_before=created_before, limit=limit, after=after)
+
+    def fingerprint(self):
+        """Return a value that changes whenever the backing file changes"""
+        return _file_fingerprint(self.path)
+
+
+def _file_fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class FileLock:
+    """Exclusive lock held across threads and processes through a lock file.
+
+    Re-entrant within a thread. The lock file is opened on every outermost
+    acquire, so forked worker processes never share a lock by accident.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._fd = _lock_file(self.path)
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            fd, self._fd = self._fd, None
+            _unlock_file(fd)
+        self._thread_lock.release()
+
+
+def _lock_file(path):
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    # Blocks for up to 10 seconds, then raises
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _unlock_file(fd):
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+
+def _atomic_write(path, write, binary=False):
+    """Write a file through `write(f)` so readers see either all of it or none.
+
+    The data goes to a temporary file that is synced and renamed over `path`.
+    Callers writing concurrently must hold the file's lock.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb' if binary else 'w') as f:
+        result = write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return result
+
+
+class JSONPersonaStore(PersonaStore):
+    """All personas in a single pretty-printed JSON document.
+
+    Saves and deletes rewrite the document under a lock file and replace it
+    atomically, so concurrent writers do not lose each other's updates and
+    readers never see a half-written file. The search index is built on the
+    first search and rebuilt whenever another process changes the file.
+    """
+
+    backend = 'json'
+
+    # Bulk writes larger than this drop the search index instead of updating it
+    INDEX_UPDATE_LIMIT = 1000
+
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, 'personas.json')
+        self.lock = FileLock(self.path + '.lock')
+        self._search_index = None
+        self._search_fingerprint = None
+
+    def save(self, persona):
+        with self.lock:
+            fingerprint = self.fingerprint()
+            personas = self.load_all()
+            personas[persona['id']] = persona
+            self._write(personas)
+            self._update_index(fingerprint, saved=[persona])
+
+    def load(self, persona_id):
+        return self.load_all().get(persona_id)
+
+    def load_all(self):
+        if not os.path.exists(self.path):
+            return {}
+
+        try:
+            with open(self.path, 'r') as f:
+                text = f.read()
+        except FileNotFoundError:
+            return {}
+        if persona_metrics.enabled:
+            persona_metrics.inc('storage_read_bytes_total', len(text), backend=self.backend)
+        if not text.strip():
+            return {}
+        try:
+            personas = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise CorruptStoreError(
+                f"{self.path} is not valid JSON ({e}). Restore it from a backup "
+                f"or move it away to start an empty store.") from e
+        if not isinstance(personas, dict):
+            raise CorruptStoreError(f"{self.path} does not hold a JSON object of personas")
+        return personas
+
+    def delete(self, persona_id):
+        with self.lock:
+            fingerprint = self.fingerprint()
+            personas = self.load_all()
+            if persona_id not in personas:
+                return False
+            del personas[persona_id]
+            self._write(personas)
+            self._update_index(fingerprint, deleted=[persona_id])
+            return True
+
+    def save_many(self, personas):
+        with self.lock:
+            fingerprint = self.fingerprint()
+            stored = self.load_all()
+            saved = []
+            for persona in personas:
+                stored[persona['id']] = persona
+                saved.append(persona)
+            self._write(stored)
+            self._update_index(fingerprint, saved=saved)
+
+    def delete_many(self, persona_ids):
+        with self.lock:
+            fingerprint = self.fingerprint()
+            personas = self.load_all()
+            deleted = [persona_id for persona_id in set(persona_ids)
+                       if personas.pop(persona_id, None) is not None]
+            if deleted:
+                self._write(personas)
+                self._update_index(fingerprint, deleted=deleted)
+            return len(deleted)
+
+    def count(self, **filters):
+        return self._current_index().count(**filters)
+
+    def search(self, **query):
+        return self._current_index().search(**query)
+
+    def _current_index(self):
+        """Return the search index, rebuilt if the file changed since it was built"""
+        fingerprint = self.fingerprint()
+        index = self._search_index
+        if index is None or fingerprint != self._search_fingerprint:
+            index = PersonaIndex(self.load_all().values())
+            self._search_index, self._search_fingerprint = index, fingerprint
+        return index
+
+    def _update_index(self, fingerprint, saved=(), deleted=()):
+        """Apply our own write to the search index, if it was current before the write"""
+        index = self._search_index
+        if index is None:
+            return
+        if (fingerprint != self._search_fingerprint
+                or len(saved) + len(deleted) > self.INDEX_UPDATE_LIMIT):
+            self._search_index = None
+            return
+        for persona in saved:
+            index.add(persona)
+        for persona_id in deleted:
+            index.remove(persona_id)
+        self._search_fingerprint = self.fingerprint()
+
+    def _write(self, personas):
+        def dump(f):
+            json.dump(personas, f, indent=2, default=str)
+            return f.tell()
+
+        written = _atomic_write(self.path, dump)
+        if persona_metrics.enabled:
+            persona_metrics.inc('storage_written_bytes_total', written, backend=self.backend)
+
+
+class SQLitePersonaStore(PersonaStore):
+    """Personas in an SQLite database, indexed by ID.
+
+    Summary columns are stored next to the JSON document so listing never
+    parses full personas, and are indexed for `search`. A `personas.json`
+    left in the data directory is imported on first use and renamed to
+    `personas.json.migrated`.
+    """
+
+    backend = 'sqlite'
+
+    _UPSERT = '''INSERT INTO personas (id, name, email, created_at, city, data)
+                 VALUES (?, ?, ?, ?, ?, ?)
+                 ON CONFLICT(id) DO UPDATE SET name = excluded.name,
+                     email = excluded.email, created_at = excluded.created_at,
+                     city = excluded.city, data = excluded.data'''
+
+    _INDEXES = (
+        'CREATE INDEX IF NOT EXISTS personas_email ON personas '
+        '(email COLLATE NOCASE, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS personas_city ON personas (city COLLATE NOCASE, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS personas_name ON personas (name COLLATE NOCASE)',
+        'CREATE INDEX IF NOT EXISTS personas_created ON personas (created_at, id)',
+    )
+
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, 'personas.db')
+        self._local = threading.local()
+        with self._connect() as db:
+            # Serialise schema changes with other processes opening the database
+            db.execute('BEGIN IMMEDIATE')
+            db.execute('''CREATE TABLE IF NOT EXISTS personas (
+                id TEXT PRIMARY KEY,
+                name TEXT,
+                email TEXT,
+                created_at TEXT,
+                city TEXT,
+                data TEXT NOT NULL
+            )''')
+            columns = {row[1] for row in db.execute('PRAGMA table_info(personas)')}
+            if 'city' not in columns:
+                # Databases created before search was added
+                db.execute('ALTER TABLE personas ADD COLUMN city TEXT')
+                db.execute("UPDATE personas SET city = json_extract(data, '$.address.city')")
+            for statement in self._INDEXES:
+                db.execute(statement)
+        self._migrate_json(data_dir)
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def _migrate_json(self, data_dir):
+        json_store = JSONPersonaStore(data_dir)
+        if not os.path.exists(json_store.path):
+            return
+        with json_store.lock:
+            # Another process may have migrated it while we waited
+            if not os.path.exists(json_store.path):
+                return
+            personas = json_store.load_all()
+            with self._connect() as db:
+                db.executemany(self._UPSERT, (self._row(p) for p in personas.values()))
+            os.replace(json_store.path, json_store.path + '.migrated')
+
+    @staticmethod
+    def _row(persona):
+        return (persona['id'], persona.get('name'), persona.get('email'),
+                persona.get('created_at'), persona_city(persona), json.dumps(persona, default=str))
+
+    def save(self, persona):
+        row = self._row(persona)
+        with self._connect() as db:
+            db.execute(self._UPSERT, row)
+        if persona_metrics.enabled:
+            persona_metrics.inc('storage_written_bytes_total', len(row[-1]), backend=self.backend)
+
+    def load(self, persona_id):
+        row = self._connect().execute(
+            'SELECT data FROM personas WHERE id = ?', (persona_id,)).fetchone()
+        if not row:
+            return None
+        if persona_metrics.enabled:
+            persona_metrics.inc('storage_read_bytes_total', len(row[0]), backend=self.backend)
+        return json.loads(row[0])
+
+    def load_all(self):
+        rows = self._connect().execute('SELECT id, data FROM personas ORDER BY rowid').fetchall()
+        if persona_metrics.enabled:
+            persona_metrics.inc('storage_read_bytes_total', sum(len(data) for _, data in rows),
+                                backend=self.backend)
+        return {persona_id: json.loads(data) for persona_id, data in rows}
+
+    def iter_all(self):
+        # A separate connection keeps the read snapshot independent of writes
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            for (data,) in db.execute('SELECT data FROM personas ORDER BY rowid'):
+                yield json.loads(data)
+        finally:
+            db.close()
+
+    def delete(self, persona_id):
+        with self._connect() as db:
+            cursor = db.execute('DELETE FROM personas WHERE id = ?', (persona_id,))
+        return cursor.rowcount > 0
+
+    def save_many(self, personas):
+        rows = map(self._row, personas)
+        if persona_metrics.enabled:
+            rows = list(rows)
+            persona_metrics.inc('storage_written_bytes_total', sum(len(row[-1]) for row in rows),
+                                backend=self.backend)
+        with self._connect() as db:
+            db.executemany(self._UPSERT, rows)
+
+    def delete_many(self, persona_ids):
+        with self._connect() as db:
+            cursor = db.executemany('DELETE FROM personas WHERE id = ?',
+                                    ((persona_id,) for persona_id in set(persona_ids)))
+        return cursor.rowcount
+
+    def list(self, offset=0, limit=None):
+        rows = self._connect().execute(
+            'SELECT id, name, email, created_at FROM personas ORDER BY rowid LIMIT ? OFFSET ?',
+            (-1 if limit is None else limit, offset))
+        return [{'id': r[0], 'name': r[1], 'email': r[2], 'created_at': r[3]} for r in rows]
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        return self._connect().execute(f'SELECT COUNT(*) FROM personas{where}', params).fetchone()[0]
+
+    def search(self, limit=None, after=None, **filters):
+        where, params = self._where(limit=limit, after=after, **filters)
+        rows = self._connect().execute(
+            f'SELECT id, name, email, created_at FROM personas{where} '
+            f'ORDER BY created_at, id LIMIT ?', params + [-1 if limit is None else limit + 1]
+        ).fetchall()
+        more = limit is not None and len(rows) > limit
+        if more:
+            rows = rows[:limit]
+        summaries = [{'id': r[0], 'name': r[1], 'email': r[2], 'created_at': r[3]} for r in rows]
+        return summaries, ((rows[-1][3], rows[-1][0]) if more else None)
+
+    def _where(self, email=None, city=None, name=None, created_after=None, created_before=None,
+               limit=None, after=None):
+        """Return the WHERE clause and its parameters for a search"""
+        conditions, params = [], []
+        if email is not None:
+            conditions.append('email = ? COLLATE NOCASE')
+            params.append(email)
+        if city is not None:
+            conditions.append('city = ? COLLATE NOCASE')
+            params.append(city)
+        if name is not None:
+            column = 'name'
+            if email is None and city is None and self._is_common_prefix(name, limit):
+                # Unary plus keeps SQLite off the name index, so it walks the
+                # creation order and stops after one page
+                column = '+name'
+            conditions.append(f'{column} >= ? COLLATE NOCASE AND {column} < ? COLLATE NOCASE')
+            params += [name, name + PREFIX_END]
+        if created_after is not None:
+            conditions.append('created_at >= ?')
+            params.append(created_after)
+        if created_before is not None:
+            conditions.append('created_at < ?')
+            params.append(created_before)
+        if after is not None:
+            conditions.append('(created_at, id) > (?, ?)')
+            params += list(after)
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+    def _is_common_prefix(self, name, limit):
+        """Whether walking creation order finds a page sooner than sorting every name match.
+
+        Same rule as PersonaIndex: walk when the matches outnumber
+        sqrt(page size * personas). Counting stops at that bound.
+        """
+        if limit is None:
+            return False
+        db = self._connect()
+        # MAX(rowid) is an O(log n) stand-in for the row count
+        total = db.execute('SELECT MAX(rowid) FROM personas').fetchone()[0] or 0
+        bound = int(((limit + 1) * total) ** 0.5)
+        matches = db.execute(
+            'SELECT COUNT(*) FROM (SELECT 1 FROM personas WHERE name >= ? COLLATE NOCASE '
+            'AND name < ? COLLATE NOCASE LIMIT ?)', (name, name + PREFIX_END, bound + 1)
+        ).fetchone()[0]
+        return matches > bound
+
+    def fingerprint(self):
+        # In WAL mode commits land in the -wal file before reaching the database
+        return _file_fingerprint(self.path), _file_fingerprint(self.path + '-wal')
+
+
+class JSONLPersonaStore(PersonaStore):
+    """Append-only JSON Lines journal of personas.
+
+    Saves append the persona as one line and deletes append a tombstone, so
+    writes cost O(1) instead of rewriting the file. An in-memory index maps
+    each ID to the offset and length of its latest record. Once dead records
+    make up more than `compact_ratio` of the journal, a background thread
+    rewrites it with only the live records. A torn last line left by a crash
+    is truncated when the journal is opened.
+
+    Appends, repairs and the compaction swap hold a lock file, so several
+    processes can share one journal. Reads go through a handle kept open on
+    the journal that was indexed, so a compaction replacing the file in
+    another process never pairs the index with the wrong file.
+    """
+
+    backend = 'jsonl'
+    filename = 'personas.jsonl'
+
+    def __init__(self, data_dir, compact_ratio=0.5, compact_min_records=1000):
+        self.path = os.path.join(data_dir, self.filename)
+        self.compact_ratio = compact_ratio
+        self.compact_min_records = compact_min_records
+        self._lock = threading.RLock()
+        self._reader = None
+        self._reader_lock = threading.Lock()
+        self.file_lock = FileLock(self.path + '.lock')
+        self._compacting = False
+        self._search_index = None
+        self._migrate_json(data_dir)
+        with self._lock, self.file_lock:
+            self._reload(repair=True)
+
+    def _migrate_json(self, data_dir):
+        json_store = JSONPersonaStore(data_dir)
+        if not os.path.exists(json_store.path) or os.path.exists(self.path):
+            return
+        with json_store.lock:
+            if not os.path.exists(json_store.path) or os.path.exists(self.path):
+                return
+            personas = json_store.load_all()
+            _atomic_write(self.path, lambda f: f.writelines(map(self._encode, personas.values())),
+                          binary=True)
+            os.replace(json_store.path, json_store.path + '.migrated')
+
+    @staticmethod
+    def _encode(record):
+        return (json.dumps(record, default=str) + '\n').encode()
+
+    @staticmethod
+    def _decode(frame):
+        return json.loads(frame)
+
+    @staticmethod
+    def _frames(f):
+        """Yield complete records from the current position, stopping at a partial one"""
+        for line in f:
+            if not line.endswith(b'\n'):
+                return
+            yield line
+
+    def _reload(self, repair=False):
+        """Rebuild the index from the whole journal"""
+        self._index = {}
+        self._search_index = None
+        self._records = 0
+        self._end = 0
+        if not os.path.exists(self.path):
+            open(self.path, 'ab').close()
+        self._set_reader(open(self.path, 'rb', buffering=0))
+        self._scan(repair)
+
+    def _set_reader(self, reader):
+        """Read through `reader`, an unbuffered handle on the indexed journal.
+
+        Unbuffered, so a read never returns bytes cached from before a torn
+        record was truncated and written over.
+        """
+        with self._reader_lock:
+            if self._reader is not None:
+                self._reader.close()
+            self._reader = reader
+        self._inode = os.fstat(reader.fileno()).st_ino
+        self._pid = os.getpid()
+
+    def _view(self):
+        """Buffered reader over `_reader`'s file, for use holding `_reader_lock`"""
+        return open(self._reader.fileno(), 'rb', closefd=False)
+
+    def _open_indexed(self):
+        """Open a separate handle on the indexed journal; call holding the lock.
+
+        If the journal was replaced since the last refresh the index is
+        rebuilt first, so offsets taken afterwards match the handle.
+        """
+        while True:
+            f = open(self.path, 'rb')
+            if os.fstat(f.fileno()).st_ino == self._inode:
+                return f
+            f.close()
+            self._refresh()
+
+    def _scan(self, repair=False):
+        """Index records appended after the known end of the journal.
+
+        A partial last record is either one another process is still writing
+        or one torn by a crash; with `repair` it is truncated.
+        """
+        with self._reader_lock, self._view() as f:
+            f.seek(self._end)
+            offset = self._end
+            for frame in self._frames(f):
+                try:
+                    self._apply(self._decode(frame), offset, len(frame))
+                except ValueError:
+                    self._records += 1
+                offset += len(frame)
+            torn = repair and os.fstat(f.fileno()).st_size > offset
+        if torn:
+            with open(self.path, 'r+b') as w:
+                w.truncate(offset)
+        self._end = offset
+
+    def _apply(self, record, offset, length):
+        self._records += 1
+        if '_deleted' in record:
+            self._index.pop(record['_deleted'], None)
+            if self._search_index is not None:
+                self._search_index.remove(record['_deleted'])
+        else:
+            self._index[record['id']] = (offset, length)
+            if self._search_index is not None:
+                self._search_index.add(record)
+
+    def _refresh(self):
+        """Pick up appends and compactions made by other processes"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        if (stat is None or stat.st_ino != self._inode or stat.st_size < self._end
+                or self._pid != os.getpid()):
+            # Replaced or truncated, or inherited by a forked process whose
+            # reader would share its file position with the parent
+            self._reload()
+        elif stat.st_size > self._end:
+            self._scan()
+
+    def _append(self, records):
+        """Append a list of records with a single write"""
+        lines = [self._encode(record) for record in records]
+        data = b''.join(lines)
+        with self._lock, self.file_lock:
+            self._refresh()
+            with open(self.path, 'ab') as f:
+                f.write(data)
+                end = f.tell()
+            if persona_metrics.enabled:
+                persona_metrics.inc('storage_written_bytes_total', len(data), backend=self.backend)
+            if end - len(data) == self._end:
+                for record, line in zip(records, lines):
+                    self._apply(record, self._end, len(line))
+                    self._end += len(line)
+            else:
+                # Another process appended in between; index its records too
+                self._scan()
+            self._maybe_compact()
+
+    def _read(self, offset, length):
+        with self._reader_lock:
+            self._reader.seek(offset)
+            data = self._reader.read(length)
+        if persona_metrics.enabled:
+            persona_metrics.inc('storage_read_bytes_total', length, backend=self.backend)
+        return self._decode(data)
+
+    def save(self, persona):
+        self._append([persona])
+
+    def save_many(self, personas):
+        self._append(list(personas))
+
+    def load(self, persona_id):
+        with self._lock:
+            self._refresh()
+            entry = self._index.get(persona_id)
+            return self._read(*entry) if entry else None
+
+    def load_all(self):
+        with self._lock:
+            self._refresh()
+            entries = sorted(self._index.items(), key=lambda item: item[1][0])
+            with self._reader_lock, self._view() as f:
+                personas = {}
+                for persona_id, (offset, length) in entries:
+                    f.seek(offset)
+                    personas[persona_id] = self._decode(f.read(length))
+            if persona_metrics.enabled:
+                persona_metrics.inc('storage_read_bytes_total',
+                                    sum(length for _, length in self._index.values()),
+                                    backend=self.backend)
+            return personas
+
+    def iter_all(self):
+        with self._lock:
+            self._refresh()
+            # Its own handle keeps reading the same journal even if it is
+            # compacted and replaced meanwhile
+            f = self._open_indexed()
+            entries = sorted(self._index.values())
+        with f:
+            yield from self._read_entries(f, entries)
+
+    def delete(self, persona_id):
+        with self._lock, self.file_lock:
+            self._refresh()
+            if persona_id not in self._index:
+                return False
+            self._append([{'_deleted': persona_id}])
+            return True
+
+    def delete_many(self, persona_ids):
+        with self._lock, self.file_lock:
+            self._refresh()
+            tombstones = [{'_deleted': persona_id} for persona_id in set(persona_ids)
+                          if persona_id in self._index]
+            if tombstones:
+                self._append(tombstones)
+            return len(tombstones)
+
+    def count(self, **filters):
+        with self._lock:
+            self._refresh()
+            if not filters:
+                return len(self._index)
+            return self._current_index().count(**filters)
+
+    def search(self, **query):
+        with self._lock:
+            self._refresh()
+            return self._current_index().search(**query)
+
+    def _current_index(self):
+        if self._search_index is None:
+            # Built on first use, then kept current by every applied record
+            with self._reader_lock, self._view() as f:
+                self._search_index = PersonaIndex(
+                    self._read_entries(f, sorted(self._index.values())))
+        return self._search_index
+
+    def _read_entries(self, f, entries):
+        for offset, length in entries:
+            f.seek(offset)
+            yield self._decode(f.read(length))
+
+    def dead_ratio(self):
+        """Share of journal records that are overwritten saves or tombstones"""
+        with self._lock:
+            return 1 - len(self._index) / self._records if self._records else 0.0
+
+    def _maybe_compact(self):
+        if (self._compacting or self._records < self.compact_min_records
+                or self.dead_ratio() <= self.compact_ratio):
+            return
+        self._compacting = True
+        threading.Thread(target=self._compact_in_background, daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except FileNotFoundError:
+            # The store's directory was removed before compaction got to run
+            pass
+
+    def compact(self):
+        """Rewrite the journal keeping only live records.
+
+        Live records are copied without holding the lock, so saves and deletes
+        carry on meanwhile; anything appended during the copy is replayed onto
+        the new journal before it replaces the old one.
+        """
+        with self._lock:
+            self._compacting = True
+            self._refresh()
+            src = self._open_indexed()
+            snapshot = sorted((entry, persona_id) for persona_id, entry in self._index.items())
+            copied_end = self._end
+        try:
+            tmp_path = f"{self.path}.{os.getpid()}.compact"
+            index = {}
+            with src, open(tmp_path, 'wb') as dst:
+                for (offset, length), persona_id in snapshot:
+                    src.seek(offset)
+                    index[persona_id] = (dst.tell(), length)
+                    dst.write(src.read(length))
+                with self._lock, self.file_lock:
+                    self._refresh()
+                    if self._inode != os.fstat(src.fileno()).st_ino:
+                        # Another process compacted the journal meanwhile
+                        os.unlink(tmp_path)
+                        return
+                    self._index, live = index, len(index)
+                    self._records, self._end = live, dst.tell()
+                    src.seek(copied_end)
+                    for frame in self._frames(src):
+                        dst.write(frame)
+                        self._apply(self._decode(frame), self._end, len(frame))
+                        self._end += len(frame)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                    reader = open(tmp_path, 'rb', buffering=0)
+                    os.replace(tmp_path, self.path)
+                    self._set_reader(reader)
+        finally:
+            self._compacting = False
+
+
+class MsgpackPersonaStore(JSONLPersonaStore):
+    """Append-only journal like JSONLPersonaStore, with MessagePack records.
+
+    Each record is a 4-byte little-endian length followed by the persona as
+    encoded by `persona_binary`, about half the size of a JSON line and
+    faster to parse. An existing `personas.jsonl` journal (or
+    `personas.json`) is imported on first use and renamed to `*.migrated`.
+    Needs the optional msgpack package.
+    """
+
+    backend = 'msgpack'
+    filename = 'personas.msgpack'
+
+    _HEADER = struct.Struct('<I')
+
+    def __init__(self, data_dir, **options):
+        _require_msgpack()
+        super().__init__(data_dir, **options)
+
+    def _migrate_json(self, data_dir):
+        jsonl_path = os.path.join(data_dir, JSONLPersonaStore.filename)
+        if os.path.exists(jsonl_path) and not os.path.exists(self.path):
+            journal = JSONLPersonaStore(data_dir)
+            with journal.file_lock:
+                if os.path.exists(journal.path) and not os.path.exists(self.path):
+                    _atomic_write(self.path,
+                                  lambda f: f.writelines(map(self._encode, journal.iter_all())),
+                                  binary=True)
+                    os.replace(journal.path, journal.path + '.migrated')
+        super()._migrate_json(data_dir)
+
+    @classmethod
+    def _encode(cls, record):
+        data = encode_persona(record)
+        return cls._HEADER.pack(len(data)) + data
+
+    @classmethod
+    def _decode(cls, frame):
+        return decode_persona(frame[cls._HEADER.size:])
+
+    @classmethod
+    def _frames(cls, f):
+        header_size = cls._HEADER.size
+        while True:
+            header = f.read(header_size)
+            if len(header) < header_size:
+                return
+            length, = cls._HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield header + data
+
+
+class _PackJournal(MsgpackPersonaStore):
+    """Journal of the writes made since a MappedPersonaStore's pack was built.
+
+    Besides the live records it tracks the IDs deleted by tombstones, which
+    may still be in the pack, and every ID a record touched in order, so the
+    store can catch up incrementally. Merging into the pack replaces
+    self-compaction.
+    """
+
+    backend = 'mmap'
+    filename = 'personas.pack.journal'
+    generation = 0
+
+    def _migrate_json(self, data_dir):
+        pass
+
+    def _reload(self, repair=False):
+        self.deleted = set()
+        self.touched = []
+        self.generation += 1
+        super()._reload(repair)
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        if (stat is not None and stat.st_ino == self._inode and stat.st_size == self._end
+                and self._pid == os.getpid()):
+            return
+        # Merges replace the journal under the lock file, so catch up holding it
+        with self.file_lock:
+            super()._refresh()
+
+    def _apply(self, record, offset, length):
+        super()._apply(record, offset, length)
+        if '_deleted' in record:
+            persona_id = record['_deleted']
+            self.deleted.add(persona_id)
+        else:
+            persona_id = record['id']
+            self.deleted.discard(persona_id)
+        self.touched.append(persona_id)
+
+    def _maybe_compact(self):
+        pass
+
+
+class MappedPersonaStore(PersonaStore):
+    """Read-optimised pack file, memory-mapped, with a journal for recent writes.
+
+    Personas live in a `persona_pack` file: encoded records plus fixed-width
+    tables sorted by ID hash and by creation time. A load is a binary search
+    of the mapped ID table and the decoding of one record, and every process
+    serving the same directory shares the pack through the OS page cache
+    instead of each holding its own parsed copy.
+
+    Saves and deletes are appended to a MessagePack journal
+    (`personas.pack.journal`) whose records shadow the pack. Once the journal
+    holds more than `merge_ratio` of the pack's size (and at least
+    `merge_min_records` records), a background thread writes a new pack
+    with everything merged and starts an empty journal. An existing
+    `personas.msgpack`, `personas.jsonl` or `personas.json` is imported on
+    first use and renamed to `*.migrated`, which can be deleted once the pack
+    is known good. Needs the optional msgpack package.
+    """
+
+    backend = 'mmap'
+    filename = 'personas.pack'
+
+    def __init__(self, data_dir, merge_ratio=0.1, merge_min_records=1000):
+        _require_msgpack()
+        self.path = os.path.join(data_dir, self.filename)
+        self.merge_ratio = merge_ratio
+        self.merge_min_records = merge_min_records
+        self._lock = threading.RLock()
+        self._journal = _PackJournal(data_dir)
+        self.file_lock = self._journal.file_lock
+        self._merge_lock = threading.Lock()
+        self._compacting = False
+        self._pack = None
+        self._pack_fingerprint = None
+        with self._lock, self.file_lock:
+            self._migrate(data_dir)
+            self._refresh()
+
+    def _migrate(self, data_dir):
+        if os.path.exists(self.path):
+            return
+        sources = [os.path.join(data_dir, name) for name in
+                   (MsgpackPersonaStore.filename, JSONLPersonaStore.filename,
+                    'personas.json')]
+        if any(os.path.exists(path) for path in sources):
+            # Brings a JSON Lines journal or JSON document into personas.msgpack
+            # first; that copy is only a step on the way and is removed after
+            intermediate = not os.path.exists(sources[0])
+            source = MsgpackPersonaStore(data_dir)
+            with source.file_lock:
+                self._write_pack(source.iter_all())
+                if intermediate:
+                    os.remove(source.path)
+                else:
+                    os.replace(source.path, source.path + '.migrated')
+            if intermediate:
+                os.remove(source.file_lock.path)
+        else:
+            self._write_pack(())
+
+    def _write_pack(self, personas):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        size = write_pack(tmp_path, personas)
+        os.replace(tmp_path, self.path)
+        if persona_metrics.enabled:
+            persona_metrics.inc('storage_written_bytes_total', size, backend=self.backend)
+
+    def _refresh(self):
+        """Pick up writes and merges made by other processes.
+
+        The journal is checked before the pack: a merge replaces the pack
+        first, so a new journal is never paired with an old pack.
+        """
+        journal = self._journal
+        journal._refresh()
+        fingerprint = _file_fingerprint(self.path)
+        if fingerprint != self._pack_fingerprint:
+            self._pack = PersonaPack(self.path)
+            self._pack_fingerprint = fingerprint
+            self._reset()
+        elif journal.generation != self._generation:
+            self._reset()
+        for persona_id in journal.touched[self._seen:]:
+            self._touch(persona_id)
+        self._seen = len(journal.touched)
+
+    def _reset(self):
+        self._shadowed = set()   # pack record numbers replaced or deleted by the journal
+        self._seen = 0
+        self._generation = self._journal.generation
+        self._search_index = None
+        self._journal_rows = None
+
+    def _touch(self, persona_id):
+        """Account for a journal record saving or deleting `persona_id`"""
+        found = self._pack.find(persona_id)
+        if found is not None:
+            self._shadowed.add(found[0])
+        self._journal_rows = None
+        if self._search_index is not None:
+            entry = self._journal._index.get(persona_id)
+            if entry is None:
+                self._search_index.remove(persona_id)
+            else:
+                self._search_index.add(self._journal._read(*entry))
+
+    def _pack_record(self, recno):
+        if persona_metrics.enabled:
+            persona_metrics.inc('storage_read_bytes_total', self._pack.slot(recno)[1],
+                                backend=self.backend)
+        return self._pack.record(recno)
+
+    def _exists(self, persona_id):
+        journal = self._journal
+        if persona_id in journal._index:
+            return True
+        return persona_id not in journal.deleted and self._pack.find(persona_id) is not None
+
+    def save(self, persona):
+        self.save_many([persona])
+
+    def save_many(self, personas):
+        self._journal._append(list(personas))
+        self._maybe_merge()
+
+    def load(self, persona_id):
+        with self._lock:
+            self._refresh()
+            journal = self._journal
+            entry = journal._index.get(persona_id)
+            if entry is not None:
+                return journal._read(*entry)
+            if persona_id in journal.deleted:
+                return None
+            found = self._pack.find(persona_id)
+            if found is None:
+                return None
+            if persona_metrics.enabled:
+                persona_metrics.inc('storage_read_bytes_total', self._pack.slot(found[0])[1],
+                                    backend=self.backend)
+            return found[1]
+
+    def load_all(self):
+        return {persona['id']: persona for persona in self.iter_all()}
+
+    def iter_all(self):
+        with self._lock, self.file_lock:
+            self._refresh()
+            snapshot = self._snapshot()
+        yield from self._iter_snapshot(*snapshot)
+
+    def _snapshot(self):
+        # Taken holding the lock file: the old pack stays mapped, and the open
+        # journal readable, even if a merge replaces them meanwhile
+        journal = open(self._journal.path, 'rb')
+        return self._pack, set(self._shadowed), sorted(self._journal._index.values()), journal
+
+    def _iter_snapshot(self, pack, shadowed, entries, journal):
+        with journal:
+            for recno in range(pack.count):
+                if recno not in shadowed:
+                    yield pack.record(recno)
+            yield from self._journal._read_entries(journal, entries)
+
+    def delete(self, persona_id):
+        return self.delete_many([persona_id]) == 1
+
+    def delete_many(self, persona_ids):
+        with self._lock, self.file_lock:
+            self._refresh()
+            tombstones = [{'_deleted': persona_id} for persona_id in set(persona_ids)
+                          if self._exists(persona_id)]
+            if tombstones:
+                self._journal._append(tombstones)
+        self._maybe_merge()
+        return len(tombstones)
+
+    def list(self, offset=0, limit=None):
+        with self._lock:
+            self._refresh()
+            pack = self._pack
+            # The live record at `offset` comes after every shadowed one at or before it
+            recno = offset
+            for shadowed in sorted(self._shadowed):
+                if shadowed > recno:
+                    break
+                recno += 1
+            summaries = []
+            while recno < pack.count and (limit is None or len(summaries) < limit):
+                if recno not in self._shadowed:
+                    summaries.append(persona_summary(self._pack_record(recno)))
+                recno += 1
+            if limit is None or len(summaries) < limit:
+                live = pack.count - len(self._shadowed)
+                skip = max(offset - live, 0)
+                end = None if limit is None else skip + limit - len(summaries)
+                journal = self._journal
+                entries = sorted(journal._index.values())[skip:end]
+                summaries.extend(persona_summary(journal._read(*entry)) for entry in entries)
+            return summaries
+
+    def count(self, **filters):
+        with self._lock:
+            self._refresh()
+            if not filters:
+                return self._pack.count - len(self._shadowed) + len(self._journal._index)
+            return self._current_index().count(**filters)
+
+    def search(self, email=None, city=None, name=None, created_after=None, created_before=None,
+               limit=None, after=None):
+        with self._lock:
+            self._refresh()
+            if email is None and city is None and name is None:
+                return self._search_created(created_after, created_before, limit, after)
+            return self._current_index().search(
+                email=email, city=city, name=name, created_after=created_after,
+                created_before=created_before, limit=limit, after=after)
+
+    def _search_created(self, created_after, created_before, limit, after):
+        """Page through a creation time range using the pack's creation table.
+
+        Only the records on the page (plus one) are decoded, so listing the
+        first page of a large pack needs no search index.
+        """
+        pack, shadowed = self._pack, self._shadowed
+        start = pack.created_position((created_after, '')) if created_after else 0
+        if after is not None:
+            start = max(start, pack.created_position(tuple(after)))
+        end = pack.created_position((created_before, '')) if created_before else pack.count
+
+        def pack_rows():
+            for position in range(start, end):
+                recno = pack.created_recno(position)
+                if recno not in shadowed:
+                    persona = pack.record(recno)
+                    yield (persona.get('created_at') or '', persona['id'], persona.get('name'),
+                           persona.get('email'))
+
+        journal_rows = [row for row in self._current_journal_rows()
+                        if (not created_after or row[0] >= created_after)
+                        and (not created_before or row[0] < created_before)
+                        and (after is None or row[:2] > tuple(after))]
+        wanted = None if limit is None else limit + 1
+        rows = list(itertools.islice(heapq.merge(pack_rows(), journal_rows), wanted))
+        more = limit is not None and len(rows) > limit
+        if more:
+            rows = rows[:limit]
+        summaries = [{'id': row[1], 'name': row[2], 'email': row[3], 'created_at': row[0]}
+                     for row in rows]
+        return summaries, (rows[-1][:2] if more else None)
+
+    def _current_journal_rows(self):
+        if self._journal_rows is None:
+            journal = self._journal
+            personas = (journal._read(*entry) for entry in journal._index.values())
+            self._journal_rows = sorted(
+                (persona.get('created_at') or '', persona['id'], persona.get('name'),
+                 persona.get('email')) for persona in personas)
+        return self._journal_rows
+
+    def _current_index(self):
+        if self._search_index is None:
+            # Built on first use, then kept current as journal records are applied
+            self._search_index = PersonaIndex(self.iter_all())
+        return self._search_index
+
+    def fingerprint(self):
+        return _file_fingerprint(self.path), self._journal.fingerprint()
+
+    def _maybe_merge(self):
+        with self._lock:
+            if (self._compacting or self._journal._records < self.merge_min_records
+                    or self._journal._records <= self.merge_ratio * self._pack.count):
+                return
+            self._compacting = True
+        threading.Thread(target=self._compact_in_background, daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except FileNotFoundError:
+            # The store's directory was removed before the merge got to run
+            pass
+
+    def compact(self):
+        """Merge the journal into a new pack and start an empty journal.
+
+        The new pack is written without holding the lock, so saves and deletes
+        carry on meanwhile; records appended during the merge are kept as the
+        new journal. Other processes pick up the new pack on their next call.
+        """
+        journal = self._journal
+        # One merge at a time per process; the temporary pack is named by PID
+        with self._merge_lock:
+            with self._lock, self.file_lock:
+                self._compacting = True
+                self._refresh()
+                pack_fingerprint, journal_inode = self._pack_fingerprint, journal._inode
+                copied_end = journal._end
+                snapshot = self._snapshot()
+            try:
+                tmp_path = f"{self.path}.{os.getpid()}.compact"
+                write_pack(tmp_path, self._iter_snapshot(*snapshot))
+                with self._lock, self.file_lock:
+                    self._refresh()
+                    if (self._pack_fingerprint != pack_fingerprint
+                            or journal._inode != journal_inode):
+                        # Another process merged meanwhile
+                        os.unlink(tmp_path)
+                        return
+                    with open(journal.path, 'rb') as f:
+                        f.seek(copied_end)
+                        tail = f.read(journal._end - copied_end)
+                    os.replace(tmp_path, self.path)
+                    _atomic_write(journal.path, lambda f: f.write(tail), binary=True)
+                    journal._reload()
+                    self._refresh()
+            finally:
+                self._compacting = False
+
+
+class CachedPersonaStore(PersonaStore):
+    """Read-through LRU cache in front of another store.
+
+    Up to `maxsize` loaded personas are kept in memory as PersonaRecords,
+    so each hit returns a fresh dict callers may modify. The cache is dropped
+    whenever the backing file's fingerprint (inode, mtime and size) changes,
+    so edits made by other processes are still picked up.
+    """
+
+    def __init__(self, store, maxsize=256):
+        self.store = store
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._fingerprint = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self.store.path
+
+    def _validate(self):
+        fingerprint = self.store.fingerprint()
+        if fingerprint != self._fingerprint:
+            self._entries.clear()
+            self._fingerprint = fingerprint
+
+    def invalidate(self):
+        """Forget every cached persona"""
+        with self._lock:
+            self._entries.clear()
+            self._fingerprint = None
+
+    def load(self, persona_id):
+        with self._lock:
+            self._validate()
+            persona = self._entries.get(persona_id)
+            if persona is not None:
+                self._entries.move_to_end(persona_id)
+                self.hits += 1
+                return persona.to_dict()
+            self.misses += 1
+            fingerprint = self._fingerprint
+
+        persona = self.store.load(persona_id)
+        if persona is None:
+            return None
+
+        with self._lock:
+            # Only cache if the file did not change while we were reading it
+            if fingerprint == self._fingerprint == self.store.fingerprint():
+                self._entries[persona_id] = PersonaRecord.from_dict(persona)
+                if len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return persona
+
+    def save(self, persona):
+        self.store.save(persona)
+        self.invalidate()
+
+    def delete(self, persona_id):
+        deleted = self.store.delete(persona_id)
+        self.invalidate()
+        return deleted
+
+    def save_many(self, personas):
+        self.store.save_many(personas)
+        self.invalidate()
+
+    def delete_many(self, persona_ids):
+        deleted = self.store.delete_many(persona_ids)
+        self.invalidate()
+        return deleted
+
+    def load_all(self):
+        return self.store.load_all()
+
+    def iter_all(self):
+        return self.store.iter_all()
+
+    def list(self, offset=0, limit=None):
+        return self.store.list(offset=offset, limit=limit)
+
+    def count(self, **filters):
+        return self.store.count(**filters)
+
+    def search(self, **query):
+        return self.store.search(**query)
+
+    def fingerprint(self):
+        return self.store.fingerprint()
+
+
+class InstrumentedPersonaStore(PersonaStore):
+    """Times every operation of another store into `persona_metrics`"""
+
+    OPERATIONS = ('save', 'load', 'load_all', 'delete', 'save_many', 'delete_many', 'list',
+                  'count', 'search')
+
+    def __init__(self, store):
+        self.store = store
+        backend = getattr(store, 'backend', type(store).__name__)
+        self._timed = {
+            operation: persona_metrics.timed(getattr(store, operation), 'storage_operation_seconds',
+                                             backend=backend, operation=operation)
+            for operation in self.OPERATIONS
+        }
+
+    def __getattr__(self, name):
+        # Backend specific extras such as JSONLPersonaStore.compact()
+        return getattr(self.store, name)
+
+    def save(self, persona):
+        return self._timed['save'](persona)
+
+    def load(self, persona_id):
+        return self._timed['load'](persona_id)
+
+    def load_all(self):
+        return self._timed['load_all']()
+
+    def delete(self, persona_id):
+        return self._timed['delete'](persona_id)
+
+    def save_many(self, personas):
+        return self._timed['save_many'](personas)
+
+    def delete_many(self, persona_ids):
+        return self._timed['delete_many'](persona_ids)
+
+    def iter_all(self):
+        return self.store.iter_all()
+
+    def list(self, offset=0, limit=None):
+        return self._timed['list'](offset=offset, limit=limit)
+
+    def count(self, **filters):
+        return self._timed['count'](**filters)
+
+    def search(self, **query):
+        return self._timed['search'](**query)
+
+    def fingerprint(self):
+        return self.store.fingerprint()
+
+
+STORAGE_BACKENDS = {
+    'json': JSONPersonaStore,
+    'jsonl': JSONLPersonaStore,
+    'mmap': MappedPersonaStore,
+    'msgpack': MsgpackPersonaStore,
+    'sqlite': SQLitePersonaStore,
+}
+
+
+def create_store(storage, data_dir, cache_size=0):
+    """Return a PersonaStore from a backend name or an existing store.
+
+    With a positive `cache_size` the store is wrapped in a CachedPersonaStore,
+    and while metrics are enabled its operations are timed.
+    """
+    if isinstance(storage, PersonaStore):
+        store = storage
+    else:
+        try:
+            backend = STORAGE_BACKENDS[storage]
+        except KeyError:
+            raise ValueError(f"Unknown storage backend: {storage!r}. "
+                             f"Choose from {', '.join(STORAGE_BACKENDS)}") from None
+        store = backend(data_dir)
+        if persona_metrics.enabled:
+            store = InstrumentedPersonaStore(store)
+    if cache_size and not isinstance(store, CachedPersonaStore):
+        store = CachedPersonaStore(store, maxsize=cache_size)
+        persona_metrics.track_cache(store)
+    return store
@@ -4,19 +4,18 @@ Simple launcher script for the Fake Data Generator
 """
 
 import sys
-import subprocess
-import os
-from pathlib import Path
+import importlib.util
+
+REQUIRED_MODULES = ['faker', 'flask', 'click', 'yaml', 'qrcode', 'tabulate']
 
 def check_dependencies():
-    """Check if required packages are installed"""
-    try:
-        import faker, flask, click, yaml, qrcode, tabulate
-        return True
-    except ImportError as e:
-        print(f"Missing dependencies: {e}")
+    """Check if required packages are installed, without importing them"""
+    missing = [name for name in REQUIRED_MODULES if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"Missing dependencies: {', '.join(missing)}")
         print("Please run: pip install -r requirements.txt")
         return False
+    return True
 
 def main():
     if not check_dependencies():
@@ -27,6 +26,7 @@ def main():
         print()
         print("Usage:")
         print("  python run.py web        # Start web server")
+        print("  python run.py asgi       # Start async web server")
         print("  python run.py cli        # Open CLI interface")
         print("  python run.py generate   # Quick generate")
         print("  python run.py help       # Show help")
@@ -48,6 +48,18 @@ def main():
         except KeyboardInterrupt:
             print("\n👋 Server stopped")
     
+    elif command == 'asgi':
+        try:
+            from asgi_server import serve
+        except ImportError as e:
+            print(f"Missing dependencies: {e}")
+            print("The async server needs: pip install starlette uvicorn")
+            return 1
+        try:
+            serve()
+        except KeyboardInterrupt:
+            print("\n👋 Server stopped")
+    
     elif command == 'cli':
         # Launch interactive CLI
         from cli import cli
@@ -80,6 +92,7 @@ def main():
         print("Web Interface:")
         print("  python run.py web")
         print("  Then visit http://localhost:5000")
+        print("  python run.py asgi       # async server, needs starlette and uvicorn")
         print()
         print("Command Line:")
         print("  python run.py cli generate --save")
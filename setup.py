@@ -30,8 +30,21 @@ setup(
     packages=find_packages(),
     py_modules=[
         'fake_data_generator',
+        'persona_fields',
+        'persona_storage',
+        'persona_index',
+        'persona_export',
+        'persona_binary',
+        'persona_pack',
+        'persona_columns',
+        'persona_pool',
+        'persona_records',
+        'persona_metrics',
         'cli',
+        'persona_daemon',
+        'daemon_client',
         'web_server',
+        'asgi_server',
         'run',
         'demo'
     ],
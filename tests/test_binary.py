@@ -0,0 +1,67 @@
+"""The versioned MessagePack persona format"""
+
+import io
+
+import pytest
+
+pytest.importorskip('msgpack')
+
+import msgpack  # noqa: E402
+
+from fake_data_generator import FakeDataGenerator  # noqa: E402
+from persona_binary import (  # noqa: E402
+    SCHEMA_VERSION, SCHEMAS, decode_persona, encode_persona, is_msgpack, read_msgpack,
+    write_msgpack,
+)
+
+
+@pytest.fixture(scope='module')
+def personas(tmp_path_factory):
+    generator = FakeDataGenerator(data_dir=str(tmp_path_factory.mktemp('binary')), cache_size=0)
+    return list(generator.generate_personas(5, seed=3))
+
+
+def test_generated_personas_use_the_current_schema(personas):
+    for persona in personas:
+        data = encode_persona(persona)
+        assert is_msgpack(data)
+        version, values = msgpack.unpackb(data, raw=False)
+        assert version == SCHEMA_VERSION and len(values) == len(SCHEMAS[SCHEMA_VERSION])
+        decoded = decode_persona(data)
+        assert decoded == persona and list(decoded) == list(persona)
+
+
+@pytest.mark.parametrize('change', [
+    lambda p: p.update(nickname='Ace'),             # extra key: kept alongside the array
+    lambda p: p.pop('favorite_color'),              # missing key: stored as a plain map
+    lambda p: p['address'].update(unit='4B'),       # reshaped group: plain map too
+])
+def test_personas_off_the_schema_round_trip(personas, change):
+    persona = {key: dict(value) if isinstance(value, dict) else value
+               for key, value in personas[0].items()}
+    change(persona)
+    assert decode_persona(encode_persona(persona)) == persona
+
+
+def test_version_one_records_keep_decoding(personas):
+    # Written by hand in the version 1 layout, as an older release would have
+    persona = personas[0]
+    values = [list(persona[key].values()) if isinstance(key, str) and isinstance(persona[key], dict)
+              else persona[key] for key in (f if isinstance(f, str) else f[0] for f in SCHEMAS[1])]
+    data = msgpack.packb([1, values, {'legacy': True}], use_bin_type=True)
+    assert decode_persona(data) == dict(persona, legacy=True)
+    assert decode_persona(msgpack.packb([1, {'id': 'x', 'name': 'Plain'}])) == {
+        'id': 'x', 'name': 'Plain'}
+
+
+@pytest.mark.parametrize('obj', [[SCHEMA_VERSION + 1, {}], [1, [1, 2, 3]], {'id': 'x'}, 'text'])
+def test_unknown_versions_and_garbage_are_rejected(obj):
+    with pytest.raises(ValueError):
+        decode_persona(msgpack.packb(obj))
+
+
+def test_streams_round_trip(personas):
+    out = io.BytesIO()
+    assert write_msgpack(personas, out) == len(personas)
+    out.seek(0)
+    assert list(read_msgpack(out)) == personas
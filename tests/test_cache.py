@@ -0,0 +1,85 @@
+"""The read-through persona cache: invalidation and LRU eviction"""
+
+import json
+import os
+
+import pytest
+
+from persona_storage import CachedPersonaStore, JSONPersonaStore
+
+
+def make_persona(n, name='Alice'):
+    return {'id': f"id-{n}", 'created_at': '2025-01-01T12:00:00', 'name': f"{name} {n}",
+            'email': f"user{n}@example.com"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CachedPersonaStore(JSONPersonaStore(str(tmp_path)), maxsize=3)
+    store.save_many(make_persona(n) for n in range(5))
+    return store
+
+
+def rewrite_in_place(path, personas, pad=0):
+    """Rewrite a JSON store's file behind its back, keeping its inode"""
+    text = json.dumps({p['id']: p for p in personas}, indent=2) + ' ' * pad
+    with open(path, 'r+') as f:
+        f.write(text)
+        f.truncate()
+
+
+def test_hits_return_copies(store):
+    assert store.load('id-0') == make_persona(0)
+    loaded = store.load('id-0')
+    loaded['name'] = 'Changed'
+    assert store.load('id-0') == make_persona(0)
+    assert (store.hits, store.misses) == (2, 1)
+
+
+def test_mtime_change_invalidates(store):
+    store.load('id-0')
+    stat = os.stat(store.path)
+    # Same length, so only the modification time tells the edit apart
+    rewrite_in_place(store.path, [make_persona(n, 'Bruce') for n in range(5)])
+    assert os.stat(store.path).st_size == stat.st_size
+    os.utime(store.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert store.load('id-0')['name'] == 'Bruce 0'
+    assert store.misses == 2
+
+
+def test_size_change_invalidates(store):
+    store.load('id-0')
+    stat = os.stat(store.path)
+    rewrite_in_place(store.path, [make_persona(n, 'Bruce') for n in range(5)], pad=10)
+    # Put the old modification time back, so only the size differs
+    os.utime(store.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert os.stat(store.path).st_ino == stat.st_ino
+
+    assert store.load('id-0')['name'] == 'Bruce 0'
+    assert store.misses == 2
+
+
+def test_writes_through_another_store_invalidate(store, tmp_path):
+    store.load('id-0')
+    JSONPersonaStore(str(tmp_path)).save(make_persona(0, 'Carla'))
+    assert store.load('id-0')['name'] == 'Carla 0'
+
+
+def test_least_recently_used_is_evicted(store):
+    for n in (0, 1, 2):
+        store.load(f"id-{n}")
+    store.load('id-0')  # id-1 is now the least recently used
+    store.load('id-3')
+    assert list(store._entries) == ['id-2', 'id-0', 'id-3']
+
+    misses = store.misses
+    store.load('id-0')
+    store.load('id-1')
+    assert store.misses == misses + 1
+    assert len(store._entries) == 3
+
+
+def test_missing_personas_are_not_cached(store):
+    assert store.load('missing') is None
+    assert 'missing' not in store._entries
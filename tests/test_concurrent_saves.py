@@ -0,0 +1,46 @@
+"""Saves and deletes from several processes at once must not lose each other's updates"""
+
+import multiprocessing
+
+import pytest
+
+from persona_storage import STORAGE_BACKENDS
+
+WRITERS = 4
+PER_WRITER = 40
+
+
+def persona(writer, n):
+    return {'id': f"writer{writer}-{n}", 'created_at': f"2025-01-01T00:{writer:02d}:{n % 60:02d}",
+            'name': f"Writer {writer} #{n}", 'email': f"w{writer}n{n}@example.com"}
+
+
+def writer(backend, data_dir, number, start):
+    """Save personas one at a time, deleting every third right after"""
+    store = STORAGE_BACKENDS[backend](data_dir)
+    start.wait()
+    for n in range(PER_WRITER):
+        store.save(persona(number, n))
+        if n % 3 == 0:
+            store.delete(persona(number, n)['id'])
+
+
+@pytest.mark.parametrize('backend', ['json', 'jsonl', 'sqlite'])
+def test_concurrent_writers_lose_nothing(backend, tmp_path):
+    data_dir = str(tmp_path)
+    STORAGE_BACKENDS[backend](data_dir)
+
+    context = multiprocessing.get_context('spawn')
+    start = context.Event()
+    processes = [context.Process(target=writer, args=(backend, data_dir, number, start))
+                 for number in range(WRITERS)]
+    for process in processes:
+        process.start()
+    start.set()
+    for process in processes:
+        process.join(120)
+    assert [process.exitcode for process in processes] == [0] * WRITERS
+
+    expected = {p['id']: p for p in (persona(w, n) for w in range(WRITERS)
+                                     for n in range(PER_WRITER) if n % 3)}
+    assert STORAGE_BACKENDS[backend](data_dir).load_all() == expected
@@ -0,0 +1,138 @@
+"""Batch commands: parsing, `cli.py batch` and the Unix socket daemon"""
+
+import io
+import json
+import socket
+import threading
+
+import pytest
+from click.testing import CliRunner
+
+import cli
+from daemon_client import DaemonClient
+from fake_data_generator import GeneratorRegistry
+from persona_daemon import PersonaDaemon, parse_command, run_batch
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return GeneratorRegistry(data_dir=str(tmp_path), cache_size=0)
+
+
+@pytest.fixture
+def generator_for(registry):
+    return lambda locale: registry.get(locale or 'en_US')
+
+
+def content(persona):
+    return {key: value for key, value in persona.items() if key not in ('id', 'created_at')}
+
+
+@pytest.mark.parametrize('line, request_', [
+    ('generate', {'command': 'generate'}),
+    ('seed "two words" --fields name,email --save',
+     {'command': 'seed', 'seed': 'two words', 'fields': 'name,email', 'save': True}),
+    ('list --limit 5 --offset 10', {'command': 'list', 'limit': '5', 'offset': '10'}),
+    ('show abc --locale de-DE', {'command': 'show', 'id': 'abc', 'locale': 'de-DE'}),
+    ('{"command": "seed", "seed": 42}', {'command': 'seed', 'seed': 42}),
+])
+def test_parse_command(line, request_):
+    assert parse_command(line) == request_
+
+
+@pytest.mark.parametrize('line, message', [
+    ('explode', 'Unknown command'),
+    ('seed', 'seed needs a seed'),
+    ('show a b', 'Too many arguments'),
+    ('generate --fields', 'needs a value'),
+    ('{not json', 'Expecting property name'),
+])
+def test_parse_errors(line, message):
+    with pytest.raises(ValueError, match=message):
+        parse_command(line)
+
+
+def run(lines, generator_for):
+    out = io.BytesIO()
+    count = run_batch(lines, out, generator_for)
+    results = [json.loads(line) for line in out.getvalue().decode().splitlines()]
+    assert len(results) == count
+    return results
+
+
+def test_batch_answers_every_line(registry, generator_for):
+    generator = registry.get('en_US')
+    saved, seeded, partial, listed, bad, missing, unknown = run([
+        '# comment lines and blank lines are skipped\n',
+        'generate --save\n',
+        '\n',
+        'seed abc\n',
+        '{"command": "seed", "seed": "abc", "fields": ["name"]}\n',
+        'list\n',
+        'generate --fields nosuchfield\n',
+        'show missing\n',
+        '{"command": "explode"}\n',
+    ], generator_for)
+
+    assert generator.load_persona(saved['saved_id'])['name'] == saved['name']
+    assert content(seeded) == content(generator.create_seeded_persona('abc'))
+    assert partial['name'] == seeded['name'] and 'email' not in partial
+    assert [summary['id'] for summary in listed] == [saved['saved_id']]
+    assert 'nosuchfield' in bad['error']
+    assert missing == {'error': 'Persona not found'}
+    assert 'Unknown command' in unknown['error']
+
+
+def test_batch_show_regenerate_and_delete(registry, generator_for):
+    persona = registry.get('en_US').generate_persona(seed=5)
+    registry.get('en_US').save_persona(persona)
+    shown, regenerated, deleted, again = run([
+        f"show {persona['id']}", f"regenerate {persona['id']} --fields email",
+        f"delete {persona['id']}", f"delete {persona['id']}",
+    ], generator_for)
+    assert shown == persona and regenerated['email'] == persona['email']
+    assert deleted == {'success': True} and again == {'error': 'Persona not found'}
+
+
+def test_locales(generator_for):
+    seeded, unknown = run(['seed abc --locale de_DE', 'seed abc --locale xx_XX'], generator_for)
+    assert seeded['seed_string'] == 'abc'
+    assert 'Unknown locale' in unknown['error']
+
+
+def test_cli_batch(registry, monkeypatch):
+    monkeypatch.setattr(cli, 'get_generator', lambda locale, storage: registry.get(locale))
+    runner = CliRunner()
+
+    result = runner.invoke(cli.cli, ['batch'], input='seed abc\nping\nexplode\n')
+    assert result.exit_code == 0, result.output
+    seeded, ping, error = [json.loads(line) for line in result.output.splitlines()]
+    assert seeded['seed_string'] == 'abc' and ping == {'ok': True} and 'error' in error
+
+    result = runner.invoke(cli.cli, ['batch', '--seeds', '--fields', 'name'], input='abc\n\nxyz\n')
+    assert result.exit_code == 0, result.output
+    personas = [json.loads(line) for line in result.output.splitlines()]
+    assert [p['seed_string'] for p in personas] == ['abc', 'xyz']
+    assert personas[0]['name'] == seeded['name'] and 'email' not in personas[0]
+
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason="needs Unix domain sockets")
+def test_daemon(generator_for, tmp_path):
+    server = PersonaDaemon(generator_for, str(tmp_path / 'd.sock'))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with DaemonClient(server.path) as first, DaemonClient(server.path) as second:
+            assert first.request('ping') == {'ok': True}
+            persona = first.request('seed', seed='abc')
+            assert content(second.request('seed', seed='abc')) == content(persona)
+            assert 'Unknown command' in json.loads(second.send_line('explode'))['error']
+            # The connection stays usable after an error
+            assert json.loads(second.send_line('ping')) == {'ok': True}
+
+        with pytest.raises(OSError, match='already running'):
+            PersonaDaemon(generator_for, server.path)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert not (tmp_path / 'd.sock').exists()
@@ -0,0 +1,77 @@
+"""Streaming exports: CSV quoting, JSON Lines, YAML and the flattened schema"""
+
+import csv
+import io
+import json
+
+import pytest
+
+from fake_data_generator import FakeDataGenerator
+from persona_export import PERSONA_COLUMNS, export_personas, iter_export, persona_row
+from persona_records import PersonaRecord
+
+
+@pytest.fixture
+def personas(tmp_path):
+    generator = FakeDataGenerator(data_dir=str(tmp_path), cache_size=0)
+    personas = list(generator.generate_personas(5, seed=3))
+    personas[0]['address']['street'] = '1 Main St, Apt "B"\nBuilding 2'
+    personas[0]['address']['full_address'] = '1 Main St\nSpringfield, IL 62704'
+    return personas
+
+
+def export(personas, format):
+    out = io.StringIO()
+    assert export_personas(personas, out, format) == len(personas)
+    return out.getvalue()
+
+
+def test_csv_quotes_multi_line_addresses(personas):
+    text = export(personas, 'csv')
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[0] == PERSONA_COLUMNS
+    assert len(rows) == len(personas) + 1
+    row = dict(zip(rows[0], rows[1]))
+    assert row['address_street'] == '1 Main St, Apt "B"\nBuilding 2'
+    assert row['address_full_address'] == '1 Main St\nSpringfield, IL 62704'
+    assert row['seed'] == str(personas[0]['seed'])
+
+
+def test_flattened_schema(personas):
+    row = dict(zip(PERSONA_COLUMNS, persona_row(personas[1])))
+    assert row['address_city'] == personas[1]['address']['city']
+    assert row['credit_card_number'] == personas[1]['credit_card']['number']
+    assert row['social_media_twitter'] == personas[1]['social_media']['twitter']
+    # Fields a persona lacks are empty, and the columns never move
+    partial = {'id': 'partial', 'email': 'a@example.com'}
+    assert persona_row(partial) == [partial.get(column) for column in PERSONA_COLUMNS]
+    rows = list(csv.reader(io.StringIO(export([partial], 'csv'))))
+    assert rows[1] == [partial.get(column, '') for column in PERSONA_COLUMNS]
+
+
+def test_jsonl(personas):
+    lines = export(personas, 'jsonl').splitlines()
+    assert [json.loads(line) for line in lines] == personas
+
+
+def test_yaml(personas):
+    yaml = pytest.importorskip('yaml')
+    assert list(yaml.safe_load_all(export(personas, 'yaml'))) == personas
+
+
+def test_records_export_like_dicts(personas):
+    records = [PersonaRecord.from_dict(p) for p in personas]
+    for format in ('csv', 'jsonl'):
+        assert export(records, format) == export(personas, format)
+
+
+def test_chunks_join_to_the_whole_export(personas):
+    for format in ('csv', 'jsonl'):
+        chunks = list(iter_export(personas, format, batch_size=2))
+        assert len(chunks) == 3
+        assert ''.join(chunks) == export(personas, format)
+
+
+def test_unknown_format(personas):
+    with pytest.raises(ValueError, match='Unknown export format'):
+        export_personas(personas, io.StringIO(), 'xml')
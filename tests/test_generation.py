@@ -0,0 +1,99 @@
+"""Seeded generation must give the same personas however they are produced"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from fake_data_generator import FakeDataGenerator, string_to_seed
+from persona_fields import BatchContext, derive_seed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def content(persona):
+    """A persona without the fields that differ on every call"""
+    return {key: value for key, value in persona.items() if key not in ('id', 'created_at')}
+
+
+@pytest.fixture
+def generator(tmp_path):
+    return FakeDataGenerator(data_dir=str(tmp_path), cache_size=0)
+
+
+def test_same_seed_same_persona(generator, tmp_path):
+    first = generator.generate_persona(seed=1234)
+    assert content(generator.generate_persona(seed=1234)) == content(first)
+    other = FakeDataGenerator(data_dir=str(tmp_path), cache_size=0)
+    assert content(other.generate_persona(seed=1234)) == content(first)
+    assert content(generator.generate_persona(seed=1235)) != content(first)
+
+
+def test_unseeded_generation_leaves_seeded_output_alone(generator):
+    first = generator.generate_persona(seed=99)
+    generator.generate_persona()
+    list(generator.generate_personas(5))
+    assert content(generator.generate_persona(seed=99)) == content(first)
+
+
+def test_batches_match_single_personas(generator):
+    batch = list(generator.generate_personas(12, seed='fixtures', batch_size=5))
+    assert [p['seed'] for p in batch] == [derive_seed('fixtures', i) for i in range(12)]
+    for persona in batch:
+        assert content(generator.generate_persona(seed=persona['seed'])) == content(persona)
+
+    shard = list(generator.generate_personas(4, seed='fixtures', start=8))
+    assert [content(p) for p in shard] == [content(p) for p in batch[8:]]
+
+
+
+def test_parallel_output_does_not_depend_on_workers(generator):
+    expected = [content(p) for p in generator.generate_personas(23, seed='parallel')]
+    for workers in (1, 2, 3):
+        personas = generator.generate_personas_parallel(23, seed='parallel', workers=workers,
+                                                        shard_size=5)
+        assert [content(p) for p in personas] == expected, workers
+
+    partial = generator.generate_personas_parallel(7, seed='parallel', workers=2, shard_size=3,
+                                                   fields='name,address.city')
+    assert [content(p) for p in partial] == [
+        content(p) for p in generator.generate_personas(7, seed='parallel', fields='name,address.city')]
+
+    unseeded = list(generator.generate_personas_parallel(9, workers=2, shard_size=4))
+    assert len({p['id'] for p in unseeded}) == 9
+
+
+def test_batches_put_providers_back(generator):
+    """Providers draw through BatchContext only while a batch is running"""
+    def patched(fake):
+        return [p for p in fake.get_providers() if 'random_element' in vars(p)]
+
+    fake = generator.fake
+    with BatchContext(fake, generator._element_table) as ctx:
+        assert patched(fake) and all(p.random_element == ctx.random_element
+                                     for p in patched(fake))
+    assert not patched(fake)
+
+    list(generator.generate_personas(3, seed=1))
+    generator.generate_persona(seed=1)
+    generator.generate_fields(1, 'name')
+    assert generator._idle_fakers and not any(map(patched, generator._idle_fakers))
+
+
+def test_seed_strings(generator):
+    persona = generator.create_seeded_persona('test')
+    assert persona['seed'] == string_to_seed('test') and persona['seed_string'] == 'test'
+    assert content(generator.create_seeded_persona('test')) == content(persona)
+
+
+@pytest.mark.parametrize('hash_seed', ['1', '2'])
+def test_seeded_output_is_the_same_in_a_new_process(generator, hash_seed):
+    script = ("import json; from fake_data_generator import FakeDataGenerator; "
+              "print(json.dumps(FakeDataGenerator(data_dir=%r).generate_persona(seed=2024)))"
+              % os.path.join(generator.data_dir, 'child'))
+    env = dict(os.environ, PYTHONHASHSEED=hash_seed)
+    output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, check=True,
+                            stdout=subprocess.PIPE).stdout
+    assert content(json.loads(output)) == content(generator.generate_persona(seed=2024))
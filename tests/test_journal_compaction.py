@@ -0,0 +1,81 @@
+"""Journals compacted by one process while others keep reading them"""
+
+import multiprocessing
+import sys
+import time
+import traceback
+
+import pytest
+
+from persona_storage import STORAGE_BACKENDS
+
+IDS = [f"persona-{n}" for n in range(200)]
+# Deleted and saved again by the compactor, so briefly missing
+CHURNED = set(IDS[:10])
+DURATION = 2.0
+
+pytestmark = pytest.mark.skipif(
+    sys.platform == 'win32', reason="open journals cannot be replaced on Windows")
+
+
+def persona(persona_id, version):
+    return {'id': persona_id, 'created_at': f"2025-01-01T00:00:{version % 60:02d}",
+            'name': f"Name {persona_id}", 'email': f"{persona_id}@example.com",
+            'version': version, 'padding': 'x' * (version % 97)}
+
+
+def compactor(backend, data_dir):
+    """Rewrite every persona with a new length and compact, over and over"""
+    store = STORAGE_BACKENDS[backend](data_dir)
+    version = 0
+    deadline = time.monotonic() + DURATION
+    while time.monotonic() < deadline:
+        version += 1
+        store.save_many(persona(persona_id, version) for persona_id in IDS)
+        store.delete_many(CHURNED)
+        store.save_many(persona(persona_id, version) for persona_id in CHURNED)
+        store.compact()
+
+
+def reader(backend, data_dir, errors):
+    store = STORAGE_BACKENDS[backend](data_dir)
+    deadline = time.monotonic() + DURATION
+    checks = 0
+    try:
+        while time.monotonic() < deadline:
+            for persona_id in IDS[::7]:
+                loaded = store.load(persona_id)
+                if persona_id not in CHURNED or loaded is not None:
+                    assert loaded['id'] == persona_id, (persona_id, loaded)
+            personas = store.load_all()
+            assert set(IDS) - CHURNED <= set(personas) <= set(IDS)
+            assert all(persona_id == p['id'] for persona_id, p in personas.items())
+            ids = [p['id'] for p in store.iter_all()]
+            assert len(ids) == len(set(ids)) and set(IDS) - CHURNED <= set(ids) <= set(IDS)
+            checks += 1
+        assert checks, "reader never completed a pass"
+    except Exception:
+        errors.put(traceback.format_exc())
+
+
+@pytest.mark.parametrize('backend', ['jsonl', 'msgpack', 'mmap'])
+def test_readers_survive_compaction_in_another_process(backend, tmp_path):
+    if backend != 'jsonl':
+        pytest.importorskip('msgpack')
+    data_dir = str(tmp_path)
+    store = STORAGE_BACKENDS[backend](data_dir)
+    store.save_many(persona(persona_id, 0) for persona_id in IDS)
+
+    context = multiprocessing.get_context('spawn')
+    errors = context.Queue()
+    processes = [context.Process(target=compactor, args=(backend, data_dir))]
+    processes += [context.Process(target=reader, args=(backend, data_dir, errors))
+                  for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+    assert [process.exitcode for process in processes] == [0] * len(processes)
+    assert errors.empty(), errors.get()
+
+    assert sorted(store.load_all()) == sorted(IDS)
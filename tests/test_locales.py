@@ -0,0 +1,36 @@
+"""Every locale Faker ships must produce full personas, plain, seeded and columnar"""
+
+import warnings
+
+import pytest
+from faker.config import AVAILABLE_LOCALES
+
+from fake_data_generator import FakeDataGenerator
+from persona_fields import PERSONA_FIELDS, persona_values
+
+with warnings.catch_warnings():
+    # fr_QC warns that it is deprecated each time it loads
+    warnings.simplefilter('ignore')
+    LOCALES = sorted(AVAILABLE_LOCALES)
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+@pytest.mark.parametrize('locale', LOCALES)
+def test_locale_generates_every_field(locale, tmp_path):
+    generator = FakeDataGenerator(locale=locale, data_dir=str(tmp_path), cache_size=0)
+
+    persona = generator.generate_persona()
+    assert set(persona_values(persona)) == set(PERSONA_FIELDS)
+    assert persona['name'] and persona['email']
+
+    assert generator.create_seeded_persona('locale-check')['seed']
+    assert len(list(generator.generate_personas(3, seed=1))) == 3
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+@pytest.mark.parametrize('locale', LOCALES)
+def test_locale_generates_columns(locale, tmp_path):
+    pytest.importorskip('numpy')
+    generator = FakeDataGenerator(locale=locale, data_dir=str(tmp_path), cache_size=0)
+    columns = generator.generate_columns(3, seed=1, pool_size=10)
+    assert all(len(column) == 3 for column in columns.values())
@@ -0,0 +1,119 @@
+"""Metrics: what generation and storage record, /metrics and `cli.py --profile`"""
+
+import re
+
+import pytest
+from click.testing import CliRunner
+
+import cli
+import persona_metrics
+import web_server
+from fake_data_generator import GeneratorRegistry
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    """Record metrics for one test, starting from nothing"""
+    monkeypatch.setattr(persona_metrics, 'enabled', False)
+    persona_metrics.reset()
+    yield persona_metrics
+    persona_metrics.reset()
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return GeneratorRegistry(data_dir=str(tmp_path), cache_size=16)
+
+
+def histogram(name, **labels):
+    return persona_metrics.snapshot()['histograms'].get((name, tuple(sorted(labels.items()))))
+
+
+def test_disabled_records_nothing(metrics, registry):
+    generator = registry.get('en_US')
+    generator.save_persona(generator.generate_persona(seed=1))
+    assert persona_metrics.snapshot()['histograms'] == {}
+    assert '_seconds' not in persona_metrics.render_prometheus()
+
+
+def cache_requests():
+    counters = persona_metrics.snapshot()['counters']
+    return [counters.get(('persona_cache_requests_total', (('result', result),)), 0)
+            for result in ('hit', 'miss')]
+
+
+def test_generation_and_storage_are_recorded(metrics, registry):
+    metrics.enable()
+    generator = registry.get('en_US')
+    # Caches count whether or not metrics are enabled, and other tests' may still be alive
+    hits, misses = cache_requests()
+    personas = list(generator.generate_personas(3, seed=1))
+    generator.save_personas(personas)
+    generator.load_persona(personas[0]['id'])
+    generator.load_persona(personas[0]['id'])
+
+    assert histogram('persona_build_seconds')['count'] == 3
+    assert histogram('persona_field_seconds', field='email')['count'] == 3
+    assert histogram('storage_operation_seconds', backend='json', operation='save_many')['count'] == 1
+    assert histogram('storage_operation_seconds', backend='json', operation='load')['count'] == 1
+    assert cache_requests() == [hits + 1, misses + 1]
+
+
+def test_prometheus_format(metrics):
+    metrics.enable()
+    for seconds in (0.00001, 0.003, 20):
+        persona_metrics.observe('persona_export_seconds', seconds, format='csv')
+    persona_metrics.inc('storage_written_bytes_total', 10, backend='json')
+    text = persona_metrics.render_prometheus()
+
+    assert '# TYPE persona_export_seconds histogram' in text
+    assert '# TYPE storage_written_bytes_total counter' in text
+    assert 'storage_written_bytes_total{backend="json"} 10' in text
+    buckets = re.findall(r'persona_export_seconds_bucket\{format="csv",le="([^"]+)"\} (\d+)', text)
+    assert buckets[0] == ('1e-05', '1') and buckets[-1] == ('+Inf', '3')
+    counts = [int(count) for _, count in buckets]
+    assert counts == sorted(counts) and ('0.005', '2') in buckets
+    assert 'persona_export_seconds_count{format="csv"} 3' in text
+
+
+@pytest.mark.parametrize('server', ['flask', 'asgi'])
+def test_metrics_endpoint(server, metrics, registry, monkeypatch):
+    metrics.enable()
+    modules = [web_server]
+    if server == 'asgi':
+        pytest.importorskip('starlette')
+        pytest.importorskip('httpx')
+        import asgi_server
+        from starlette.testclient import TestClient
+        modules.append(asgi_server)
+        client = TestClient(asgi_server.app)
+    else:
+        client = web_server.app.test_client()
+    generator = registry.get('en_US')
+    for module in modules:
+        monkeypatch.setattr(module, 'generators', registry)
+        monkeypatch.setattr(module, 'generator', generator)
+
+    assert client.get('/api/personas/missing-id').status_code == 404
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    text = response.text
+    assert re.search(r'http_request_seconds_count\{method="GET",route="/api/personas/[^"]*",'
+                     r'status="404"\} 1', text)
+    assert 'missing-id' not in text
+    assert 'storage_operation_seconds_count{backend="json",operation="load"} 1' in text
+
+
+def test_cli_profile(metrics, registry, monkeypatch):
+    monkeypatch.setattr(cli, 'get_generator', lambda locale, storage: registry.get(locale))
+    result = CliRunner().invoke(cli.cli, ['--profile', 'generate', '--seed', 'abc', '--save'])
+    assert result.exit_code == 0, result.output
+    for section in ('Persona builds', 'Fields', 'Storage'):
+        assert section in result.stderr
+    assert 'Persona builds' not in result.stdout
+
+    metrics.reset()
+    metrics.disable()
+    result = CliRunner().invoke(cli.cli, ['generate', '--seed', 'abc'])
+    assert result.exit_code == 0 and result.stderr == ''
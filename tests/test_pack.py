@@ -0,0 +1,48 @@
+"""Pack files: written once, read through a memory map"""
+
+import os
+
+import pytest
+
+pytest.importorskip('msgpack')
+
+from fake_data_generator import FakeDataGenerator  # noqa: E402
+from persona_pack import LAYOUT_VERSION, CorruptPackError, PersonaPack, write_pack  # noqa: E402
+from persona_storage import STORAGE_BACKENDS, MappedPersonaStore  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def personas(tmp_path_factory):
+    generator = FakeDataGenerator(data_dir=str(tmp_path_factory.mktemp('pack')), cache_size=0)
+    return list(generator.generate_personas(5, seed=3))
+
+
+def test_pack_round_trip_and_layout_version(personas, tmp_path):
+    path = str(tmp_path / 'personas.pack')
+    replaced = dict(personas[0], name='Replaced')
+    write_pack(path, personas + [replaced])
+    pack = PersonaPack(path)
+    assert len(pack) == len(personas)
+    assert pack.find(personas[0]['id']) == (len(personas) - 1, replaced)
+    assert [record for _, record in pack.iter_records()] == personas[1:] + [replaced]
+    pack.close()
+
+    with open(path, 'r+b') as f:
+        f.seek(8)
+        f.write((LAYOUT_VERSION + 1).to_bytes(4, 'little'))
+    with pytest.raises(CorruptPackError, match='layout version'):
+        PersonaPack(path)
+
+
+@pytest.mark.parametrize('source', ['json', 'jsonl', 'msgpack'])
+def test_migration_keeps_only_the_original(personas, source, tmp_path):
+    STORAGE_BACKENDS[source](str(tmp_path)).save_many(personas)
+    original = STORAGE_BACKENDS[source](str(tmp_path)).path
+
+    store = MappedPersonaStore(str(tmp_path))
+    assert store.load_all() == {p['id']: p for p in personas}
+    data_files = sorted(name for name in os.listdir(tmp_path) if not name.endswith('.lock'))
+    assert data_files == sorted([os.path.basename(original) + '.migrated',
+                                 'personas.pack', 'personas.pack.journal'])
+    if source != 'msgpack':
+        assert not (tmp_path / 'personas.msgpack.lock').exists()
@@ -0,0 +1,85 @@
+"""Personas saved with only some fields are filled in by the readers that need them all"""
+
+import pytest
+from click.testing import CliRunner
+
+import cli
+import web_server
+from fake_data_generator import GeneratorRegistry
+from persona_fields import PERSONA_FIELDS, persona_values
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return GeneratorRegistry(data_dir=str(tmp_path), cache_size=0)
+
+
+@pytest.fixture
+def generator(registry):
+    return registry.get('en_US')
+
+
+@pytest.fixture
+def partial(generator):
+    persona = generator.generate_persona(seed=7, fields='email,address.city')
+    generator.save_persona(persona)
+    return persona
+
+
+def test_complete_persona_fills_fields_from_the_seed(generator, partial):
+    complete = generator.complete_persona(partial)
+    assert set(persona_values(complete)) == set(PERSONA_FIELDS)
+    full = generator.generate_persona(seed=7)
+    assert persona_values(complete) == persona_values(full)
+    # Neither the argument nor the stored persona changes
+    assert 'name' not in partial and 'street' not in partial['address']
+    assert generator.load_persona(partial['id']) == partial
+    assert generator.load_persona(partial['id'], complete=True) == complete
+
+
+def test_complete_persona_without_seed(generator):
+    persona = {'id': 'imported', 'name': 'Ada Lovelace', 'address': {'city': 'London'}}
+    complete = generator.complete_persona(persona)
+    assert set(persona_values(complete)) == set(PERSONA_FIELDS)
+    assert complete['name'] == 'Ada Lovelace' and complete['address']['city'] == 'London'
+
+
+def test_qr_export(generator, partial):
+    pytest.importorskip('qrcode')
+    assert generator.export_persona(partial['id'], 'qr').startswith('data:image/png;base64,')
+
+
+@pytest.mark.parametrize('server', ['flask', 'asgi'])
+def test_fill_form_with_a_partial_persona(server, registry, generator, partial, monkeypatch):
+    modules = [web_server]
+    if server == 'asgi':
+        pytest.importorskip('starlette')
+        pytest.importorskip('httpx')
+        import asgi_server
+        from starlette.testclient import TestClient
+        modules.append(asgi_server)
+        client = TestClient(asgi_server.app)
+    else:
+        client = web_server.app.test_client()
+    for module in modules:
+        monkeypatch.setattr(module, 'generators', registry)
+        monkeypatch.setattr(module, 'generator', generator)
+
+    response = client.post('/api/fill-form', json={'persona_id': partial['id']})
+    assert response.status_code == 200
+    body = response.get_json() if hasattr(response, 'get_json') else response.json()
+    full = generator.generate_persona(seed=7)
+    assert body['email'] == partial['email'] and body['city'] == partial['address']['city']
+    assert body['firstName'] == full['first_name'] and body['creditCard'] == full['credit_card']['number']
+
+
+def test_cli_show_and_regenerate(registry, generator, partial, monkeypatch):
+    monkeypatch.setattr(cli, 'get_generator', lambda locale, storage: registry.get(locale))
+    runner = CliRunner()
+
+    result = runner.invoke(cli.cli, ['show', partial['id']])
+    assert result.exit_code == 0, result.output
+    assert generator.generate_persona(seed=7)['name'] in result.output
+
+    result = runner.invoke(cli.cli, ['regenerate', partial['id'], '--fields', 'email'])
+    assert result.exit_code == 0, result.output
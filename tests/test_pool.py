@@ -0,0 +1,68 @@
+"""The warm persona pool: refilling in the background and its hit/miss stats"""
+
+import time
+
+import pytest
+
+from fake_data_generator import FakeDataGenerator
+from persona_pool import PersonaPool
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def generator(tmp_path):
+    return FakeDataGenerator(data_dir=str(tmp_path), cache_size=0)
+
+
+@pytest.fixture
+def pool(generator):
+    pool = PersonaPool(generator, size=6, low_watermark=3, fields='name,email')
+    yield pool
+    pool.close()
+
+
+def test_fills_to_size(pool):
+    wait_for(lambda: len(pool) == 6)
+    stats = pool.stats()
+    assert stats['available'] == 6 and stats['generated'] == 6
+    assert stats['hits'] == stats['misses'] == 0 and stats['hit_rate'] is None
+
+
+def test_refills_below_the_low_watermark(pool):
+    wait_for(lambda: len(pool) == 6)
+    personas = [pool.get() for _ in range(3)]
+    assert all(set(p) >= {'id', 'name', 'email'} and 'phone' not in p for p in personas)
+    assert len({p['id'] for p in personas}) == 3
+    # Still at the low watermark, so nothing is generated yet
+    time.sleep(0.1)
+    assert len(pool) == 3 and pool.generated == 6
+
+    pool.get()
+    wait_for(lambda: len(pool) == 6)
+    assert pool.generated == 10
+    assert pool.stats()['hits'] == 4
+
+
+def test_misses_when_empty(generator):
+    pool = PersonaPool(generator, size=2, refill_rate=1)
+    try:
+        wait_for(lambda: len(pool) == 1)
+        assert pool.pop() is not None
+        assert pool.pop() is None
+        assert pool.get()['name']
+        stats = pool.stats()
+        assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 2, 1 / 3)
+    finally:
+        pool.close()
+
+
+@pytest.mark.parametrize('size, low_watermark', [(0, None), (4, 4), (4, -1)])
+def test_bad_settings(generator, size, low_watermark):
+    with pytest.raises(ValueError):
+        PersonaPool(generator, size=size, low_watermark=low_watermark)
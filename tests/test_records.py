@@ -0,0 +1,76 @@
+"""PersonaRecord must give back exactly the persona it was built from"""
+
+import pickle
+
+import pytest
+
+import persona_records
+from fake_data_generator import FakeDataGenerator
+from persona_records import PersonaRecord, as_dict, to_records
+
+
+@pytest.fixture
+def generator(tmp_path):
+    return FakeDataGenerator(data_dir=str(tmp_path), cache_size=0)
+
+
+def assert_round_trip(persona):
+    record = PersonaRecord.from_dict(persona)
+    rebuilt = record.to_dict()
+    assert rebuilt == persona
+    # Key order too, at every level
+    assert list(rebuilt) == list(persona)
+    for key, value in persona.items():
+        if isinstance(value, dict):
+            assert list(rebuilt[key]) == list(value)
+    return record
+
+
+def test_generated_personas(generator):
+    for persona in generator.generate_personas(20, seed='records'):
+        record = assert_round_trip(persona)
+        assert record.id == persona['id'] and record == persona
+        assert record['address'] == persona['address'] and record.get('missing', 1) == 1
+
+
+def test_partial_and_odd_personas():
+    assert_round_trip({})
+    assert_round_trip({'name': 'No ID'})
+    assert_round_trip({
+        'id': 'odd', 'seed': None, 'name': '', 'age': 41.5, 'sex': 'X',
+        'blood_group': None, 'email': 'a\0b@example.com', 'tags': ['a', 'b'],
+        'address': {}, 'credit_card': {'expire': 1234, 'number': '4111'},
+        'height': '180 cm', 'nested': {'deep': {'deeper': 1}},
+    })
+    assert PersonaRecord.from_dict({'name': 'No ID'}).id is None
+
+
+def test_records_are_independent_copies():
+    persona = {'id': 'copy', 'address': {'city': 'Springfield'}}
+    record = PersonaRecord.from_dict(persona)
+    persona['address']['city'] = 'Changed'
+    first = record.to_dict()
+    first['address']['city'] = 'Also changed'
+    assert record.to_dict() == {'id': 'copy', 'address': {'city': 'Springfield'}}
+
+
+def test_full_category_tables_store_values_uncoded(monkeypatch):
+    monkeypatch.setattr(persona_records, 'MAX_CODES', 0)
+    assert_round_trip({'id': 'full', 'favorite_color': 'a colour never seen before'})
+
+
+def test_pickle_and_helpers(generator):
+    persona = generator.generate_persona(seed=5)
+    record = PersonaRecord.from_dict(persona)
+    assert pickle.loads(pickle.dumps(record)) == persona
+    assert as_dict(record) == persona and as_dict(persona) is persona
+    assert [r.to_dict() for r in to_records([persona, record])] == [persona, persona]
+
+
+def test_compact_generation_matches_dicts(generator):
+    records = list(generator.generate_personas(5, seed='records', compact=True))
+    personas = list(generator.generate_personas(5, seed='records'))
+    assert all(type(record) is PersonaRecord for record in records)
+    content = [{k: v for k, v in p.items() if k not in ('id', 'created_at')} for p in personas]
+    assert [{k: v for k, v in r.to_dict().items() if k not in ('id', 'created_at')}
+            for r in records] == content
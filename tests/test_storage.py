@@ -0,0 +1,132 @@
+"""Every storage backend must behave the same through the PersonaStore interface"""
+
+import pytest
+
+from persona_storage import STORAGE_BACKENDS, create_store
+
+
+def make_persona(n):
+    return {
+        'id': f"id-{n:03d}",
+        # Pairs of personas share a timestamp, so paging has ties to break by ID
+        'created_at': f"2025-01-{n // 2 % 28 + 1:02d}T12:00:00",
+        'name': ('Alice', 'Bob', 'Carla', 'Alfred')[n % 4] + f" Smith{n}",
+        'email': f"user{n}@example.com",
+        'address': {'city': ('Springfield', 'Shelbyville', 'Ogdenville')[n % 3]},
+        'seed': n,
+    }
+
+
+PERSONAS = [make_persona(n) for n in range(60)]
+
+
+@pytest.fixture(params=sorted(STORAGE_BACKENDS))
+def backend(request):
+    if request.param in ('msgpack', 'mmap'):
+        pytest.importorskip('msgpack')
+    return request.param
+
+
+@pytest.fixture
+def store(backend, tmp_path):
+    store = create_store(backend, str(tmp_path))
+    store.save_many(PERSONAS)
+    return store
+
+
+def page_through(store, limit, **filters):
+    """Collect every search match by following cursors `limit` at a time"""
+    ids, after = [], None
+    while True:
+        summaries, after = store.search(limit=limit, after=after, **filters)
+        assert len(summaries) <= limit
+        ids.extend(summary['id'] for summary in summaries)
+        if after is None:
+            return ids
+
+
+def expected_ids(match):
+    ordered = sorted(PERSONAS, key=lambda p: (p['created_at'], p['id']))
+    return [p['id'] for p in ordered if match(p)]
+
+
+def test_save_load_and_overwrite(store, backend, tmp_path):
+    assert store.load('id-007') == PERSONAS[7]
+    assert store.load('missing') is None
+
+    changed = dict(PERSONAS[7], name='Changed Name')
+    store.save(changed)
+    assert store.load('id-007') == changed
+    assert store.count() == len(PERSONAS)
+
+    # A new store on the same directory sees the same data
+    assert create_store(backend, str(tmp_path)).load('id-007') == changed
+
+
+def test_delete(store):
+    assert store.delete('id-003') is True
+    assert store.delete('id-003') is False
+    assert store.load('id-003') is None
+    assert store.delete_many(['id-004', 'id-005', 'id-005', 'missing']) == 2
+    assert store.count() == len(PERSONAS) - 3
+    assert not {'id-003', 'id-004', 'id-005'} & set(store.load_all())
+
+
+def test_load_all_iter_all_and_list(store):
+    assert store.load_all() == {p['id']: p for p in PERSONAS}
+    assert sorted(p['id'] for p in store.iter_all()) == sorted(p['id'] for p in PERSONAS)
+
+    summaries = store.list(offset=10, limit=5)
+    assert [s['id'] for s in summaries] == [p['id'] for p in PERSONAS[10:15]]
+    assert summaries[0] == {'id': 'id-010', 'name': PERSONAS[10]['name'],
+                            'email': 'user10@example.com', 'created_at': PERSONAS[10]['created_at']}
+    assert len(store.list()) == len(PERSONAS)
+
+
+@pytest.mark.parametrize('filters, match', [
+    ({}, lambda p: True),
+    ({'email': 'USER7@example.com'}, lambda p: p['email'] == 'user7@example.com'),
+    ({'city': 'shelbyville'}, lambda p: p['address']['city'] == 'Shelbyville'),
+    ({'name': 'al'}, lambda p: p['name'].startswith('Al')),
+    ({'created_after': '2025-01-05', 'created_before': '2025-01-20'},
+     lambda p: '2025-01-05' <= p['created_at'] < '2025-01-20'),
+    ({'name': 'Carla', 'created_after': '2025-01-10'},
+     lambda p: p['name'].startswith('Carla') and p['created_at'] >= '2025-01-10'),
+])
+def test_search_pages_with_cursors(store, filters, match):
+    expected = expected_ids(match)
+    assert page_through(store, 7, **filters) == expected
+    assert page_through(store, 1000, **filters) == expected
+    assert store.count(**filters) == len(expected)
+
+
+def test_search_follows_writes(store):
+    assert page_through(store, 10, city='Ogdenville') == expected_ids(
+        lambda p: p['address']['city'] == 'Ogdenville')
+    store.delete('id-000')
+    store.save(dict(PERSONAS[1], address={'city': 'Ogdenville'}))
+    ids = page_through(store, 10, city='Ogdenville')
+    assert 'id-000' not in ids and 'id-001' in ids
+
+
+def test_backends_agree(tmp_path):
+    """The same writes give the same answers from every backend"""
+    results = {}
+    for backend in sorted(STORAGE_BACKENDS):
+        if backend in ('msgpack', 'mmap'):
+            pytest.importorskip('msgpack')
+        data_dir = tmp_path / backend
+        data_dir.mkdir()
+        store = create_store(backend, str(data_dir))
+        store.save_many(PERSONAS)
+        store.delete_many(['id-010', 'id-020'])
+        store.save(dict(PERSONAS[30], email='moved@example.com'))
+        results[backend] = (
+            store.load_all(),
+            store.count(), store.count(name='Bob'),
+            store.search(limit=5), store.search(name='Bob', limit=5),
+            page_through(store, 9, created_after='2025-01-03'),
+            store.search(email='moved@example.com'),
+        )
+    first = next(iter(results.values()))
+    assert all(result == first for result in results.values()), sorted(results)
@@ -0,0 +1,263 @@
+"""The HTTP API on both servers: listing, searching and generating personas"""
+
+import csv
+import io
+import json
+import sys
+from urllib.parse import urlencode
+
+import pytest
+
+import web_server
+from fake_data_generator import FakeDataGenerator, GeneratorRegistry, string_to_seed
+from persona_binary import read_msgpack
+from persona_export import PERSONA_COLUMNS, write_csv
+
+
+@pytest.fixture(params=['flask', 'asgi'])
+def client(request, tmp_path, monkeypatch):
+    registry = GeneratorRegistry(data_dir=str(tmp_path))
+    generator = registry.get('en_US')
+    generator.save_personas(generator.generate_personas(5, seed=1))
+    modules = [web_server]
+    if request.param == 'asgi':
+        pytest.importorskip('starlette')
+        pytest.importorskip('httpx')
+        import asgi_server
+        from starlette.testclient import TestClient
+        modules.append(asgi_server)
+        app_client = TestClient(asgi_server.app)
+    else:
+        app_client = web_server.app.test_client()
+    for module in modules:
+        monkeypatch.setattr(module, 'generators', registry)
+        monkeypatch.setattr(module, 'generator', generator)
+    return app_client
+
+
+def get(client, **params):
+    """GET /api/personas on either test client, returning `(status, body)`"""
+    response = client.get('/api/personas?' + urlencode(params))
+    body = response.get_json() if hasattr(response, 'get_json') else response.json()
+    return response.status_code, body
+
+
+def test_list_is_a_plain_list_by_default(client):
+    status, personas = get(client)
+    assert status == 200 and isinstance(personas, list) and len(personas) == 5
+    assert len(get(client, offset=1, limit=2)[1]) == 2
+
+
+def test_cursor_or_total_selects_pages(client):
+    _, page = get(client, cursor='', limit=3, total=1)
+    assert len(page['personas']) == 3 and page['total'] == 5
+    _, rest = get(client, cursor=page['next_cursor'])
+    assert len(rest['personas']) == 2 and rest['next_cursor'] is None
+
+    status, found = get(client, created_after='2000-01-01', created_before='2100-01-01T00:00')
+    assert status == 200 and len(found['personas']) == 5
+
+
+@pytest.mark.parametrize('query', [{'created_after': 'notadate'},
+                                   {'created_before': '2025-13-01'}])
+def test_bad_dates_are_rejected(client, query):
+    status, body = get(client, **query)
+    assert status == 400 and 'ISO date' in body['error']
+
+
+def post(client, path, body):
+    """POST JSON on either test client, returning `(status, body)`"""
+    response = client.post(path, json=body)
+    if response.headers['content-type'].startswith('application/json'):
+        body = response.get_json() if hasattr(response, 'get_json') else response.json()
+    return response.status_code, body
+
+
+@pytest.mark.parametrize('path', ['/api/generate', '/api/generate/batch'])
+@pytest.mark.parametrize('fields', [5, {'name': True}, ['name', 5], 'nosuchfield'])
+def test_bad_fields_are_rejected(client, path, fields):
+    status, body = post(client, path, {'fields': fields})
+    assert status == 400 and 'field' in body['error']
+
+
+def content(persona):
+    return {key: value for key, value in persona.items() if key not in ('id', 'created_at')}
+
+
+def test_integer_seeds_match_their_strings(client):
+    _, from_int = post(client, '/api/generate', {'seed': 42})
+    _, from_str = post(client, '/api/generate', {'seed': '42'})
+    assert content(from_int) == content(from_str)
+
+    batches = []
+    for seed in (42, '42'):
+        response = client.post('/api/generate/batch', json={'count': 3, 'seed': seed})
+        lines = response.text.splitlines()
+        batches.append([content(json.loads(line)) for line in lines])
+    assert len(batches[0]) == 3 and batches[0] == batches[1]
+
+
+@pytest.mark.parametrize('path', ['/api/generate', '/api/generate/batch'])
+@pytest.mark.parametrize('body', [{'seed': [1]}, {'seed': {'a': 1}}, {'seed': True},
+                                  {'locale': 5}, {'locale': ['en_US']}])
+def test_bad_seed_or_locale_types_are_rejected(client, path, body):
+    status, body = post(client, path, body)
+    assert status == 400 and body['error']
+
+
+@pytest.fixture
+def small_batches(client, monkeypatch):
+    """Lower the batch count limit, and on the ASGI server the shard size"""
+    monkeypatch.setattr(web_server, 'MAX_BATCH_COUNT', 10)
+    if 'asgi_server' in sys.modules:
+        monkeypatch.setattr('asgi_server.MAX_BATCH_COUNT', 10)
+        monkeypatch.setattr('asgi_server.BATCH_SHARD_SIZE', 3)
+    return client
+
+
+def batch(client, body, accept=None):
+    """POST /api/generate/batch, returning `(status, content type, body)`"""
+    headers = {'Accept': accept} if accept else {}
+    response = client.post('/api/generate/batch', json=body, headers=headers)
+    media_type = response.headers['content-type'].split(';')[0]
+    data = response.data if hasattr(response, 'data') else response.content
+    return response.status_code, media_type, data
+
+
+@pytest.mark.parametrize('count', [0, -1, 11, '5', 2.0, None])
+def test_batch_count_limit(small_batches, count):
+    status, _, body = batch(small_batches, {'count': count})
+    assert status == 400 and b'count must be between 1 and 10' in body
+
+
+def test_batch_count(small_batches):
+    status, _, body = batch(small_batches, {'count': 10})
+    assert status == 200 and len(body.splitlines()) == 10
+    _, _, body = batch(small_batches, {})
+    assert len(body.splitlines()) == 1
+
+
+@pytest.mark.parametrize('body, accept, expected', [
+    ({}, None, 'application/x-ndjson'),
+    ({}, 'application/json', 'application/x-ndjson'),
+    ({}, 'text/csv', 'text/csv'),
+    ({}, 'text/csv;q=0.5, application/x-ndjson', 'application/x-ndjson'),
+    ({}, 'text/html, text/csv;charset=utf-8', 'text/csv'),
+    ({'format': 'csv'}, None, 'text/csv'),
+    ({'format': 'ndjson'}, 'text/csv', 'application/x-ndjson'),
+])
+def test_batch_format_negotiation(client, body, accept, expected):
+    status, media_type, _ = batch(client, dict(body, count=2), accept)
+    assert status == 200 and media_type == expected
+
+
+def test_unknown_batch_format(client):
+    status, _, body = batch(client, {'format': 'xml'})
+    assert status == 400 and b'format must be one of' in body
+
+
+def test_batch_formats_agree_on_seeded_personas(small_batches, tmp_path):
+    """NDJSON, CSV and MessagePack carry the same seeded personas, across shards"""
+    body = {'count': 8, 'seed': 'batch-seed'}
+    _, _, ndjson = batch(small_batches, dict(body, format='ndjson'))
+    personas = [json.loads(line) for line in ndjson.splitlines()]
+    expected = FakeDataGenerator(data_dir=str(tmp_path), cache_size=0).generate_personas(
+        8, seed=string_to_seed('batch-seed'))
+    assert [content(p) for p in personas] == [content(p) for p in expected]
+
+    _, _, text = batch(small_batches, dict(body, format='csv'))
+    expected_csv = io.StringIO()
+    write_csv(personas, expected_csv)
+    same = [i for i, column in enumerate(PERSONA_COLUMNS) if column not in ('id', 'created_at')]
+
+    def comparable(text):
+        return [[row[i] for i in same] for row in csv.reader(io.StringIO(text))]
+    rows = comparable(text.decode())
+    assert len(rows) == 9 and rows == comparable(expected_csv.getvalue())
+
+    pytest.importorskip('msgpack')
+    _, _, packed = batch(small_batches, dict(body, format='msgpack'))
+    assert [content(p) for p in read_msgpack(io.BytesIO(packed))] == [
+        content(p) for p in personas]
+
+
+def send(client, method, path, body=None, content_type=None):
+    """Send a JSON or raw body with any method on either test client"""
+    if content_type is None:
+        kwargs = {'json': body}
+    else:
+        raw = 'data' if hasattr(client, 'application') else 'content'
+        kwargs = {raw: body, 'headers': {'Content-Type': content_type}}
+    if hasattr(client, 'application'):
+        response = client.open(path, method=method, **kwargs)
+    else:
+        response = client.request(method, path, **kwargs)
+    body = response.get_json() if hasattr(response, 'get_json') else response.json()
+    return response.status_code, body
+
+
+def test_bulk_save_and_delete(client):
+    personas = [{'id': f"bulk-{n}", 'created_at': '2025-02-01T00:00:00', 'name': f"Bulk {n}",
+                 'email': f"bulk{n}@example.com"} for n in range(4)]
+    status, body = send(client, 'POST', '/api/personas/bulk', personas[:2])
+    assert status == 200 and body == {'saved': 2, 'ids': ['bulk-0', 'bulk-1']}
+    status, body = send(client, 'POST', '/api/personas/bulk', {'personas': personas[2:]})
+    assert status == 200 and body['ids'] == ['bulk-2', 'bulk-3']
+    assert len(get(client)[1]) == 9
+    assert client.get('/api/personas/bulk-3').status_code == 200
+
+    status, body = send(client, 'DELETE', '/api/personas', {'ids': ['bulk-0', 'bulk-3', 'nope']})
+    assert status == 200 and body == {'deleted': 2}
+    ids = {summary['id'] for summary in get(client)[1]}
+    assert len(ids) == 7 and {'bulk-1', 'bulk-2'} <= ids and not {'bulk-0', 'bulk-3'} & ids
+
+
+def test_bulk_save_msgpack(client):
+    pytest.importorskip('msgpack')
+    from persona_binary import CONTENT_TYPE, write_msgpack
+    personas = [{'id': f"packed-{n}", 'created_at': '2025-02-01T00:00:00', 'name': f"Packed {n}"}
+                for n in range(3)]
+    out = io.BytesIO()
+    write_msgpack(personas, out)
+    status, body = send(client, 'POST', '/api/personas/bulk', out.getvalue(), CONTENT_TYPE)
+    assert status == 200 and body['saved'] == 3
+    assert client.get('/api/personas/packed-2').status_code == 200
+
+
+@pytest.mark.parametrize('body', [
+    {'id': 'one', 'created_at': 'x'}, [{'id': 1, 'created_at': 'x'}], [{'id': 'no-date'}],
+    ['not a persona'], {'personas': 'nope'}, None,
+])
+def test_bad_bulk_saves_are_rejected(client, body):
+    status, response = send(client, 'POST', '/api/personas/bulk', body)
+    assert status == 400 and response['error']
+    assert len(get(client)[1]) == 5
+
+
+@pytest.mark.parametrize('body', [None, ['a'], {'ids': 'a'}, {'ids': [1]}])
+def test_bad_bulk_deletes_are_rejected(client, body):
+    status, response = send(client, 'DELETE', '/api/personas', body)
+    assert status == 400 and 'ids' in response['error']
+    assert len(get(client)[1]) == 5
+
+
+def test_asgi_worker_processes(tmp_path, monkeypatch):
+    """Generation on the ASGI server's spawned process pool matches in-process output"""
+    pytest.importorskip('starlette')
+    pytest.importorskip('httpx')
+    import asgi_server
+    from starlette.testclient import TestClient
+    monkeypatch.setattr(asgi_server, 'WORKERS', 2)
+    monkeypatch.chdir(tmp_path)
+    generator = FakeDataGenerator(data_dir=str(tmp_path), cache_size=0)
+
+    with TestClient(asgi_server.app) as client:
+        assert asgi_server._executor is not None
+        assert asgi_server._executor._mp_context.get_start_method() == 'spawn'
+        persona = client.post('/api/generate', json={'seed': 'workers'}).json()
+        lines = client.post('/api/generate/batch', json={'count': 4, 'seed': 'workers'}).text
+    assert asgi_server._executor is None
+
+    assert content(persona) == content(generator.create_seeded_persona('workers'))
+    assert [content(json.loads(line)) for line in lines.splitlines()] == [
+        content(p) for p in generator.generate_personas(4, seed=string_to_seed('workers'))]
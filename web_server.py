@@ -4,12 +4,68 @@ Web server for browser integration and web interface
 """
 
 from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Response, g, stream_with_context
+import io
+import itertools
 import json
 import os
-from fake_data_generator import FakeDataGenerator
+from time import perf_counter
+import persona_metrics
+from fake_data_generator import GeneratorRegistry, UnknownLocaleError, string_to_seed
+from persona_binary import CONTENT_TYPE, CONTENT_TYPES, encode_persona, read_msgpack, wants_msgpack
+from persona_index import MAX_PAGE_SIZE, PAGE_SIZE, SEARCH_FILTERS
+from persona_export import iter_export
+from persona_pool import PersonaPool
 
 app = Flask(__name__)
-generator = FakeDataGenerator()
+# One generator per requested locale, all saving to the same store
+generators = GeneratorRegistry(storage=os.environ.get('FAKE_DATA_STORAGE', 'json'),
+                               max_locales=int(os.environ.get('FAKE_DATA_MAX_LOCALES', 0)) or None)
+generator = generators.get(os.environ.get('FAKE_DATA_LOCALE', 'en_US'))
+
+def request_generator(data=None):
+    """Return the generator for the request's `locale` query or body parameter"""
+    locale = request.args.get('locale') or (data or {}).get('locale')
+    if not locale or locale == generator.locale:
+        return generator
+    return generators.get(locale)
+
+def request_seed(data):
+    """Return the body's `seed` as a string, or None when it has none.
+
+    Integers are accepted and seed like their decimal string.
+    """
+    seed = data.get('seed')
+    if seed is None or seed == '':
+        return None
+    if isinstance(seed, bool) or not isinstance(seed, (str, int)):
+        raise ValueError("seed must be a string or an integer")
+    return str(seed)
+
+@app.errorhandler(UnknownLocaleError)
+def unknown_locale(e):
+    return jsonify({'error': str(e)}), 400
+
+@app.before_request
+def start_request_timer():
+    if persona_metrics.enabled:
+        g.request_start = perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        # Label by route template, not path, to keep the series count bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        persona_metrics.observe('http_request_seconds', perf_counter() - start, route=route,
+                                method=request.method, status=response.status_code)
+    return response
+
+def persona_response(persona):
+    """Respond with a persona as JSON, or as MessagePack if the Accept header prefers it"""
+    if wants_msgpack(request.headers.get('Accept')):
+        return Response(encode_persona(persona), content_type=CONTENT_TYPE)
+    return jsonify(persona)
 
 @app.route('/')
 def index():
@@ -20,66 +76,246 @@ def index():
 def api_generate():
     """API endpoint to generate new persona"""
     data = request.get_json() or {}
-    seed = data.get('seed')
     save = data.get('save', False)
+    fields = data.get('fields')
     
-    if seed:
-        persona = generator.create_seeded_persona(seed)
-    else:
-        persona = generator.generate_persona()
+    locale_generator = request_generator(data)
+    try:
+        seed = request_seed(data)
+        if seed:
+            persona = locale_generator.create_seeded_persona(seed, fields=fields)
+        else:
+            persona = locale_generator.generate_persona(fields=fields)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     if save:
         persona_id = generator.save_persona(persona)
         persona['saved_id'] = persona_id
     
-    return jsonify(persona)
+    return persona_response(persona)
+
+# Largest number of personas one batch request may ask for
+MAX_BATCH_COUNT = 1000000
+
+BATCH_FORMATS = {
+    'ndjson': ('jsonl', 'application/x-ndjson'),
+    'csv': ('csv', 'text/csv'),
+    'msgpack': ('msgpack', CONTENT_TYPE),
+}
+
+# Accept header media types naming each batch format
+BATCH_MEDIA_TYPES = {
+    'application/x-ndjson': 'ndjson',
+    'application/json': 'ndjson',
+    'text/csv': 'csv',
+    **{media_type: 'msgpack' for media_type in CONTENT_TYPES},
+}
+
+
+def batch_format(accept):
+    """Batch format an Accept header prefers, NDJSON unless it names another.
+
+    The listed format with the highest quality value wins, the first one on
+    a tie; media type parameters such as charset are ignored.
+    """
+    best, best_quality = 'ndjson', 0.0
+    for part in (accept or '').split(','):
+        media_type, _, params = part.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        output_format = BATCH_MEDIA_TYPES.get(media_type.strip().lower())
+        if output_format is not None and quality > best_quality:
+            best, best_quality = output_format, quality
+    return best
+
+@app.route('/api/generate/batch', methods=['POST'])
+def api_generate_batch():
+    """API endpoint to stream many personas as NDJSON, CSV or MessagePack"""
+    data = request.get_json(silent=True) or {}
+    count = data.get('count', 1)
+    fields = data.get('fields')
+    
+    output_format = data.get('format')
+    if output_format is None:
+        output_format = batch_format(request.headers.get('Accept'))
+    if output_format not in BATCH_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(BATCH_FORMATS)}"}), 400
+    if not isinstance(count, int) or not 1 <= count <= MAX_BATCH_COUNT:
+        return jsonify({'error': f'count must be between 1 and {MAX_BATCH_COUNT}'}), 400
+    
+    try:
+        seed = request_seed(data)
+        batch_generator = request_generator(data)
+        personas = batch_generator.generate_personas(
+            count, seed=string_to_seed(seed) if seed else None, fields=fields)
+        # Pull the first persona now so bad fields fail before streaming starts
+        first = next(personas)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    export_format, mimetype = BATCH_FORMATS[output_format]
+    chunks = iter_export(itertools.chain([first], personas), export_format)
+    return Response(stream_with_context(chunks), mimetype=mimetype)
+
+def page_query(args):
+    """Return `search_personas` arguments for a list request's query parameters.
+
+    Pages hold PAGE_SIZE summaries unless `limit` asks for up to MAX_PAGE_SIZE.
+    """
+    try:
+        limit = int(args.get('limit', PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    query = {key: args[key] for key in SEARCH_FILTERS if key in args}
+    query.update(limit=min(limit, MAX_PAGE_SIZE), cursor=args.get('cursor'),
+                 total=args.get('total', '').lower() in ('1', 'true', 'yes'))
+    return query
+
+def wants_page(args):
+    """Whether a list request asked for a `{"personas", "next_cursor"}` page.
+
+    Filters, `cursor` or `total` select paging; without them the endpoint
+    keeps returning a plain list.
+    """
+    return any(key in args for key in SEARCH_FILTERS + ('cursor', 'total'))
 
 @app.route('/api/personas', methods=['GET'])
 def api_list_personas():
-    """API endpoint to list all personas"""
-    personas = generator.list_personas()
-    return jsonify(personas)
+    """API endpoint to list all personas, or search them one page at a time"""
+    if not wants_page(request.args):
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', type=int)
+        return jsonify(request_generator().list_personas(offset=offset, limit=limit))
+    try:
+        return jsonify(request_generator().search_personas(**page_query(request.args)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+def bulk_personas(data):
+    """Return the personas of a bulk save body, a list or `{"personas": [...]}`"""
+    personas = data.get('personas') if isinstance(data, dict) else data
+    if not isinstance(personas, list):
+        raise ValueError('Expected a JSON list of personas or {"personas": [...]}')
+    for persona in personas:
+        if not (isinstance(persona, dict) and isinstance(persona.get('id'), str)
+                and 'created_at' in persona):
+            raise ValueError("Every persona needs a string 'id' and a 'created_at'")
+    return personas
+
+def bulk_ids(data):
+    """Return the IDs of a bulk delete body, `{"ids": [...]}`"""
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+        raise ValueError('Expected {"ids": [...]} with the persona IDs to delete')
+    return ids
+
+@app.route('/api/personas/bulk', methods=['POST'])
+def api_save_personas():
+    """API endpoint to save many personas in one write, sent as JSON or MessagePack"""
+    try:
+        if request.mimetype in CONTENT_TYPES:
+            data = list(read_msgpack(io.BytesIO(request.get_data())))
+        else:
+            data = request.get_json(silent=True)
+        personas = bulk_personas(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    ids = request_generator(data if isinstance(data, dict) else None).save_personas(personas)
+    return jsonify({'saved': len(ids), 'ids': ids})
+
+@app.route('/api/personas', methods=['DELETE'])
+def api_delete_personas():
+    """API endpoint to delete many personas in one write"""
+    data = request.get_json(silent=True)
+    try:
+        ids = bulk_ids(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'deleted': request_generator(data).delete_personas(ids)})
 
 @app.route('/api/personas/<persona_id>', methods=['GET'])
 def api_get_persona(persona_id):
     """API endpoint to get specific persona"""
-    persona = generator.load_persona(persona_id)
+    persona = request_generator().load_persona(persona_id)
     if persona:
-        return jsonify(persona)
+        return persona_response(persona)
     return jsonify({'error': 'Persona not found'}), 404
 
 @app.route('/api/personas/<persona_id>', methods=['DELETE'])
 def api_delete_persona(persona_id):
     """API endpoint to delete persona"""
-    success = generator.delete_persona(persona_id)
+    success = request_generator().delete_persona(persona_id)
     if success:
         return jsonify({'success': True})
     return jsonify({'error': 'Persona not found'}), 404
 
 @app.route('/api/personas/<persona_id>/regenerate', methods=['POST'])
 def api_regenerate_persona(persona_id):
-    """API endpoint to regenerate persona"""
-    persona = generator.regenerate_persona(persona_id)
+    """API endpoint to regenerate persona, or only the given fields"""
+    data = request.get_json(silent=True) or {}
+    try:
+        persona = request_generator(data).regenerate_persona(persona_id, fields=data.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     if persona:
-        return jsonify(persona)
+        return persona_response(persona)
     return jsonify({'error': 'Persona not found'}), 404
 
+# Persona fields used by the form fill response
+FORM_FIELDS = [
+    'first_name', 'last_name', 'name', 'email', 'phone',
+    'address.street', 'address.city', 'address.state', 'address.zipcode', 'address.country',
+    'company', 'job_title', 'website',
+    'credit_card.number', 'credit_card.expire', 'credit_card.security_code',
+]
+
+def create_persona_pool():
+    """Build the fill-form warm pool from FAKE_DATA_POOL_* settings (size 0 disables it)"""
+    size = int(os.environ.get('FAKE_DATA_POOL_SIZE', 0))
+    if size <= 0:
+        return None
+    low = os.environ.get('FAKE_DATA_POOL_LOW')
+    rate = os.environ.get('FAKE_DATA_POOL_RATE')
+    return PersonaPool(generator, size=size,
+                       low_watermark=int(low) if low else None,
+                       refill_rate=float(rate) if rate else None,
+                       fields=FORM_FIELDS)
+
+persona_pool = create_persona_pool()
+
+def form_fill_persona(locale_generator=generator):
+    """Return an unsaved persona for form filling, from the warm pool when enabled"""
+    if persona_pool is not None and locale_generator is persona_pool.generator:
+        return persona_pool.get()
+    return locale_generator.generate_persona(fields=FORM_FIELDS)
+
 @app.route('/api/fill-form', methods=['POST'])
 def api_fill_form():
     """API endpoint for browser extension to get form fill data"""
     data = request.get_json() or {}
     persona_id = data.get('persona_id')
     
+    locale_generator = request_generator(data)
     if persona_id:
-        persona = generator.load_persona(persona_id)
+        persona = locale_generator.load_persona(persona_id, complete=True)
     else:
-        persona = generator.generate_persona()
+        persona = form_fill_persona(locale_generator)
     
     if not persona:
         return jsonify({'error': 'Persona not found'}), 404
     
-    # Return data in a format suitable for form filling
-    form_data = {
+    return jsonify(form_fill_data(persona))
+
+def form_fill_data(persona):
+    """Return persona data in a format suitable for form filling"""
+    return {
         'firstName': persona['first_name'],
         'lastName': persona['last_name'],
         'name': persona['name'],
@@ -97,8 +333,24 @@ def api_fill_form():
         'ccExpiry': persona['credit_card']['expire'],
         'ccCvv': persona['credit_card']['security_code'],
     }
-    
-    return jsonify(form_data)
+
+@app.route('/api/pool', methods=['GET'])
+def api_pool_stats():
+    """API endpoint for the fill-form warm pool settings and hit/miss counts"""
+    if persona_pool is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **persona_pool.stats()})
+
+@app.route('/api/locales', methods=['GET'])
+def api_locales():
+    """API endpoint listing the locales with a generator currently loaded"""
+    return jsonify({'default': generator.locale, 'loaded': generators.locales(),
+                    'max_locales': generators.max_locales})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics; empty unless FAKE_DATA_METRICS=1"""
+    return Response(persona_metrics.render_prometheus(), content_type=persona_metrics.CONTENT_TYPE)
 
 @app.route('/extension')
 def extension_popup():